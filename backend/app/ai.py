@@ -1,31 +1,228 @@
 import os
+import threading
+import time
+from types import SimpleNamespace
 import google.generativeai as genai
 from dotenv import load_dotenv
 
+from .pool import Histogram
+
 # Load environment variables from your .env file
 load_dotenv()
 
-# This variable will hold our configured model, initialized to None
-model = None
-
-try:
-    # Get the API Key from the environment
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("CRITICAL: GOOGLE_API_KEY not found in environment variables.")
-    
-    # Configure the library with your API key
-    genai.configure(api_key=api_key)
-    
-    # --- FINAL, STABLE MODEL NAME ---
-    # We are using a stable model name that we know your key has access to.
-    model = genai.GenerativeModel('gemini-2.5-flash')
-    
-    print("Google AI Model configured successfully.")
-except Exception as e:
-    # If configuration fails, print a clear error and set the model to None
-    print(f" Error configuring Google AI Model: {e}")
-    model = None
+# Messages returned instead of a summary when generation fails
+MODEL_UNAVAILABLE = "AI model is not available due to a configuration error."
+GENERATION_FAILED = "Could not generate a summary at this time."
+# Returned without calling the model while the circuit breaker is open; unlike
+# GENERATION_FAILED it says nothing about the book itself
+BREAKER_OPEN = "Summaries are paused while the AI service recovers. Try again shortly."
+ERROR_MESSAGES = (MODEL_UNAVAILABLE, GENERATION_FAILED, BREAKER_OPEN)
+
+# Give up on a Gemini call after this many seconds
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", 20))
+
+# Upper bounds (in seconds) of the call duration histogram buckets
+AI_LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+
+
+class CallStats:
+    """
+    Duration and outcome of the Gemini calls that were actually made (calls refused
+    by the circuit breaker are counted by the breaker).
+    """
+
+    def __init__(self):
+        self.latency = Histogram(AI_LATENCY_BUCKETS)
+        self._lock = threading.Lock()
+        self.failures = 0
+
+    def record(self, started: float, failed: bool = False):
+        self.latency.observe(time.perf_counter() - started)
+        if failed:
+            with self._lock:
+                self.failures += 1
+
+    def stats(self) -> dict:
+        return {"calls": self.latency.count, "failures": self.failures, "latency": self.latency.stats()}
+
+
+call_stats = CallStats()
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing service for a while instead of paying for every failure.
+
+    After `failure_threshold` failures in a row the breaker opens and calls are
+    refused for `reset_timeout` seconds. Then it lets a single probe call through
+    (half-open): success closes the breaker again, failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def is_open(self) -> bool:
+        """
+        True while calls would be refused. Unlike allow_request(), does not claim the probe.
+        """
+        state = self.state
+        return state == self.OPEN or (state == self.HALF_OPEN and self._probing)
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._probing:
+                self._state = self.HALF_OPEN
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def cancel_request(self):
+        """
+        For a call that was allowed but abandoned before its outcome was known.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "rejected": self.rejected,
+            "opened": self.opened,
+        }
+
+
+# Guards every Gemini call made by generate_book_summary
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("AI_BREAKER_FAILURES", 5)),
+    reset_timeout=float(os.getenv("AI_BREAKER_RESET_SECONDS", 30)),
+)
+
+
+class FakeModel:
+    """
+    A stand-in for the Gemini model for local development and tests.
+    Enable it with AI_MODEL=fake; AI_FAKE_DELAY adds a delay in seconds to each call
+    and AI_FAKE_FAIL=1 makes every call raise, to exercise the error handling.
+    """
+
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        self.calls += 1
+        text = f"Fake summary for local testing. {prompt}"
+        if stream:
+            return self._stream(text)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("Fake model failure")
+        return SimpleNamespace(text=text)
+
+    def _stream(self, text: str):
+        # Hand out the text a few words at a time, spreading the delay over the chunks
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + 5]) + " " for i in range(0, len(words), 5)]
+        for chunk in chunks:
+            time.sleep(self.delay / len(chunks))
+            if self.fail:
+                raise RuntimeError("Fake model failure")
+            yield SimpleNamespace(text=chunk)
+
+
+def _configure_gemini():
+    """
+    Configures the Gemini model, or returns None if that fails.
+    """
+    try:
+        # Get the API Key from the environment
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("CRITICAL: GOOGLE_API_KEY not found in environment variables.")
+
+        # Configure the library with your API key
+        genai.configure(api_key=api_key)
+
+        # --- FINAL, STABLE MODEL NAME ---
+        # We are using a stable model name that we know your key has access to.
+        gemini_model = genai.GenerativeModel('gemini-2.5-flash')
+
+        print("Google AI Model configured successfully.")
+        return gemini_model
+    except Exception as e:
+        # If configuration fails, print a clear error and fall back to no model
+        print(f" Error configuring Google AI Model: {e}")
+        return None
+
+
+# This variable holds our configured model, or None if it could not be configured
+if os.getenv("AI_MODEL") == "fake":
+    model = FakeModel(delay=float(os.getenv("AI_FAKE_DELAY", 0)), fail=os.getenv("AI_FAKE_FAIL") == "1")
+    print("Using the fake AI model.")
+else:
+    model = _configure_gemini()
+
+
+def is_available() -> bool:
+    """
+    False when a summary call would fail fast: no model, or the circuit breaker is open.
+    """
+    return model is not None and not breaker.is_open()
+
+
+def _summary_prompt(title: str, author: str) -> str:
+    return (
+        f"Provide a concise, engaging, one-paragraph summary for the book "
+        f"'{title}' by '{author}'. Focus on the main plot or key ideas. "
+        f"Do not include any introductory phrases like 'This book is about...'."
+    )
+
+
+def clean_summary(text: str) -> str:
+    """
+    Cleans up model output for storage.
+    """
+    return text.strip().replace('\n', ' ')
 
 
 def generate_book_summary(title: str, author: str) -> str:
@@ -34,26 +231,70 @@ def generate_book_summary(title: str, author: str) -> str:
     """
     # If the model failed to initialize during startup, return an error immediately.
     if not model:
-        return "AI model is not available due to a configuration error."
+        return MODEL_UNAVAILABLE
+
+    # If the API has been failing, don't wait for yet another failure
+    if not breaker.allow_request():
+        return BREAKER_OPEN
 
+    started = time.perf_counter()
     try:
         # Create a carefully crafted prompt for the AI model
-        prompt = (
-            f"Provide a concise, engaging, one-paragraph summary for the book "
-            f"'{title}' by '{author}'. Focus on the main plot or key ideas. "
-            f"Do not include any introductory phrases like 'This book is about...'."
-        )
+        prompt = _summary_prompt(title, author)
         
         # Call the API to generate the content
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, request_options={"timeout": AI_TIMEOUT_SECONDS})
         
         # Clean up the response text for storage
-        summary = response.text.strip().replace('\n', ' ')
+        summary = clean_summary(response.text)
+        breaker.record_success()
+        call_stats.record(started)
         return summary
         
     except Exception as e:
+        breaker.record_failure()
+        call_stats.record(started, failed=True)
         # If the API call itself fails, log the detailed error and return a user-friendly message.
         print(f"--- DETAILED AI ERROR ---")
         print(f"An error of type {type(e).__name__} occurred: {e}")
         print(f"---------------------------")
-        return "Could not generate a summary at this time."
\ No newline at end of file
+        return GENERATION_FAILED
+
+
+class SummaryUnavailable(Exception):
+    """
+    Raised by stream_book_summary when no summary can be generated right now.
+    """
+
+
+def stream_book_summary(title: str, author: str):
+    """
+    Yields a book summary in pieces as the model writes them, using the library's
+    streaming mode. Raises SummaryUnavailable if the model is missing, the circuit
+    breaker is open, or the call fails part-way.
+    """
+    if not model:
+        raise SummaryUnavailable(MODEL_UNAVAILABLE)
+    if not breaker.allow_request():
+        raise SummaryUnavailable(BREAKER_OPEN)
+
+    started = time.perf_counter()
+    try:
+        response = model.generate_content(
+            _summary_prompt(title, author), stream=True, request_options={"timeout": AI_TIMEOUT_SECONDS}
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+    except GeneratorExit:
+        # The caller stopped reading (e.g. the client disconnected); we never learned the outcome
+        breaker.cancel_request()
+        raise
+    except Exception as e:
+        breaker.record_failure()
+        call_stats.record(started, failed=True)
+        print(f"--- DETAILED AI ERROR (streaming) ---")
+        print(f"An error of type {type(e).__name__} occurred: {e}")
+        raise SummaryUnavailable(GENERATION_FAILED) from e
+    breaker.record_success()
+    call_stats.record(started)
@@ -1,22 +1,42 @@
 import os
+import asyncio
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
-from . import schemas, database, crud
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import schemas, database, crud_async
+from .cache import MISSING, TTLCache
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # This tells FastAPI which URL to check for the token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+# Same, but lets requests without a token through (for endpoints where login is optional)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
 # --- PASSWORD HASHING ---
 
+# Argon2 cost parameters. Changing them is safe: existing hashes still verify, and are
+# transparently re-hashed with the new parameters the next time their user logs in.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))  # in KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+
 # We use passlib to handle password hashing. 'argon2' is the chosen secure algorithm.
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
 
 # This function checks if a plain-text password matches a stored hash.
 def verify_password(plain_password, hashed_password):
@@ -26,6 +46,55 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+
+# --- HASHING POOL ---
+
+# Argon2 is deliberately slow and memory-hungry, so it runs on its own bounded pool
+# instead of the request threads. argon2-cffi releases the GIL while hashing, so
+# threads hash in parallel. When more than HASH_QUEUE_LIMIT hashes are queued or
+# running, new ones are refused (503) rather than piling up behind a login storm.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", HASH_WORKERS * 4))
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="argon2")
+_hash_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+
+def _overloaded_exception():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The server is busy. Please try again in a moment.",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def _run_hashing(fn, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise _overloaded_exception()
+    try:
+        future = _hash_executor.submit(fn, *args)
+    except BaseException:
+        _hash_slots.release()
+        raise
+    future.add_done_callback(lambda _: _hash_slots.release())
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password_async(password: str) -> str:
+    """
+    Hashes a password on the hashing pool. Raises a 503 HTTPException if the pool is full.
+    """
+    return await _run_hashing(pwd_context.hash, password)
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Checks a password on the hashing pool. Returns (matches, new_hash); new_hash is set
+    when the stored hash uses outdated Argon2 parameters and should be replaced.
+    Raises a 503 HTTPException if the pool is full.
+    """
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+
 # --- JWT TOKEN CREATION ---
 
 # We load our secrets from the .env file
@@ -43,39 +112,124 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-# This  decodes the JWT to get the user's email,
-# then fetches the user from the database.
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+# --- VERIFIED TOKEN CACHE ---
+
+# Verified tokens are remembered for a short while, so authenticated requests can skip
+# decoding the JWT and loading the user. An entry never outlives its token's `exp`.
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", 60))
+token_cache = TTLCache("auth_tokens", ttl=AUTH_CACHE_TTL, maxsize=int(os.getenv("AUTH_CACHE_SIZE", 10000)))
+
+# email -> monotonic time of the user's last invalidate_user(); cached entries loaded
+# before it are ignored. An entry only has to outlive the token entries it overrides,
+# which never live longer than AUTH_CACHE_TTL.
+# This only reaches the current process: with several workers, the others keep serving
+# their cached snapshot of the user for up to AUTH_CACHE_TTL seconds.
+_user_invalidations = TTLCache(
+    "auth_invalidations", ttl=AUTH_CACHE_TTL, maxsize=int(os.getenv("AUTH_CACHE_SIZE", 10000))
+)
+
+
+def _token_key(token: str) -> str:
+    # Store a digest rather than the token itself
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def invalidate_user(email: str):
+    """
+    Drops every cached token of a user, e.g. after their goals change.
+    """
+    if len(_user_invalidations) >= _user_invalidations.maxsize:
+        # Setting would evict another user's invalidation before its tokens expire
+        token_cache.invalidate()
+    _user_invalidations.set(email, time.monotonic())
+
+
+def _is_current(email: str, loaded_at: float) -> bool:
+    invalidated_at = _user_invalidations.get(email)
+    return invalidated_at is MISSING or loaded_at > invalidated_at
+
+
+def token_subject(token: str) -> str | None:
+    """
+    Returns the email a token was issued to without touching the database, or None
+    if the token is invalid. Uses the token cache when it can.
+    """
+    cached = token_cache.get(_token_key(token))
+    if cached is not MISSING:
+        return cached[1].email
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+
+async def _resolve_user(token: str, db: AsyncSession) -> schemas.UserWithGoals | None:
+    """
+    Turns a token into a snapshot of the user and their goals, or None if the token
+    is invalid or the user no longer exists. Uses the token cache when it can.
+    """
+    key = _token_key(token)
+    cached = token_cache.get(key)
+    if cached is not MISSING:
+        loaded_at, user = cached
+        if _is_current(user.email, loaded_at):
+            return user
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    email = payload.get("sub")
+    if email is None:
+        return None
+
+    # Note the time before loading, so a change made meanwhile isn't cached as current
+    loaded_at = time.monotonic()
+    user = await crud_async.get_user_with_goals(db, email=email)
+    if user is None:
+        return None
+
+    ttl = min(AUTH_CACHE_TTL, payload.get("exp", 0) - time.time())
+    if ttl > 0:
+        token_cache.set(key, (loaded_at, user), ttl=ttl)
+    return user
+
+
+# This decodes the JWT to get the user's email,
+# then fetches the user (and their goals) from the database or the token cache.
+# Returns a snapshot (schemas.UserWithGoals), not a database object.
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = crud.get_user_by_email(db, email=email)
+    user = await _resolve_user(token, db)
     if user is None:
         raise credentials_exception
     return user
 
 
-def get_optional_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+async def get_optional_current_user(token: str | None = Depends(optional_oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
     """
     Gets the current user if a valid token is provided.
     Returns None instead of raising an error if the token is missing or invalid.
     """
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        user = crud.get_user_by_email(db, email=email)
-        return user
-    except (JWTError, AttributeError):
-        return None
\ No newline at end of file
+    if not token:
+        return None
+    return await _resolve_user(token, db)
+
+
+# --- ADMIN ACCESS ---
+
+# Comma-separated emails of the users allowed to call the /admin and /diagnostics endpoints
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+
+async def get_current_admin(current_user: schemas.UserWithGoals = Depends(get_current_user)):
+    """
+    Same as get_current_user, but only lets users listed in ADMIN_EMAILS through.
+    """
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
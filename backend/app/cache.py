@@ -0,0 +1,88 @@
+# app/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get() when a key is missing or expired, so that None can be cached
+MISSING = object()
+
+# Every cache registers itself here by name, so its counters can be reported
+caches = {}
+
+
+class TTLCache:
+    """
+    A small thread-safe in-memory cache with per-entry expiry and LRU eviction.
+    Keeps hit/miss counters so we can see how well it is working.
+    """
+
+    def __init__(self, name: str, ttl: float, maxsize: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0  # bumped by every invalidate()
+        caches[name] = self
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: float | None = None, generation: int | None = None):
+        """
+        Stores a value. `ttl` overrides the cache's default time-to-live for this entry.
+        `generation` is self.generation as read before computing the value: if the
+        cache was invalidated since, the value may be stale and is not stored.
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key=MISSING):
+        """
+        Drops one entry, or every entry when no key is given.
+        """
+        with self._lock:
+            if key is MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+            self.invalidations += 1
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+        }
+
+
+def stats() -> dict:
+    """
+    Returns the counters of every registered cache, keyed by cache name.
+    """
+    return {name: cache.stats() for name, cache in caches.items()}
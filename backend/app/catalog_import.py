@@ -0,0 +1,324 @@
+# app/catalog_import.py
+import os
+import time
+from collections import defaultdict, deque
+
+import pandas as pd
+from sqlalchemy import bindparam, delete, func, insert, select, tuple_, update
+
+from . import models
+from .database import SessionLocal
+
+# CSV rows read, compared and written per transaction
+CATALOG_CHUNK_SIZE = int(os.getenv("CATALOG_CHUNK_SIZE", 10000))
+
+# Stored for books without one; the same placeholder summaries.NO_DESCRIPTION looks for
+# (not imported from there, so seeding doesn't set up the AI client)
+NO_DESCRIPTION = "No description available."
+
+# Columns that make up a row's hash: a change in any of them updates the book
+HASH_COLUMNS = ["title", "author", "description", "cover_image_url", "average_rating", "ratings_count", "goal"]
+
+books = models.Book.__table__
+state = models.CatalogImportState.__table__
+book_goals = models.book_goals_table
+
+
+def _column(chunk: pd.DataFrame, name: str, default):
+    if name in chunk.columns:
+        return chunk[name]
+    return pd.Series(default, index=chunk.index)
+
+
+def _update_books_statement():
+    # The CSV's rating stats replace the ones imported last time, and whatever the
+    # app added on top (ratings made by users) is kept:
+    #   count = current - previously imported + imported now, and the same for the sum
+    count = func.coalesce(books.c.ratings_count, 0)
+    average = func.coalesce(books.c.average_rating, 0)
+    new_count = count - bindparam("b_prev_count") + bindparam("b_count")
+    new_sum = (
+        average * count
+        - bindparam("b_prev_average") * bindparam("b_prev_count")
+        + bindparam("b_average") * bindparam("b_count")
+    )
+    return (
+        update(books)
+        .where(books.c.id == bindparam("b_id"))
+        .values(
+            title=bindparam("b_title"),
+            author=bindparam("b_author"),
+            # An empty description in the CSV keeps the stored one (e.g. an AI summary)
+            description=func.coalesce(func.nullif(bindparam("b_description"), ""), books.c.description),
+            cover_image_url=bindparam("b_cover_image_url"),
+            ratings_count=new_count,
+            average_rating=func.coalesce(new_sum / func.nullif(new_count, 0), bindparam("b_average")),
+        )
+    )
+
+
+class CatalogImporter:
+    """
+    Imports the catalog CSV without wiping the books table.
+
+    Each CSV row is identified by its book_id column and hashed. The hashes from the
+    last run (in catalog_import_state) sort the rows into new books, which are
+    bulk-inserted, changed books, which are updated in place with one batched
+    UPDATE per chunk, and unchanged books, which aren't written at all. Book ids
+    never change, so ratings and users' goals stay attached.
+
+    On the first run against a database filled by a full seed, rows are matched to
+    the existing books by title and author instead of being inserted again.
+    """
+
+    def __init__(self, goal_names=(), chunk_size: int = CATALOG_CHUNK_SIZE, session_factory=SessionLocal):
+        self.goal_names = list(goal_names)
+        self.chunk_size = chunk_size
+        self.session_factory = session_factory
+        self.goal_ids = None
+        self._unclaimed = None  # (title, author) -> ids of existing books not yet matched to a row
+        self.rows = 0
+        self.new = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.adopted = 0
+        self.superseded = 0
+        self.invalid_rows = 0
+        self.missing = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def _start(self, db):
+        existing = {name: goal_id for goal_id, name in db.execute(select(models.Goal.id, models.Goal.name))}
+        missing = [name for name in self.goal_names if name not in existing]
+        if missing:
+            db.execute(insert(models.Goal.__table__), [{"name": name} for name in missing])
+            existing = {name: goal_id for goal_id, name in db.execute(select(models.Goal.id, models.Goal.name))}
+        self.goal_ids = existing
+
+        self._unclaimed = defaultdict(deque)
+        untracked = (
+            select(books.c.id, books.c.title, books.c.author)
+            .where(books.c.id.not_in(select(state.c.book_id)))
+            .order_by(books.c.id)
+        )
+        for book_id, title, author in db.execute(untracked):
+            self._unclaimed[(title, author)].append(book_id)
+
+    def _claim(self, title: str, author: str):
+        ids = self._unclaimed.get((title, author))
+        return ids.popleft() if ids else None
+
+    def prepare(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """
+        Normalizes a chunk of the CSV into the columns stored on a book, plus the
+        source id and the row hash. Rows without a usable book_id or title are dropped.
+        """
+        if "book_id" not in chunk.columns:
+            raise ValueError("The catalog CSV needs a book_id column for incremental imports")
+        source_ids = pd.to_numeric(chunk["book_id"], errors="coerce")
+        valid = source_ids.notna() & chunk["title"].notna()
+        self.invalid_rows += int((~valid).sum())
+        chunk = chunk[valid]
+
+        rows = pd.DataFrame({
+            "source_id": source_ids[valid].astype("int64"),
+            "title": chunk["title"].astype(str),
+            "author": _column(chunk, "authors", None).fillna("Unknown Author").astype(str),
+            "description": _column(chunk, "description", None).fillna("").astype(str),
+            "cover_image_url": _column(chunk, "image_url", None).fillna("").astype(str),
+            "average_rating": pd.to_numeric(_column(chunk, "average_rating", 0), errors="coerce").fillna(0).astype("float64"),
+            "ratings_count": pd.to_numeric(_column(chunk, "ratings_count", 0), errors="coerce").fillna(0).astype("int64"),
+            "goal": _column(chunk, "goal", None).fillna("").astype(str),
+        })
+        # The last row for a book id wins
+        deduplicated = rows.drop_duplicates("source_id", keep="last")
+        self.superseded += len(rows) - len(deduplicated)
+        rows = deduplicated
+        rows["row_hash"] = pd.util.hash_pandas_object(rows[HASH_COLUMNS], index=False).map("{:016x}".format)
+        return rows
+
+    def feed_chunk(self, chunk: pd.DataFrame):
+        """
+        Imports one chunk of the CSV (as read by pd.read_csv(..., chunksize=...))
+        in its own transaction.
+        """
+        db = self.session_factory()
+        try:
+            if self.goal_ids is None:
+                self._start(db)
+            rows = self.prepare(chunk)
+            new, changed, adopted, unchanged = self._write(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        # Only count what was committed
+        self.rows += len(rows)
+        self.new += new
+        self.changed += changed
+        self.adopted += adopted
+        self.unchanged += unchanged
+
+    def _write(self, db, rows: pd.DataFrame):
+        known = {
+            entry.source_id: entry
+            for entry in db.execute(select(state).where(state.c.source_id.in_(rows["source_id"].tolist())))
+        }
+        new, changed, adopted = [], [], []
+        unchanged = 0
+        for row in rows.itertuples(index=False):
+            entry = known.get(row.source_id)
+            if entry is None:
+                book_id = self._claim(row.title, row.author)
+                if book_id is None:
+                    new.append(row)
+                else:
+                    adopted.append((book_id, row))
+            elif entry.row_hash != row.row_hash:
+                changed.append((entry, row))
+            else:
+                unchanged += 1
+
+        links = {}  # book_id -> goal_id the CSV wants, for every book written
+        if new:
+            result = db.execute(insert(books).returning(books.c.id, sort_by_parameter_order=True), [
+                {
+                    "title": row.title,
+                    "author": row.author,
+                    "description": row.description or NO_DESCRIPTION,
+                    "cover_image_url": row.cover_image_url,
+                    "average_rating": row.average_rating,
+                    "ratings_count": row.ratings_count,
+                }
+                for row in new
+            ])
+            new_ids = result.scalars().all()
+            db.execute(insert(state), [
+                {
+                    "source_id": row.source_id,
+                    "book_id": book_id,
+                    "row_hash": row.row_hash,
+                    "source_average_rating": row.average_rating,
+                    "source_ratings_count": row.ratings_count,
+                }
+                for book_id, row in zip(new_ids, new)
+            ])
+            links.update((book_id, self.goal_ids.get(row.goal)) for book_id, row in zip(new_ids, new))
+
+        updates = [(entry.book_id, row, entry.source_average_rating, entry.source_ratings_count) for entry, row in changed]
+        # Adopted books keep their rating stats: they already contain the CSV's
+        updates += [(book_id, row, row.average_rating, row.ratings_count) for book_id, row in adopted]
+        if updates:
+            db.execute(_update_books_statement(), [
+                {
+                    "b_id": book_id,
+                    "b_title": row.title,
+                    "b_author": row.author,
+                    "b_description": row.description,
+                    "b_cover_image_url": row.cover_image_url,
+                    "b_average": row.average_rating,
+                    "b_count": row.ratings_count,
+                    "b_prev_average": prev_average or 0,
+                    "b_prev_count": prev_count or 0,
+                }
+                for book_id, row, prev_average, prev_count in sorted(updates, key=lambda update: update[0])
+            ])
+            links.update((book_id, self.goal_ids.get(row.goal)) for book_id, row, _, _ in updates)
+        if changed:
+            db.execute(
+                update(state)
+                .where(state.c.source_id == bindparam("s_source_id"))
+                .values(
+                    row_hash=bindparam("s_row_hash"),
+                    source_average_rating=bindparam("s_average"),
+                    source_ratings_count=bindparam("s_count"),
+                ),
+                [
+                    {
+                        "s_source_id": row.source_id,
+                        "s_row_hash": row.row_hash,
+                        "s_average": row.average_rating,
+                        "s_count": row.ratings_count,
+                    }
+                    for _, row in changed
+                ],
+            )
+        if adopted:
+            db.execute(insert(state), [
+                {
+                    "source_id": row.source_id,
+                    "book_id": book_id,
+                    "row_hash": row.row_hash,
+                    "source_average_rating": row.average_rating,
+                    "source_ratings_count": row.ratings_count,
+                }
+                for book_id, row in adopted
+            ])
+        self._sync_goals(db, links, skip_existing=bool(changed or adopted))
+        return len(new), len(changed), len(adopted), unchanged
+
+    def _sync_goals(self, db, links: dict, skip_existing: bool):
+        # Each CSV row names one goal: link the book to it and drop any other link,
+        # touching only the book_goals rows that differ
+        wanted = {(book_id, goal_id) for book_id, goal_id in links.items() if goal_id is not None}
+        current = set()
+        if skip_existing:
+            current = set(db.execute(
+                select(book_goals.c.book_id, book_goals.c.goal_id).where(book_goals.c.book_id.in_(list(links)))
+            ).tuples())
+        stale = current - wanted
+        if stale:
+            db.execute(delete(book_goals).where(tuple_(book_goals.c.book_id, book_goals.c.goal_id).in_(list(stale))))
+        missing = wanted - current
+        if missing:
+            db.execute(insert(book_goals), [{"book_id": book_id, "goal_id": goal_id} for book_id, goal_id in missing])
+
+    def finish(self) -> dict:
+        """
+        Counts the books that are no longer in the CSV (they are kept, since they may
+        have ratings) and returns the report.
+        """
+        db = self.session_factory()
+        try:
+            tracked = db.scalar(select(func.count()).select_from(state))
+        finally:
+            db.close()
+        self.missing = tracked - self.new - self.changed - self.unchanged - self.adopted
+        self.finished = time.perf_counter()
+        return self.report()
+
+    def run(self, csv_path: str, progress_every: int = 0) -> dict:
+        """
+        Imports a whole CSV file, printing progress every `progress_every` rows.
+        """
+        next_progress = progress_every
+        for chunk in pd.read_csv(csv_path, chunksize=self.chunk_size):
+            self.feed_chunk(chunk)
+            if progress_every and self.rows >= next_progress:
+                elapsed = time.perf_counter() - self.started
+                print(f"{self.rows} rows compared ({self.rows / elapsed:.0f} rows/s), "
+                      f"{self.new} new, {self.changed} changed")
+                next_progress += progress_every
+        return self.finish()
+
+    def report(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return {
+            "rows": self.rows,
+            "new": self.new,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            # Existing books matched to a CSV row by title and author
+            "adopted": self.adopted,
+            # Rows replaced by a later row with the same book_id in the same chunk
+            "superseded": self.superseded,
+            # Rows without a book_id or title
+            "invalid_rows": self.invalid_rows,
+            # Books imported before that are no longer in the CSV (kept)
+            "missing": self.missing,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else 0,
+        }
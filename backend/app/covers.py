@@ -0,0 +1,316 @@
+# app/covers.py
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal, NamedTuple
+
+import requests
+from dotenv import load_dotenv
+from PIL import Image
+
+from .singleflight import SingleFlight
+
+load_dotenv()
+
+# --- Cover Cache Settings ---
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", "data/covers")
+# Images and variants are evicted, least recently used first, above this size
+COVER_CACHE_MAX_MB = int(os.getenv("COVER_CACHE_MAX_MB", 512))
+COVER_FETCH_TIMEOUT = float(os.getenv("COVER_FETCH_TIMEOUT", 10))
+# Covers fetched and resized at the same time
+COVER_WORKERS = int(os.getenv("COVER_WORKERS", 8))
+# How long browsers and CDNs may reuse a cover before revalidating it with its ETag
+COVER_MAX_AGE = int(os.getenv("COVER_MAX_AGE", 7 * 24 * 3600))
+# Larger downloads are refused
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+
+# Bounding box (width, height) of each variant, or None for the image as fetched.
+# thumb fits the book cards and detail the book modal, both at 2x for sharp screens.
+CoverSize = Literal["thumb", "detail", "original"]
+COVER_SIZES = {"thumb": (320, 480), "detail": (480, 720), "original": None}
+# Bump when the resizing changes, so stored variants and their ETags are renewed
+VARIANT_VERSION = 1
+JPEG_QUALITY = 85
+
+# What fetch_covers.py stores for books without a cover; the frontend shows its own
+PLACEHOLDER_URL = "https://placehold.co/200x300?text=Not+Found"
+
+
+class CoverUnavailable(Exception):
+    """
+    Raised when a cover can't be fetched or isn't an image.
+    """
+
+
+class Cover(NamedTuple):
+    content: bytes
+    media_type: str
+    etag: str
+
+
+def has_cover(url: str | None) -> bool:
+    return bool(url) and url != PLACEHOLDER_URL
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class CoverStore:
+    """
+    Disk cache of cover images, fetched once per URL and resized on first request.
+
+    Files are content-addressed, so covers shared by several books or URLs are
+    stored once:
+        urls/<sha256 of the URL>                    content hash of the image it served
+        objects/<ab>/<content hash>                 the image as fetched
+        variants/<ab>/<content hash>-<size>-v1.jpg  resized copies
+
+    Objects and variants count towards max_bytes and are evicted least recently
+    used first. The usage index lives in memory (rebuilt from file times at
+    startup), so with several worker processes each keeps its own view and the
+    directory can briefly exceed the limit; a file evicted by another process is
+    simply fetched or resized again.
+    """
+
+    def __init__(self, root: str = COVER_CACHE_DIR, max_bytes: int = COVER_CACHE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._entries = None  # path -> size, least recently used first
+        self._bytes = 0
+
+        self.hits = 0
+        self.fetches = 0
+        self.resizes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    # --- Files ---
+
+    def _url_path(self, url: str) -> str:
+        return os.path.join(self.root, "urls", _sha256(url.encode()))
+
+    def _object_path(self, content_hash: str) -> str:
+        return os.path.join(self.root, "objects", content_hash[:2], content_hash)
+
+    def _variant_path(self, content_hash: str, size: str) -> str:
+        return os.path.join(self.root, "variants", content_hash[:2], f"{content_hash}-{size}-v{VARIANT_VERSION}.jpg")
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        # Written under a temporary name first, so readers never see half a file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read(self, path: str) -> bytes | None:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._forget(path)
+            return None
+        self._touch(path, len(data))
+        return data
+
+    # --- LRU index ---
+
+    def _load(self):
+        # Called with the lock held
+        found = []
+        for folder in ("objects", "variants"):
+            for directory, _, files in os.walk(os.path.join(self.root, folder)):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime, path, stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in found)
+        self._bytes = sum(self._entries.values())
+
+    def _touch(self, path: str, size: int):
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            previous = self._entries.pop(path, None)
+            self._bytes += size - (previous or 0)
+            self._entries[path] = size
+            if previous is not None:
+                # Keeps the order across restarts, when the index is rebuilt from file times
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+            evicted = self._evict(keep=path)
+        for old_path in evicted:
+            try:
+                os.remove(old_path)
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, path: str):
+        with self._lock:
+            if self._entries is not None and path in self._entries:
+                self._bytes -= self._entries.pop(path)
+
+    def _evict(self, keep: str) -> list[str]:
+        # Called with the lock held; returns the paths to delete
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = next(iter(self._entries.items()))
+            if path == keep:
+                self._entries.move_to_end(path)
+                continue
+            del self._entries[path]
+            self._bytes -= size
+            evicted.append(path)
+        self.evictions += len(evicted)
+        return evicted
+
+    # --- Covers ---
+
+    def etag(self, url: str, size: str) -> str | None:
+        """
+        Returns the ETag the cover would be served with, or None if it hasn't been
+        fetched yet. Cheap enough to answer If-None-Match without reading the image.
+        """
+        try:
+            with open(self._url_path(url)) as f:
+                content_hash = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return self._etag(content_hash, size)
+
+    @staticmethod
+    def _etag(content_hash: str, size: str) -> str:
+        return f'"{content_hash[:32]}-{size}-v{VARIANT_VERSION}"'
+
+    def _fetch(self, url: str) -> bytes:
+        try:
+            with self.session.get(url, timeout=COVER_FETCH_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                chunks, received = [], 0
+                for chunk in response.iter_content(64 * 1024):
+                    received += len(chunk)
+                    if received > MAX_SOURCE_BYTES:
+                        raise CoverUnavailable(f"{url} is larger than {MAX_SOURCE_BYTES} bytes")
+                    chunks.append(chunk)
+        except requests.RequestException as e:
+            raise CoverUnavailable(f"Could not fetch {url}: {e}")
+        return b"".join(chunks)
+
+    @staticmethod
+    def _media_type(data: bytes) -> str:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                return Image.MIME.get(image.format, "application/octet-stream")
+        except (OSError, Image.DecompressionBombError):
+            raise CoverUnavailable("The cover is not an image")
+
+    @staticmethod
+    def _resize(data: bytes, box: tuple[int, int]) -> bytes:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                image.draft("RGB", box)  # lets JPEG decoding skip detail the variant won't show
+                image = image.convert("RGB")
+                image.thumbnail(box, Image.LANCZOS)  # keeps the aspect ratio, never enlarges
+                out = io.BytesIO()
+                image.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+                return out.getvalue()
+        except (OSError, Image.DecompressionBombError):
+            raise CoverUnavailable("The cover is not an image")
+
+    def get(self, url: str, size: str = "thumb") -> Cover:
+        """
+        Returns the cover at `url` in the given size, fetching and resizing it only if
+        it isn't on disk yet. Raises CoverUnavailable if it can't be fetched.
+        """
+        try:
+            with open(self._url_path(url)) as f:
+                content_hash = f.read().strip()
+        except FileNotFoundError:
+            content_hash = None
+
+        original = None
+        if content_hash is not None:
+            if size == "original":
+                original = self._read(self._object_path(content_hash))
+                if original is not None:
+                    self.hits += 1
+                    return Cover(original, self._media_type(original), self._etag(content_hash, size))
+            else:
+                variant = self._read(self._variant_path(content_hash, size))
+                if variant is not None:
+                    self.hits += 1
+                    return Cover(variant, "image/jpeg", self._etag(content_hash, size))
+                # Resized from the stored original if it is still there
+                original = self._read(self._object_path(content_hash))
+
+        try:
+            if original is None:
+                original = self._fetch(url)
+                media_type = self._media_type(original)
+                self.fetches += 1
+                content_hash = _sha256(original)
+                object_path = self._object_path(content_hash)
+                self._write(object_path, original)
+                self._touch(object_path, len(original))
+                self._write(self._url_path(url), content_hash.encode())
+            if size == "original":
+                return Cover(original, media_type, self._etag(content_hash, size))
+
+            variant = self._resize(original, COVER_SIZES[size])
+            self.resizes += 1
+            variant_path = self._variant_path(content_hash, size)
+            self._write(variant_path, variant)
+            self._touch(variant_path, len(variant))
+            return Cover(variant, "image/jpeg", self._etag(content_hash, size))
+        except CoverUnavailable:
+            self.errors += 1
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            files, size = len(self._entries), self._bytes
+        return {
+            "files": files,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "fetches": self.fetches,
+            "resizes": self.resizes,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+cover_store = CoverStore()
+
+# Concurrent requests for the same uncached cover share one fetch and resize
+cover_flights = SingleFlight("book_covers")
+_executor = ThreadPoolExecutor(max_workers=COVER_WORKERS, thread_name_prefix="cover")
+
+
+def get_cover(url: str, size: str):
+    """
+    Returns a Future for cover_store.get(url, size), run on the cover workers.
+    """
+    return cover_flights.submit((url, size), _executor, cover_store.get, url, size)
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,15 @@
 # app/crud.py
 from sqlalchemy.orm import Session
-from . import models, auth, schemas
-from sqlalchemy import func, or_
+import os
+from . import models, auth, schemas, search, rankings
+from .cache import MISSING, TTLCache
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.exc import IntegrityError
+
+# Popular books only change when ratings or the catalog change. Rating writes made by
+# this process call invalidate_popular_books(); the cache is per process, so changes
+# made elsewhere (seed.py, import_ratings.py, other workers) show up once the TTL expires.
+popular_books_cache = TTLCache("popular_books", ttl=int(os.getenv("POPULAR_BOOKS_CACHE_TTL", 300)))
 
 
 # function to get list of goals
@@ -19,13 +27,21 @@ def get_user_by_email(db: Session, email: str):
     """
     return db.query(models.User).filter(models.User.email == email).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
+def get_user(db: Session, user_id: int):
+    """
+    Reads the database to find a user by their ID.
+    """
+    return db.query(models.User).filter(models.User.id == user_id).first()
+
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str | None = None):
     """
     Creates a new user in the database.
-    Hashes the password before storing it.
+    Hashes the password before storing it, unless the caller already did.
     """
     # Get the hashed password from our auth logic
-    hashed_password = auth.get_password_hash(user.password)
+    if hashed_password is None:
+        hashed_password = auth.get_password_hash(user.password)
 
     # Create a new SQLAlchemy User model instance
     db_user = models.User(email=user.email, hashed_password=hashed_password)
@@ -42,6 +58,14 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    """
+    Replaces a user's stored password hash, e.g. after re-hashing it with new parameters.
+    """
+    db.query(models.User).filter(models.User.id == user_id).update({"hashed_password": hashed_password})
+    db.commit()
+
+
 # --- Function to set multiple goals for a user ---
 def set_user_goals(db: Session, user: models.User, goal_ids: list[int]):
     """
@@ -59,6 +83,9 @@ def set_user_goals(db: Session, user: models.User, goal_ids: list[int]):
     # 4. Commit the session to save all changes
     db.commit()
     db.refresh(user)
+
+    # 5. Cached logins still carry the old goals
+    auth.invalidate_user(user.email)
     return user
 
 # --- Function to ADD a single goal to a user's list ---
@@ -81,9 +108,10 @@ def add_goal_to_user(db: Session, user: models.User, goal_id: int):
     # 3. Add the new goal to the user's goal list
     user.goals.append(goal_to_add)
     
-    # 4. Commit and refresh
+    # 4. Commit and refresh, and drop cached logins that still carry the old goals
     db.commit()
     db.refresh(user)
+    auth.invalidate_user(user.email)
     return user
 
 # --- Function to REMOVE a single goal from a user's list ---
@@ -103,6 +131,7 @@ def remove_goal_from_user(db: Session, user: models.User, goal_id: int):
         user.goals.remove(goal_to_remove)
         db.commit()
         db.refresh(user)
+        auth.invalidate_user(user.email)
         return user
     
     # 3. If the user doesn't have this goal, there's nothing to do
@@ -116,41 +145,66 @@ def get_goal_by_id(db: Session, goal_id: int):
     return db.query(models.Goal).filter(models.Goal.id == goal_id).first()
 
 
+def get_goals_by_ids(db: Session, goal_ids: list[int]):
+    """
+    Reads the database to find the goals with the given IDs. Unknown IDs are skipped.
+    """
+    return db.query(models.Goal).filter(models.Goal.id.in_(goal_ids)).all()
+
+
 
-def get_recommendations_for_user(db: Session, user_id: int):
+def get_recommendations_for_user(db: Session, user_id: int, limit: int = 50, cursor: str | None = None):
     """
     Gets book recommendations for a user based on all of their active goals,
-    sorted by average rating in descending order.
+    sorted by average rating (then ratings count) in descending order.
+    Returns (books, next_cursor); pass next_cursor back to get the next page.
+    It is None on the last page. Raises ValueError for a malformed cursor.
     """
-    # 1. Find the user and their associated goals
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user or not user.goals:
-        return []
-        
-    # 2. Get a list of all goal IDs for the user
-    user_goal_ids = [goal.id for goal in user.goals]
-    
-    # 3. Query for books linked to ANY of those goals
-    #    - .in_(user_goal_ids) finds books where the goal_id is in our list
-    #    - .distinct() ensures we don't get duplicate books if a book matches multiple goals
-    recommended_books = (
-        db.query(models.Book)
-        .join(models.book_goals_table)
-        .filter(models.book_goals_table.c.goal_id.in_(user_goal_ids))
-        .filter(models.Book.ratings_count >= 50)
-        .order_by(models.Book.average_rating.desc())
-        .distinct()
-        .all()
-    )
+    after = rankings.decode_cursor(cursor) if cursor else None
+
+    # 1. Get a list of all goal IDs for the user
+    user_goal_ids = [
+        goal_id for (goal_id,) in
+        db.query(models.user_goals_table.c.goal_id).filter(models.user_goals_table.c.user_id == user_id)
+    ]
+    if not user_goal_ids:
+        return [], None
+
+    # 2. Merge the goals' pre-sorted book lists (see rankings.py)
+    rankings.goal_rankings.ensure_built(db)
+    book_ids, last_key = rankings.goal_rankings.page(user_goal_ids, limit=limit, after=after)
+    if not book_ids:
+        return [], None
+
+    # 3. Load just this page of books and keep the ranked order
+    books = db.query(models.Book).filter(models.Book.id.in_(book_ids)).all()
+    books_by_id = {book.id: book for book in books}
+    recommended_books = [books_by_id[book_id] for book_id in book_ids if book_id in books_by_id]
 
-    return recommended_books
+    next_cursor = rankings.encode_cursor(last_key) if last_key else None
+    return recommended_books, next_cursor
+
+
+def refresh_book_rankings(book: models.Book):
+    """
+    Updates the book's place in the precomputed per-goal rankings and in the
+    search and suggest indexes. Call this after the book's rating stats change.
+    """
+    rankings.goal_rankings.refresh_book(book.id, book.average_rating, book.ratings_count)
+    search.refresh_book(book.id, book.ratings_count)
 
 
 def get_popular_books(db: Session, limit: int = 12, min_ratings: int = 100):
     """
     Gets a curated list of popular books using a pure SQLAlchemy ORM query
     that ranks books within each goal category.
+    Results are cached per (limit, min_ratings) in popular_books_cache.
     """
+    cached = popular_books_cache.get((limit, min_ratings))
+    if cached is not MISSING:
+        return cached
+    # A rating committed while the query runs invalidates the cache; the result is then not stored
+    generation = popular_books_cache.generation
     
     # --- Step 1: Create a subquery to rank books within each goal ---
     # This is the SQLAlchemy way of writing a window function:
@@ -180,30 +234,47 @@ def get_popular_books(db: Session, limit: int = 12, min_ratings: int = 100):
         .all()
     )
     
+    popular_books_cache.set((limit, min_ratings), popular_books, generation=generation)
     return popular_books
 
 
+def invalidate_popular_books():
+    """
+    Clears the cached popular books. Call this after ratings or the catalog change.
+    """
+    popular_books_cache.invalidate()
+
 
-def search_books(db: Session, query: str):
+
+def search_books(db: Session, query: str, limit: int = 20, offset: int = 0):
     """
-    Searches for books with a title or author that contains the query string.
-    The search is case-insensitive.
+    Searches for books whose title or author words match the query string,
+    best matches first. The search is case-insensitive and the last word of
+    the query also matches as a prefix (e.g. "harry pot").
+    Uses the in-memory index from search.py instead of scanning the table.
     """
-    search_term = f"%{query}%" # Add wildcards for partial matching
-    
-    # .ilike() is a case-insensitive "LIKE" query
-    # or_() lets us search in either the title or the author column
-    search_results = (
-        db.query(models.Book)
-        .filter(
-            or_(
-                models.Book.title.ilike(search_term),
-                models.Book.author.ilike(search_term)
-            )
-        )
-        .all()
-    )
-    return search_results
+    search.book_index.ensure_built(db)
+    book_ids = search.book_index.search(query, limit=limit, offset=offset)
+    if not book_ids:
+        return []
+
+    # Load just this page of books, then put them back in ranked order
+    books = db.query(models.Book).filter(models.Book.id.in_(book_ids)).all()
+    books_by_id = {book.id: book for book in books}
+    return [books_by_id[book_id] for book_id in book_ids if book_id in books_by_id]
+
+
+def suggest_books(db: Session, prefix: str, limit: int = 8):
+    """
+    Returns autocomplete suggestions for books whose title or author starts
+    with the prefix, most rated first.
+    Served entirely from the in-memory prefix index in search.py.
+    """
+    search.suggest_index.ensure_built(db)
+    return [
+        schemas.BookSuggestion(id=book_id, title=title, author=author, ratings_count=ratings_count)
+        for book_id, title, author, ratings_count in search.suggest_index.suggest(prefix, limit=limit)
+    ]
 
 
 def get_book_by_id(db: Session, book_id: int):
@@ -213,6 +284,17 @@ def get_book_by_id(db: Session, book_id: int):
     return db.query(models.Book).filter(models.Book.id == book_id).first()
 
 
+def get_user_rating(db: Session, user_id: int, book_id: int):
+    """
+    Returns the rating a user gave a book, or None if they haven't rated it.
+    """
+    user_rating = db.query(models.Rating).filter(
+        models.Rating.book_id == book_id,
+        models.Rating.user_id == user_id
+    ).first()
+    return user_rating.rating if user_rating else None
+
+
 def update_book_description(db: Session, book_id: int, description: str):
     """
     Updates the description for a specific book.
@@ -226,6 +308,95 @@ def update_book_description(db: Session, book_id: int, description: str):
 
 
 
+def add_rating(db: Session, user_id: int, book_id: int, rating: float):
+    """
+    Stores a user's first rating of a book and updates the book's average rating
+    and count, in one transaction. Returns the updated book, or None if there is
+    no such book. Raises IntegrityError (after rolling back) if the user has
+    already rated the book.
+    """
+    # The new aggregates are computed by the database from the row's current values,
+    # so concurrent ratings of the same book queue up on its row lock instead of
+    # overwriting each other's counts.
+    count = func.coalesce(models.Book.ratings_count, 0)
+    average = func.coalesce(models.Book.average_rating, 0)
+    db_book = db.scalars(
+        update(models.Book)
+        .where(models.Book.id == book_id)
+        .values(
+            ratings_count=count + 1,
+            average_rating=(average * count + rating) / (count + 1),
+        )
+        .returning(models.Book)
+        .execution_options(populate_existing=True)
+    ).first()
+    if db_book is None:
+        db.rollback()
+        return None
+
+    db.add(models.Rating(book_id=book_id, user_id=user_id, rating=rating))
+    try:
+        db.commit()
+    except IntegrityError:
+        # The UniqueConstraint ('_book_user_uc') failed; this also undoes the aggregate update
+        db.rollback()
+        raise
+    return db_book
+
+
+def insert_rating(db: Session, user_id: int, book_id: int, rating: float):
+    """
+    Stores a user's first rating of a book without touching the book's aggregates,
+    for when they are updated in batches instead (see rating_buffer.py).
+    Returns the book, or None if there is no such book. Raises IntegrityError
+    (after rolling back) if the user has already rated the book.
+    """
+    db_book = get_book_by_id(db, book_id=book_id)
+    if db_book is None:
+        return None
+
+    db.add(models.Rating(book_id=book_id, user_id=user_id, rating=rating))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise
+    return db_book
+
+
+def apply_rating_deltas(db: Session, deltas: dict[int, tuple[int, float]]):
+    """
+    Folds rating changes into the books' aggregates with one batched UPDATE.
+    `deltas` maps book_id -> (number of ratings added, change in the sum of ratings);
+    a re-rating counts as 0 added with the difference between the old and new value.
+    Returns [(book_id, average_rating, ratings_count)] for the updated books.
+    Does not commit, so it can share a transaction with the rating writes.
+    """
+    if not deltas:
+        return []
+    count = func.coalesce(models.Book.ratings_count, 0)
+    average = func.coalesce(models.Book.average_rating, 0)
+    new_count = count + bindparam("b_count")
+    statement = (
+        update(models.Book.__table__)
+        .where(models.Book.id == bindparam("b_id"))
+        .values(
+            ratings_count=new_count,
+            average_rating=func.coalesce((average * count + bindparam("b_sum")) / func.nullif(new_count, 0), 0),
+        )
+    )
+    # Sorted, so concurrent writers lock the rows in the same order
+    db.execute(statement, [
+        {"b_id": book_id, "b_count": added, "b_sum": total}
+        for book_id, (added, total) in sorted(deltas.items())
+    ])
+    return (
+        db.query(models.Book.id, models.Book.average_rating, models.Book.ratings_count)
+        .filter(models.Book.id.in_(deltas))
+        .all()
+    )
+
+
 def rate_book(db: Session, user_id: int, book_id: int, rating: float):
     """
     Allows a user to rate a book. If the rating already exists, it's updated.
@@ -261,7 +432,8 @@ def rate_book(db: Session, user_id: int, book_id: int, rating: float):
     
     # 3. Update the book's stats
     if book_to_update and stats:
-        book_to_update.average_rating = round(stats.average, 2) if stats.average else 0
+        # Stored unrounded, like the incremental updates in add_rating and apply_rating_deltas
+        book_to_update.average_rating = stats.average if stats.average else 0
         book_to_update.ratings_count = stats.count if stats.count else 0
         db.commit()
         db.refresh(book_to_update)
@@ -0,0 +1,133 @@
+# app/crud_async.py
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, models, rankings, schemas, search
+from .database import SessionLocal
+
+# Async versions of the functions in crud.py, for endpoints using the AsyncSession
+# from database.get_db. Each one runs its crud.py counterpart through
+# AsyncSession.run_sync, so the queries are only written once: the ORM code runs
+# unchanged while the driver (asyncpg / aiosqlite) awaits the database, and the
+# event loop serves other requests in the meantime.
+#
+# Objects returned here are fully loaded. Touching an unloaded relationship
+# outside run_sync raises MissingGreenlet, so anything that needs one (like a
+# user's goals) is read inside the call.
+
+
+# --- In-memory indexes ---
+
+def _build_index(index):
+    db = SessionLocal()
+    try:
+        index.ensure_built(db)
+    finally:
+        db.close()
+
+
+async def _ensure_built(index):
+    # Building an index takes a while on a big catalog, so do it on a worker
+    # thread with a sync session rather than on the event loop
+    if index.is_stale():
+        await run_in_threadpool(_build_index, index)
+
+
+# --- Goals ---
+
+async def get_goals(db: AsyncSession):
+    return await db.run_sync(crud.get_goals)
+
+
+async def get_goal_by_id(db: AsyncSession, goal_id: int):
+    return await db.run_sync(crud.get_goal_by_id, goal_id=goal_id)
+
+
+async def get_goals_by_ids(db: AsyncSession, goal_ids: list[int]):
+    return await db.run_sync(crud.get_goals_by_ids, goal_ids=goal_ids)
+
+
+# --- Users ---
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.run_sync(crud.get_user_by_email, email=email)
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.run_sync(crud.get_user, user_id=user_id)
+
+
+async def get_user_with_goals(db: AsyncSession, email: str) -> schemas.UserWithGoals | None:
+    """
+    Returns a snapshot of the user and their goals, or None if there is no such user.
+    """
+    def load(session) -> schemas.UserWithGoals | None:
+        db_user = crud.get_user_by_email(session, email=email)
+        return schemas.UserWithGoals.model_validate(db_user) if db_user else None
+
+    return await db.run_sync(load)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate, hashed_password: str | None = None):
+    return await db.run_sync(crud.create_user, user=user, hashed_password=hashed_password)
+
+
+async def update_password_hash(db: AsyncSession, user_id: int, hashed_password: str):
+    return await db.run_sync(crud.update_password_hash, user_id=user_id, hashed_password=hashed_password)
+
+
+async def set_user_goals(db: AsyncSession, user: models.User, goal_ids: list[int]):
+    return await db.run_sync(crud.set_user_goals, user=user, goal_ids=goal_ids)
+
+
+async def add_goal_to_user(db: AsyncSession, user: models.User, goal_id: int):
+    return await db.run_sync(crud.add_goal_to_user, user=user, goal_id=goal_id)
+
+
+async def remove_goal_from_user(db: AsyncSession, user: models.User, goal_id: int):
+    return await db.run_sync(crud.remove_goal_from_user, user=user, goal_id=goal_id)
+
+
+# --- Books ---
+
+async def get_recommendations_for_user(db: AsyncSession, user_id: int, limit: int = 50, cursor: str | None = None):
+    await _ensure_built(rankings.goal_rankings)
+    return await db.run_sync(crud.get_recommendations_for_user, user_id=user_id, limit=limit, cursor=cursor)
+
+
+async def get_popular_books(db: AsyncSession, limit: int = 12, min_ratings: int = 100):
+    return await db.run_sync(crud.get_popular_books, limit=limit, min_ratings=min_ratings)
+
+
+async def search_books(db: AsyncSession, query: str, limit: int = 20, offset: int = 0):
+    await _ensure_built(search.book_index)
+    return await db.run_sync(crud.search_books, query=query, limit=limit, offset=offset)
+
+
+async def suggest_books(db: AsyncSession, prefix: str, limit: int = 8):
+    await _ensure_built(search.suggest_index)
+    return await db.run_sync(crud.suggest_books, prefix=prefix, limit=limit)
+
+
+async def get_book_by_id(db: AsyncSession, book_id: int):
+    return await db.run_sync(crud.get_book_by_id, book_id=book_id)
+
+
+async def get_user_rating(db: AsyncSession, user_id: int, book_id: int):
+    return await db.run_sync(crud.get_user_rating, user_id=user_id, book_id=book_id)
+
+
+async def update_book_description(db: AsyncSession, book_id: int, description: str):
+    return await db.run_sync(crud.update_book_description, book_id=book_id, description=description)
+
+
+async def add_rating(db: AsyncSession, user_id: int, book_id: int, rating: float):
+    return await db.run_sync(crud.add_rating, user_id=user_id, book_id=book_id, rating=rating)
+
+
+async def insert_rating(db: AsyncSession, user_id: int, book_id: int, rating: float):
+    return await db.run_sync(crud.insert_rating, user_id=user_id, book_id=book_id, rating=rating)
+
+
+async def rate_book(db: AsyncSession, user_id: int, book_id: int, rating: float):
+    return await db.run_sync(crud.rate_book, user_id=user_id, book_id=book_id, rating=rating)
@@ -1,25 +1,57 @@
 # app/database.py
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
+from . import pool
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# Async drivers used for each database when ASYNC_DATABASE_URL isn't set
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Turns a sync database URL into the same URL with an async driver,
+    e.g. postgresql://... -> postgresql+asyncpg://...
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.drivername == ASYNC_DRIVERS.get(backend) or backend not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+# The sync engine is used by scripts (seed.py, ...) and background workers.
+# Pool sizing, recycling and pre-ping come from the environment (see pool.py).
+engine = create_engine(DATABASE_URL, **pool.engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# The async engine is used by the API endpoints, so a worker can wait on many queries
+# at once without holding a thread for each one
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool.engine_options(ASYNC_DATABASE_URL, is_async=True))
+# Objects stay usable after commit, since lazy loads can't run outside the session's greenlet
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+pool.register("primary", engine)
+pool.register("primary_async", async_engine)
+
 # This is a "dependency" that provides a database session to our endpoints
 # and ensures it's properly closed after the request is finished.
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # Test block 
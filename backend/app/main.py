@@ -1,26 +1,69 @@
 # app/main.py
 
 # --- Core Imports ---
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm # Import form data dependency
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from typing import List
+from contextlib import asynccontextmanager
+import asyncio
+import codecs
+import json
 
 # --- Local Imports ---
-from . import models, schemas, crud, auth
-from .database import engine, get_db
+from . import schemas, crud, crud_async, auth
+from .database import async_engine, engine, get_db
 from . import ai
+from . import cache
+from . import covers
+from . import singleflight
+from . import metrics
+from . import migrations
+from . import pool
+from . import querycount
+from . import replicas
+from . import rating_buffer
+from . import rating_import
+from . import slowlog
+from .replicas import get_read_db
+from . import summaries
 
 
 # --- Database Table Creation ---
-# This line tells SQLAlchemy to create all tables from models.py if they don't exist
-models.Base.metadata.create_all(bind=engine)
+# Creates the tables from models.py and applies any schema changes the database
+# hasn't had yet (see migrations.py)
+migrations.migrate(engine)
+
+
+# --- App Lifecycle ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    health_checks = None
+    if replicas.replica_set.replicas:
+        health_checks = asyncio.create_task(replicas.replica_set.run_health_checks())
+    yield
+    if health_checks is not None:
+        health_checks.cancel()
+    # Let summaries that are already being generated finish and get saved
+    summaries.shutdown(wait=True)
+    covers.shutdown()
+    slowlog.shutdown()
+    # Write out rating aggregates that are still buffered
+    rating_buffer.buffer.stop()
+    await async_engine.dispose()
+    await replicas.replica_set.dispose()
 
 
 # --- FastAPI App Instance ---
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
+# Counts the SQL statements each request runs (see querycount.py)
+app.add_middleware(querycount.QueryCountMiddleware)
+# Request latency and status metrics for GET /metrics (see metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # temporary cors allowance
 from fastapi.middleware.cors import CORSMiddleware
@@ -30,58 +73,89 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-DB-Query-Count", "X-DB-Query-Time-Ms"],
 )
 
 # --- API Endpoints ---
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to the API!"}
 
 @app.get("/goals", response_model=List[schemas.Goal])
-def read_goals(db: Session = Depends(get_db)):
+@querycount.query_budget(1)
+async def read_goals(db: AsyncSession = Depends(get_read_db)):
     """
     This endpoint fetches and returns a list of all available learning goals.
     """
-    goals = crud.get_goals(db)
+    goals = await crud_async.get_goals(db)
     return goals
 
 
 @app.get("/books/popular", response_model=List[schemas.Book])
-def read_popular_books(db: Session = Depends(get_db)):
+@querycount.query_budget(1)
+async def read_popular_books(db: AsyncSession = Depends(get_read_db)):
     """
     This endpoint returns a list of the top 10 most popular books
     based on average rating and a minimum number of ratings.
     """
-    books = crud.get_popular_books(db)
+    books = await crud_async.get_popular_books(db)
     return books
 
 
 
 @app.get("/books/search", response_model=List[schemas.Book])
-def search_for_books(q: str | None = None, db: Session = Depends(get_db)):
+@querycount.query_budget(2)
+async def search_for_books(
+    q: str | None = None,
+    limit: int = Query(50, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_read_db)
+):
     """
-    This endpoint searches for books by title or author.
+    This endpoint searches for books by title or author, best matches first.
     The search query is passed as a URL query parameter, e.g., /books/search?q=potter
+    Results are paged with `limit` and `offset`, e.g., /books/search?q=potter&limit=20&offset=20
     """
     if not q:
         return [] # Return an empty list if no query is provided
         
-    books = crud.search_books(db, query=q)
+    books = await crud_async.search_books(db, query=q, limit=limit, offset=offset)
     return books
 
 
+@app.get("/books/suggest", response_model=List[schemas.BookSuggestion])
+@querycount.query_budget(1)
+async def suggest_books(
+    prefix: str | None = None,
+    limit: int = Query(8, ge=1, le=20),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    This endpoint returns autocomplete suggestions while the user is typing,
+    e.g., /books/suggest?prefix=harry
+    It is served from memory, so it is cheap enough to call on every keystroke.
+    """
+    if not prefix:
+        return []
+
+    return await crud_async.suggest_books(db, prefix=prefix, limit=limit)
+
+
 @app.post("/register", response_model=schemas.Token)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     """
     This endpoint handles new user registration.
+    Password hashing runs on the dedicated hashing pool (see auth.py), and the
+    request gets a 503 if that pool is full.
     """
     # Check if a user with this email already exists in the database.
-    db_user = crud.get_user_by_email(db, email=user.email)
+    db_user = await crud_async.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    new_user = crud.create_user(db=db, user=user)
+    hashed_password = await auth.hash_password_async(user.password)
+    new_user = await crud_async.create_user(db, user=user, hashed_password=hashed_password)
     access_token = auth.create_access_token(data={"sub": new_user.email})
 
     # If the user doesn't exist, create them.
@@ -89,16 +163,25 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 
 @app.post("/login", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     This endpoint handles user login using standard form data.
     This makes it compatible with the interactive docs' "Authorize" button.
+    Password checks run on the dedicated hashing pool, and the request gets a
+    503 if that pool is full.
     """
     # The user's email is now in `form_data.username`.
-    user = crud.get_user_by_email(db, email=form_data.username)
+    user = await crud_async.get_user_by_email(db, email=form_data.username)
     
     # The password comes from `form_data.password`.
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    password_ok = False
+    if user:
+        password_ok, new_hash = await auth.verify_and_update_password_async(form_data.password, user.hashed_password)
+        # The stored hash used old Argon2 settings; replace it while we have the password
+        if password_ok and new_hash:
+            await crud_async.update_password_hash(db, user_id=user.id, hashed_password=new_hash)
+
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -134,74 +217,167 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 
 
 @app.get("/users/me/recommendations", response_model=List[schemas.Book])
-def get_recommendations(
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+@querycount.query_budget(5)
+async def get_recommendations(
+    response: Response,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: str | None = None,
+    current_user: schemas.UserWithGoals = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     This is a protected endpoint that returns book recommendations
     based on the logged-in user's currently selected goals.
+    If there are more results, the X-Next-Cursor response header holds the
+    `cursor` value for the next page.
     """
-    books = crud.get_recommendations_for_user(db, user_id=current_user.id) # This now works with multiple goals
+    try:
+        books, next_cursor = await crud_async.get_recommendations_for_user(
+            db, user_id=current_user.id, limit=limit, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return books
 
 
 
 
 @app.get("/books/{book_id}", response_model=schemas.Book)
-def read_book_details(
+@querycount.query_budget(4)
+async def read_book_details(
     book_id: int, 
-    db: Session = Depends(get_db),
-    current_user: models.User | None = Depends(auth.get_optional_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: schemas.UserWithGoals | None = Depends(auth.get_optional_current_user)
 ):
     """
     Gets details for a single book, including the user's rating if logged in.
-    If the book's description is missing, it generates a new one using an AI model.
+    If the book's description is missing, an AI summary is generated in the
+    background. The request waits up to SUMMARY_WAIT_SECONDS for it; after that
+    the response says `summary_pending` and the summary shows up on a later
+    request once it has been saved. Concurrent requests for the same book share
+    a single generation, and books whose generation failed recently are not
+    retried until their backoff has passed.
     """
-    db_book = crud.get_book_by_id(db, book_id=book_id)
+    db_book = await crud_async.get_book_by_id(db, book_id=book_id)
     if not db_book:
         raise HTTPException(status_code=404, detail="Book not found")
 
     # --- Attach the user's rating if they are logged in ---
     user_rating_value = None
     if current_user:
-        user_rating_obj = db.query(models.Rating).filter(
-            models.Rating.book_id == book_id,
-            models.Rating.user_id == current_user.id
-        ).first()
-        if user_rating_obj:
-            user_rating_value = user_rating_obj.rating
+        user_rating_value = await crud_async.get_user_rating(db, user_id=current_user.id, book_id=book_id)
             
     db_book.user_rating = user_rating_value
 
-    needs_summary = db_book.description == "No description available."
-
-    if needs_summary:
-        print(f"Generating new summary for '{db_book.title}'...")
-        new_description = ai.generate_book_summary(title=db_book.title, author=db_book.author)
-        
-        # Check if the AI call was successful
-        is_successful_summary = new_description and new_description not in [
-            "AI model is not available.",
-            "Could not generate a summary at this time."
-        ]
-
-        if is_successful_summary:
-            # If successful, update the book in the database
-            db_book = crud.update_book_description(db, book_id=book_id, description=new_description)
-            # Re-attach the user rating to the newly updated book object
-            db_book.user_rating = user_rating_value
+    # Skip the AI path entirely while it is failing; the stored description is shown as is.
+    if summaries.needs_summary(db_book.description) and summaries.can_generate(book_id):
+        future = summaries.schedule_summary(book_id=book_id, title=db_book.title, author=db_book.author)
+        summary = await summaries.wait_for_summary_async(future, timeout=summaries.SUMMARY_WAIT_SECONDS)
+
+        # Show the summary (already saved by the worker) or a placeholder without saving it.
+        # 1. Detach the book object from the database session.
+        db.expunge(db_book)
+        # 2. Now, safely change the description for this response only.
+        if summary:
+            db_book.description = summary
         else:
-            # If not successful, we need to show the error message without saving it.
-            # 1. Detach the book object from the database session.
-            db.expunge(db_book)
-            # 2. Now, safely change the description for this one response without saving.
-            db_book.description = new_description
+            db_book.description = summaries.SUMMARY_PENDING
+            db_book.summary_pending = True
 
     return db_book
 
 
 
+@app.get("/books/{book_id}/summary/stream")
+async def stream_book_summary(book_id: int, db: AsyncSession = Depends(get_read_db)):
+    """
+    Streams the book's AI summary as Server-Sent Events while the model writes it,
+    so the first words show up right away instead of after the whole response.
+    Each piece arrives as `data: {"text": ...}`; the stream ends with a `done` event
+    carrying the full description, or an `error` event if no summary could be made.
+    The finished summary is saved, so later requests get it straight from the database.
+    """
+    db_book = await crud_async.get_book_by_id(db, book_id=book_id)
+    if not db_book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    title, author, description = db_book.title, db_book.author, db_book.description
+
+    def sse(data: dict, event: str | None = None) -> str:
+        prefix = f"event: {event}\n" if event else ""
+        return f"{prefix}data: {json.dumps(data)}\n\n"
+
+    def events():
+        if not summaries.needs_summary(description):
+            yield sse({"text": description})
+            yield sse({"description": description}, event="done")
+            return
+        if not summaries.can_generate(book_id):
+            yield sse({"detail": ai.GENERATION_FAILED}, event="error")
+            return
+
+        pieces = []
+        try:
+            for piece in summaries.stream_summary(book_id, title=title, author=author):
+                pieces.append(piece)
+                yield sse({"text": piece})
+        except ai.SummaryUnavailable as e:
+            yield sse({"detail": str(e)}, event="error")
+            return
+        yield sse({"description": ai.clean_summary("".join(pieces))}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+
+@app.get("/books/{book_id}/cover")
+async def read_book_cover(
+    book_id: int,
+    request: Request,
+    size: covers.CoverSize = "thumb",
+    db: AsyncSession = Depends(get_read_db),
+):
+    """
+    Serves the book's cover from the local cover cache, so pages don't wait on the
+    image host. `size` is thumb (book cards), detail (book modal) or original.
+    The first request for a cover fetches it and later ones read it from disk.
+    Responses carry a strong ETag and may be cached by browsers; If-None-Match
+    gets a 304. Books without a cover get a 404, and if the image host can't be
+    reached the client is redirected to the original URL.
+    """
+    db_book = await crud_async.get_book_by_id(db, book_id=book_id)
+    if not db_book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    url = db_book.cover_image_url
+    if not covers.has_cover(url):
+        raise HTTPException(status_code=404, detail="This book has no cover")
+
+    cache_control = f"public, max-age={covers.COVER_MAX_AGE}"
+    etag = covers.cover_store.etag(url, size)
+    if_none_match = request.headers.get("if-none-match")
+    if etag and if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+    try:
+        cover = await asyncio.wrap_future(covers.get_cover(url, size))
+    except covers.CoverUnavailable as e:
+        print(f"Cover for book {book_id} unavailable: {e}")
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+    return Response(
+        content=cover.content,
+        media_type=cover.media_type,
+        headers={"ETag": cover.etag, "Cache-Control": cache_control},
+    )
+
+
+
 # from sqlalchemy.exc import IntegrityError
 
 # @app.post("/books/{book_id}/rate", response_model=schemas.Book)
@@ -249,55 +425,43 @@ def read_book_details(
 
 
 @app.post("/books/{book_id}/rate", response_model=schemas.Book)
-def rate_book(
+@querycount.query_budget(4)
+async def rate_book(
     book_id: int,
     rating: schemas.RatingCreate,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.UserWithGoals = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Allows a logged-in user to rate a book ONCE (1–5).
     Raises an error if the user has already rated this book.
-    Incrementally updates the book's average rating and count.
+    Incrementally updates the book's average rating and count, right away or, in
+    write-behind mode (RATING_WRITE_BEHIND), with the next batch from rating_buffer.py.
     """
-    db_book = crud.get_book_by_id(db, book_id=book_id)
-    if not db_book:
-        raise HTTPException(status_code=404, detail="Book not found")
-
-    # Create a new rating object
-    new_rating = models.Rating(
-        book_id=book_id,
-        user_id=current_user.id,
-        rating=rating.rating
-    )
-    db.add(new_rating)
-
+    buffered = rating_buffer.buffer.accepting()
+    add_rating = crud_async.insert_rating if buffered else crud_async.add_rating
     try:
-        # Attempt to save the new rating to the database
-        db.commit()
-        db.refresh(new_rating)
-        
-        # --- Incremental Update Logic (Runs only on success) ---
-        # Calculate the previous total score
-        total_rating_sum = (db_book.average_rating or 0) * (db_book.ratings_count or 0)
-        
-        # Add the new rating and increment the count
-        total_rating_sum += rating.rating
-        db_book.ratings_count = (db_book.ratings_count or 0) + 1
-        
-        # Calculate and update the new average
-        db_book.average_rating = round(total_rating_sum / db_book.ratings_count, 2)
-
-        db.commit() # Save the updated book stats
-        db.refresh(db_book)
-
+        db_book = await add_rating(db, user_id=current_user.id, book_id=book_id, rating=rating.rating)
     except IntegrityError:
         # This block runs if the UniqueConstraint ('_book_user_uc') fails
-        db.rollback() # Rollback the failed transaction
         raise HTTPException(
             status_code=400, 
             detail="You have already rated this book."
         )
+    if not db_book:
+        raise HTTPException(status_code=404, detail="Book not found")
+
+    if buffered:
+        rating_buffer.buffer.add(book_id, rating.rating)
+        # Answer with the aggregates as they will be once the buffer is flushed
+        db.expunge(db_book)
+        rating_buffer.buffer.apply_pending(db_book)
+    else:
+        # The new rating can change which books are popular or recommended
+        crud.invalidate_popular_books()
+        crud.refresh_book_rankings(db_book)
+    # Let the user see their rating even if the read replicas lag behind
+    replicas.record_write(current_user.email)
 
     return db_book
 
@@ -305,7 +469,8 @@ def rate_book(
 
 # --- ADD THIS NEW ENDPOINT ---
 @app.get("/users/me", response_model=schemas.UserWithGoals)
-def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+@querycount.query_budget(2)
+async def read_users_me(current_user: schemas.UserWithGoals = Depends(auth.get_current_user)):
     """
     Gets the profile for the current logged-in user, including their selected goals.
     """
@@ -313,63 +478,222 @@ def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
 
 # --- SET / REPLACE all goals for a user (e.g., for first-time setup) ---
 @app.put("/users/me/goals", status_code=status.HTTP_200_OK)
-def set_user_goals(
+@querycount.query_budget(8)
+async def set_user_goals(
     goals_update: schemas.UserGoalsUpdate, # Uses the schema with a LIST of IDs
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.UserWithGoals = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Sets or replaces all active goals for the logged-in user with the provided list.
     Ideal for initial setup or a complete reset of goals.
     """
     # Optional: Verify that all provided goal_ids are valid goals
-    goals_from_db = db.query(models.Goal).filter(models.Goal.id.in_(goals_update.goal_ids)).all()
+    goals_from_db = await crud_async.get_goals_by_ids(db, goal_ids=goals_update.goal_ids)
     if len(goals_from_db) != len(set(goals_update.goal_ids)): # Use set to handle duplicate IDs in input
         raise HTTPException(status_code=404, detail="One or more goal IDs are invalid.")
 
     # Call the CRUD function to replace all goals
-    crud.set_user_goals(db=db, user=current_user, goal_ids=goals_update.goal_ids)
+    user = await crud_async.get_user(db, user_id=current_user.id)
+    await crud_async.set_user_goals(db, user=user, goal_ids=goals_update.goal_ids)
+    replicas.record_write(current_user.email)
     
     return {"message": f"Successfully set goals for user {current_user.email}"}
 
 
 # --- ADD a single goal to the user's list ---
 @app.post("/users/me/goals", status_code=status.HTTP_200_OK)
-def add_user_goal(
+@querycount.query_budget(8)
+async def add_user_goal(
     goal_to_add: schemas.UserGoalAdd, # Uses the schema with a SINGLE ID
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.UserWithGoals = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Adds a single new goal to the logged-in user's list of active goals.
     """
-    goal = crud.get_goal_by_id(db, goal_id=goal_to_add.goal_id)
+    goal = await crud_async.get_goal_by_id(db, goal_id=goal_to_add.goal_id)
     if not goal:
         raise HTTPException(status_code=404, detail=f"Goal with ID {goal_to_add.goal_id} not found.")
 
     # Call the CRUD function to add one goal
-    updated_user = crud.add_goal_to_user(db=db, user=current_user, goal_id=goal_to_add.goal_id)
+    user = await crud_async.get_user(db, user_id=current_user.id)
+    updated_user = await crud_async.add_goal_to_user(db, user=user, goal_id=goal_to_add.goal_id)
     
     if updated_user is None:
          raise HTTPException(status_code=409, detail="User already has this goal.")
+    replicas.record_write(current_user.email)
     
     return {"message": f"Successfully added goal '{goal.name}' for user {current_user.email}"}
 
 
 # --- REMOVE a single goal from the user's list ---
 @app.delete("/users/me/goals/{goal_id}", status_code=status.HTTP_200_OK)
-def delete_user_goal(
+@querycount.query_budget(6)
+async def delete_user_goal(
     goal_id: int, # Goal ID comes from the URL path
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.UserWithGoals = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Removes a single goal from the logged-in user's list of active goals.
     """
     # Call the CRUD function to remove one goal
-    result = crud.remove_goal_from_user(db=db, user=current_user, goal_id=goal_id)
+    user = await crud_async.get_user(db, user_id=current_user.id)
+    result = await crud_async.remove_goal_from_user(db, user=user, goal_id=goal_id)
     
     if result is None:
         raise HTTPException(status_code=404, detail=f"Goal with ID {goal_id} not found in user's goal list.")
+    replicas.record_write(current_user.email)
 
     return {"message": f"Successfully removed goal for user {current_user.email}"}
+
+
+# --- Admin ---
+@app.post("/admin/ratings/import")
+async def import_ratings(
+    request: Request,
+    format: str | None = Query(None, pattern="^(ndjson|csv)$"),
+    admin: schemas.UserWithGoals = Depends(auth.get_current_admin)
+):
+    """
+    Bulk-imports ratings streamed in the request body, one per line, as NDJSON
+    ({"user_id": 1, "book_id": 2, "rating": 4}) or CSV with a user_id,book_id,rating
+    header. The format comes from `format` or else the Content-Type (text/csv means
+    CSV). A rating for a (book, user) pair that already has one replaces it.
+    Book aggregates are updated once per affected book at the end. Answers with
+    counts and rows per second. Only for users listed in ADMIN_EMAILS.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    importer = rating_import.RatingImporter(fmt)
+
+    # The body is parsed and written in batches while it streams in
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    try:
+        async for chunk in request.stream():
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split("\n")
+            if lines:
+                await run_in_threadpool(importer.feed_lines, lines)
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            await run_in_threadpool(importer.feed_lines, [pending])
+    except Exception:
+        # Keep the aggregates in line with the batches already committed
+        await run_in_threadpool(importer.apply_aggregates)
+        raise
+
+    report = await run_in_threadpool(importer.finish)
+    print(f"Rating import by {admin.email}: {report['rows']} rows at {report['rows_per_second']} rows/s")
+    return report
+
+
+@app.get("/admin/slow-queries")
+async def read_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    function: str | None = None,
+    min_ms: float = Query(0, ge=0),
+    search: str | None = None,
+    admin: schemas.UserWithGoals = Depends(auth.get_current_admin)
+):
+    """
+    Returns the newest statements from the slow query log (see slowlog.py), newest
+    first, with their parameters, the crud function that ran them and their plan.
+    Filter by `function` (e.g. crud.get_popular_books), a minimum duration in ms,
+    or text in the statement. Only for users listed in ADMIN_EMAILS.
+    """
+    records = await run_in_threadpool(slowlog.read_records, limit, function, min_ms, search)
+    return {**slowlog.stats(), "records": records}
+
+
+# --- Diagnostics ---
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics(request: Request):
+    """
+    Serves this worker's metrics in the Prometheus text format: request latency
+    histograms and status counts per route, requests in flight, connection pool,
+    cache, AI and rating buffer numbers.
+    Not public: scrapers send `Authorization: Bearer <METRICS_TOKEN>`, and the
+    endpoint answers 404 while METRICS_TOKEN is not set.
+    """
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics.is_authorized(request.headers.get("authorization")):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/diagnostics/cache")
+async def read_cache_stats(admin: schemas.UserWithGoals = Depends(auth.get_current_admin)):
+    """
+    Returns hit/miss counters for the in-memory caches.
+    """
+    return cache.stats()
+
+
+@app.get("/diagnostics/singleflight")
+async def read_singleflight_stats(admin: schemas.UserWithGoals = Depends(auth.get_current_admin)):
+    """
+    Returns how many calls each single-flight group received, how many it
+    actually executed and how many duplicates it saved.
+    """
+    return singleflight.stats()
+
+
+@app.get("/diagnostics/pool")
+async def read_pool_stats(admin: schemas.UserWithGoals = Depends(auth.get_current_admin)):
+    """
+    Returns live connection pool numbers for this worker process: connections
+    checked out and in, overflow, checkout wait and connect time histograms,
+    and how many checkouts timed out.
+    """
+    return pool.stats()
+
+
+@app.get("/diagnostics/queries")
+async def read_query_stats(admin: schemas.UserWithGoals = Depends(auth.get_current_admin)):
+    """
+    Returns, per route, the average and largest number of SQL statements a
+    request ran and the average time spent in the database.
+    """
+    return querycount.stats()
+
+
+@app.get("/diagnostics/replicas")
+async def read_replica_stats(admin: schemas.UserWithGoals = Depends(auth.get_current_admin)):
+    """
+    Returns which read replicas are in rotation, how often reads went to a
+    replica and how often they fell back to the primary.
+    """
+    return replicas.replica_set.stats()
+
+
+@app.get("/diagnostics/ratings")
+async def read_rating_buffer_stats(admin: schemas.UserWithGoals = Depends(auth.get_current_admin)):
+    """
+    Returns the state of the write-behind rating buffer: ratings waiting to be
+    folded into the book aggregates, flush counts and the worst lag seen.
+    """
+    return rating_buffer.buffer.stats()
+
+
+@app.get("/diagnostics/covers")
+async def read_cover_stats(admin: schemas.UserWithGoals = Depends(auth.get_current_admin)):
+    """
+    Returns the size of the cover cache and its hit, fetch, resize and eviction counts.
+    """
+    return covers.cover_store.stats()
+
+
+@app.get("/diagnostics/ai")
+async def read_ai_stats(admin: schemas.UserWithGoals = Depends(auth.get_current_admin)):
+    """
+    Returns the state of the circuit breaker around the AI summary calls, and
+    how many calls were made, how many failed and how long they took.
+    """
+    return {"model_configured": ai.model is not None, "breaker": ai.breaker.stats(), "calls": ai.call_stats.stats()}
@@ -0,0 +1,267 @@
+# app/metrics.py
+import hmac
+import math
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from . import ai, cache, covers, pool, querycount, rating_buffer, singleflight, slowlog
+from .pool import Histogram
+
+# Metrics in the Prometheus text format, served by GET /metrics.
+#
+# Request metrics are collected by MetricsMiddleware; everything else is read from
+# the counters the other modules already keep (pool.py, cache.py, ai.py, ...) when
+# /metrics is scraped, so collecting them costs nothing on the request path.
+# Every worker process keeps its own numbers: scrape each worker, or run one
+# worker per container, and aggregate in Prometheus.
+
+load_dotenv()
+
+PREFIX = "nextread"
+
+# Bearer token scrapers must send to GET /metrics. The numbers describe the
+# deployment (routes, pool sizes, error rates), so without a token the endpoint is off.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Upper bounds (in seconds) of the request duration histogram buckets
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Requests that matched no route share one label, so random URLs can't create new series
+UNMATCHED_ROUTE = "<unmatched>"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def is_authorized(authorization: str | None) -> bool:
+    """
+    True if an Authorization header carries METRICS_TOKEN as its bearer token.
+    """
+    if not METRICS_TOKEN or not authorization:
+        return False
+    scheme, _, token = authorization.partition(" ")
+    # Constant-time, so the token can't be guessed from response times
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode())
+
+
+class RequestMetrics:
+    """
+    Per-route request durations and response counts, plus requests in flight.
+    Routes are labelled by their template (/books/{book_id}), not the actual path.
+    """
+
+    def __init__(self, buckets=REQUEST_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.durations = {}  # (method, route) -> Histogram
+        self.responses = {}  # (method, route, status) -> count
+        self.in_flight = 0
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finished(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            histogram = self.durations.get(key)
+            if histogram is None:
+                histogram = self.durations[key] = Histogram(self.buckets)
+            status_key = (method, route, status)
+            self.responses[status_key] = self.responses.get(status_key, 0) + 1
+        histogram.observe(seconds)
+
+
+request_metrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request from the moment it arrives until its response has
+    been sent, and counts responses by status code.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # if the app fails before starting a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        self.metrics.started()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router has stored the matched route in the scope by now
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            self.metrics.finished(scope["method"], route, status, time.perf_counter() - started)
+
+
+# --- Text Format ---
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value) -> str:
+    if value is None:
+        return "NaN"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsWriter:
+    """
+    Builds the exposition text. Samples are grouped by metric, each under one HELP
+    and TYPE line, whatever order the collectors write them in.
+    """
+
+    def __init__(self):
+        self._families = {}  # name -> lines, HELP and TYPE first
+
+    def _family(self, name: str, kind: str, help_text: str) -> list[str]:
+        lines = self._families.get(name)
+        if lines is None:
+            lines = self._families[name] = [f"# HELP {PREFIX}_{name} {help_text}", f"# TYPE {PREFIX}_{name} {kind}"]
+        return lines
+
+    def sample(self, kind: str, name: str, help_text: str, value, **labels):
+        self._family(name, kind, help_text).append(f"{PREFIX}_{name}{_labels(labels)} {_number(value)}")
+
+    def gauge(self, name: str, help_text: str, value, **labels):
+        self.sample("gauge", name, help_text, value, **labels)
+
+    def counter(self, name: str, help_text: str, value, **labels):
+        self.sample("counter", name, help_text, value, **labels)
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram, **labels):
+        lines = self._family(name, "histogram", help_text)
+        for bound, count in histogram.cumulative():
+            le = "+Inf" if math.isinf(bound) else f"{bound:g}"
+            lines.append(f"{PREFIX}_{name}_bucket{_labels({**labels, 'le': le})} {count}")
+        lines.append(f"{PREFIX}_{name}_sum{_labels(labels)} {_number(histogram.sum)}")
+        lines.append(f"{PREFIX}_{name}_count{_labels(labels)} {histogram.count}")
+
+    def text(self) -> str:
+        return "\n".join(line for lines in self._families.values() for line in lines) + "\n"
+
+
+# --- Collectors ---
+
+def _collect_requests(out: MetricsWriter):
+    out.gauge("http_requests_in_flight", "HTTP requests being handled right now.", request_metrics.in_flight)
+    with request_metrics._lock:
+        durations = sorted(request_metrics.durations.items())
+        responses = sorted(request_metrics.responses.items())
+    for (method, route), histogram in durations:
+        out.histogram("http_request_duration_seconds", "Time from receiving a request to sending its response.",
+                      histogram, method=method, route=route)
+    for (method, route, status), count in responses:
+        out.counter("http_responses_total", "HTTP responses sent, by status code.",
+                    count, method=method, route=route, status=status)
+
+
+def _collect_pools(out: MetricsWriter):
+    for name, engine in sorted(pool.engines.items()):
+        stats = pool.pool_stats(engine)
+        if "size" in stats:
+            out.gauge("db_pool_size", "Connections the pool keeps open.", stats["size"], engine=name)
+            out.gauge("db_pool_checked_out", "Connections in use.", stats["checked_out"], engine=name)
+            out.gauge("db_pool_checked_in", "Idle connections in the pool.", stats["checked_in"], engine=name)
+            out.gauge("db_pool_overflow", "Connections opened beyond the pool size.", stats["overflow"], engine=name)
+        pool_stats = getattr(engine.pool, "stats", None)
+        if pool_stats is not None:
+            out.counter("db_pool_timeouts_total", "Checkouts that gave up waiting for a connection.",
+                        pool_stats.timeouts, engine=name)
+            out.counter("db_pool_connect_errors_total", "Failed attempts to open a connection.",
+                        pool_stats.connect_errors, engine=name)
+            out.histogram("db_pool_wait_seconds", "Time spent waiting to check out a connection.",
+                          pool_stats.wait, engine=name)
+            out.histogram("db_pool_connect_seconds", "Time spent opening new connections.",
+                          pool_stats.connect, engine=name)
+
+
+def _collect_queries(out: MetricsWriter):
+    with querycount._route_lock:
+        totals = sorted((route, dict(values)) for route, values in querycount.route_stats.items())
+    for route, values in totals:
+        out.counter("db_statements_total", "SQL statements run by requests, by route.", values["queries"], route=route)
+        out.counter("db_statement_seconds_total", "Time requests spent running SQL statements, by route.",
+                    values["db_ms"] / 1000, route=route)
+
+
+def _collect_caches(out: MetricsWriter):
+    for name, stats in sorted(cache.stats().items()):
+        out.counter("cache_hits_total", "Cache lookups that found a live entry.", stats["hits"], cache=name)
+        out.counter("cache_misses_total", "Cache lookups that found nothing.", stats["misses"], cache=name)
+        out.gauge("cache_hit_ratio", "Share of cache lookups that were hits since startup.", stats["hit_ratio"], cache=name)
+        out.gauge("cache_entries", "Entries in the cache.", stats["size"], cache=name)
+    for name, stats in sorted(singleflight.stats().items()):
+        out.counter("singleflight_calls_total", "Calls made to a single-flight group.", stats["calls"], group=name)
+        out.counter("singleflight_executions_total", "Calls a single-flight group actually ran.",
+                    stats["executions"], group=name)
+    cover_stats = covers.cover_store.stats()
+    for result in ("hits", "fetches", "resizes", "evictions", "errors"):
+        out.counter("cover_cache_events_total", "Cover cache hits, fetches, resizes, evictions and errors.",
+                    cover_stats[result], event=result)
+    out.gauge("cover_cache_bytes", "Bytes used by the cover cache.", cover_stats["bytes"])
+
+
+def _collect_ai(out: MetricsWriter):
+    out.histogram("ai_call_duration_seconds", "Duration of AI summary calls.", ai.call_stats.latency)
+    out.counter("ai_call_failures_total", "AI summary calls that failed.", ai.call_stats.failures)
+    out.counter("ai_breaker_rejected_total", "AI summary calls refused by the open circuit breaker.",
+                ai.breaker.rejected)
+    for state in (ai.CircuitBreaker.CLOSED, ai.CircuitBreaker.OPEN, ai.CircuitBreaker.HALF_OPEN):
+        out.gauge("ai_breaker_state", "1 for the circuit breaker's current state.",
+                  int(ai.breaker.state == state), state=state)
+
+
+def _collect_ratings(out: MetricsWriter):
+    stats = rating_buffer.buffer.stats()
+    out.gauge("rating_buffer_pending", "Ratings waiting to be folded into book aggregates.", stats["pending_ratings"])
+    out.counter("rating_buffer_flushed_total", "Ratings folded into book aggregates by the buffer.",
+                stats["flushed_ratings"])
+    out.counter("rating_buffer_failures_total", "Rating buffer flushes that failed.", stats["failures"])
+
+
+def _collect_slow_queries(out: MetricsWriter):
+    stats = slowlog.stats()
+    out.counter("slow_queries_total", "Statements recorded in the slow query log.", stats["recorded"])
+    for result in ("explained", "explain_failures", "explain_skipped"):
+        out.counter("slow_query_plans_total", "Slow query plans captured, failed or skipped because the queue was full.",
+                    stats[result], result=result)
+
+
+COLLECTORS = [
+    _collect_requests, _collect_pools, _collect_queries, _collect_caches, _collect_ai, _collect_ratings,
+    _collect_slow_queries,
+]
+
+
+def render() -> str:
+    out = MetricsWriter()
+    for collect in COLLECTORS:
+        collect(out)
+    return out.text()
@@ -0,0 +1,118 @@
+# app/migrations.py
+import time
+
+from sqlalchemy import Column, Integer, String, Table, insert, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from . import database, models
+
+# Versioned schema changes. main.py applies the ones a database hasn't had yet at
+# startup; each runs in its own transaction and is recorded in schema_migrations.
+#
+# Migration 1 creates the tables as models.py declares them, like create_all did
+# before there were migrations. On a new database that already includes everything
+# the later migrations add, so they must skip what exists (checkfirst=True,
+# IF NOT EXISTS). Add new migrations at the end and never renumber old ones.
+
+schema_migrations = Table(
+    "schema_migrations", models.Base.metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", String, nullable=False),
+)
+
+# Key of the Postgres advisory lock held while migrating, so workers starting
+# together don't apply the same migration twice
+MIGRATION_LOCK_KEY = 724_1953
+
+# SQLite has no such lock: a process creating a table or index another one has just
+# created gets "already exists" and tries that migration again, up to this many times
+MIGRATION_ATTEMPTS = 5
+
+
+def _create_tables(conn):
+    models.Base.metadata.create_all(bind=conn)
+
+
+def _add_lookup_indexes(conn):
+    tables = (models.book_goals_table, models.Rating.__table__)
+    names = ("ix_book_goals_goal_id", "ix_ratings_user_id")
+    for index in (index for table in tables for index in table.indexes if index.name in names):
+        index.create(conn, checkfirst=True)
+
+
+def _drop_rating_order_index(conn):
+    # Added by migration 2 for the popular books order, but no query's plan used it
+    conn.execute(text("DROP INDEX IF EXISTS ix_books_rating_order"))
+
+
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "index book_goals by goal, ratings by user and books by rating", _add_lookup_indexes),
+    (3, "drop the unused books rating order index", _drop_rating_order_index),
+]
+
+
+def applied_versions(conn) -> set[int]:
+    return set(conn.scalars(select(schema_migrations.c.version)))
+
+
+def migrate(engine=None) -> list[int]:
+    """
+    Applies the migrations the database at `engine` (by default the primary)
+    hasn't had yet, oldest first. Returns the versions applied.
+    """
+    engine = engine if engine is not None else database.engine
+    postgres = engine.dialect.name == "postgresql"
+    applied = []
+    with engine.connect() as conn:
+        if postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            try:
+                schema_migrations.create(conn, checkfirst=True)
+            except OperationalError as e:
+                # Created by another process since the check (SQLite)
+                if "already exists" not in str(e):
+                    raise
+                conn.rollback()
+            done = applied_versions(conn)
+            conn.commit()
+            for version, name, apply in MIGRATIONS:
+                if version in done:
+                    continue
+                if _apply(conn, version, name, apply):
+                    print(f"Applied migration {version}: {name}")
+                    applied.append(version)
+        finally:
+            if postgres:
+                # A failed statement leaves the transaction aborted, and the unlock would
+                # fail too, hiding the original error
+                conn.rollback()
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                conn.commit()
+    return applied
+
+
+def _apply(conn, version: int, name: str, apply) -> bool:
+    """
+    Applies one migration and records it. Returns False if another process
+    applied it first.
+    """
+    for attempt in range(1, MIGRATION_ATTEMPTS + 1):
+        try:
+            with conn.begin():
+                apply(conn)
+                conn.execute(insert(schema_migrations).values(
+                    version=version, name=name, applied_at=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                ))
+            return True
+        except IntegrityError:
+            # Another process recorded it first (SQLite has no advisory lock)
+            return False
+        except OperationalError as e:
+            # Another process is applying it right now (SQLite): the next attempt's
+            # checkfirst skips what that process has created so far
+            if "already exists" not in str(e) or attempt == MIGRATION_ATTEMPTS:
+                raise
+            time.sleep(0.1 * attempt)
@@ -1,12 +1,14 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Table, Float, CheckConstraint, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Table, Float, CheckConstraint, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 
 # Junction table for the many-to-many relationship between books and goals
 book_goals_table = Table('book_goals', Base.metadata,
     Column('book_id', Integer, ForeignKey('books.id'), primary_key=True),
-    Column('goal_id', Integer, ForeignKey('goals.id'), primary_key=True)
+    Column('goal_id', Integer, ForeignKey('goals.id'), primary_key=True),
+    # The primary key starts with book_id; this one finds a goal's books
+    Index('ix_book_goals_goal_id', 'goal_id', 'book_id'),
 )
 
 # Junction table for the many-to-many relationship between users and goals
@@ -56,4 +58,19 @@ class Rating(Base):
     __table_args__ = (
         CheckConstraint('rating >= 1 AND rating <= 5', name='rating_check'),
         UniqueConstraint('book_id', 'user_id', name='_book_user_uc'),
-    )
\ No newline at end of file
+        # The unique constraint starts with book_id; this one finds a user's ratings
+        Index('ix_ratings_user_id', 'user_id'),
+    )
+
+
+# What `seed.py --incremental` last imported for each row of the catalog CSV, so the
+# next run can tell new, changed and unchanged rows apart without touching the books
+class CatalogImportState(Base):
+    __tablename__ = "catalog_import_state"
+    source_id = Column(Integer, primary_key=True)  # the CSV's book_id column
+    book_id = Column(Integer, ForeignKey("books.id"), nullable=False, unique=True)
+    row_hash = Column(String, nullable=False)
+    # The rating stats the CSV had for this book, so a changed row can adjust the
+    # book's stats by the difference instead of discarding ratings made in the app
+    source_average_rating = Column(Float)
+    source_ratings_count = Column(Integer)
@@ -0,0 +1,212 @@
+# app/pool.py
+import bisect
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+load_dotenv()
+
+# --- Pool Settings ---
+# These apply per engine, and every worker process has its own engines, so a
+# deployment opens up to workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# Seconds to wait for a free connection before giving up with a TimeoutError
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Connections older than this many seconds are replaced; -1 keeps them forever
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# Test each connection with a cheap round trip before handing it out, so connections
+# dropped by the server or a proxy are replaced instead of failing the request
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Upper bounds (in seconds) of the wait and connect time histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Every engine registered with register() is reported by stats(), keyed by name
+engines = {}
+
+
+class Histogram:
+    """
+    A thread-safe latency histogram with fixed buckets, plus count, sum and max.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def cumulative(self) -> list[tuple[float, int]]:
+        """
+        Returns (upper bound, observations <= bound) pairs, ending with (inf, count).
+        """
+        with self._lock:
+            counts = list(self._counts)
+        total, result = 0, []
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.sum / self.count * 1000, 3) if self.count else 0,
+            "max_ms": round(self.max * 1000, 3),
+            # Cumulative counts keyed by upper bound in seconds, as in Prometheus
+            "buckets": {("+Inf" if bound == float("inf") else f"{bound:g}"): count for bound, count in self.cumulative()},
+        }
+
+
+class PoolStats:
+    """
+    Counters collected by the instrumented pools below.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        self.connect_errors = 0
+        # Time spent in checkout, including opening a connection when the pool grows
+        self.wait = Histogram()
+        # Checkouts that opened a new connection (or replaced one that failed its pre-ping)
+        self.connect = Histogram()
+
+    def count_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def count_connect_error(self):
+        with self._lock:
+            self.connect_errors += 1
+
+
+def _mark_new_connection(dbapi_connection, connection_record):
+    # Pool "connect" event: tells the checkout below that it opened this connection
+    connection_record.info["new_connection"] = True
+
+
+class InstrumentedPoolMixin:
+    """
+    Times how long checkouts wait for a connection and how long opening new
+    connections takes, and counts checkout timeouts and failed connects.
+    Only uses the public pool API (connect(), recreate() and the "connect" event),
+    so it doesn't depend on SQLAlchemy internals.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.stats = PoolStats()
+        super().__init__(*args, **kwargs)
+        # A recreated pool inherits its predecessor's listeners
+        if _mark_new_connection not in self.dispatch.connect:
+            event.listen(self, "connect", _mark_new_connection)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep counting where we left off
+        new_pool = super().recreate()
+        new_pool.stats = self.stats
+        return new_pool
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.count_timeout()
+            raise
+        except Exception:
+            # Anything else raised by a checkout comes from opening a connection
+            self.stats.count_connect_error()
+            raise
+        elapsed = time.perf_counter() - started
+        self.stats.wait.observe(elapsed)
+        # A checkout that opens a connection doesn't wait for one first, so its
+        # time is the time the connect took
+        if connection.info.pop("new_connection", False):
+            self.stats.connect.observe(elapsed)
+        return connection
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """
+    Returns the pool arguments for create_engine() / create_async_engine().
+    In-memory SQLite databases keep SQLAlchemy's default pool, since every
+    connection to them would otherwise open a separate, empty database.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def register(name: str, engine):
+    """
+    Adds an engine (sync or async) to the ones reported by stats().
+    """
+    engines[name] = getattr(engine, "sync_engine", engine)
+
+
+def pool_stats(engine) -> dict:
+    pool = engine.pool
+    result = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        result.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "timeout_s": pool.timeout(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # Connections opened beyond `size`; negative while the pool is still filling up
+            "overflow": pool.overflow(),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        result.update({
+            "checkouts": stats.wait.count,
+            "timeouts": stats.timeouts,
+            "connects": stats.connect.count,
+            "connect_errors": stats.connect_errors,
+            "wait": stats.wait.stats(),
+            "connect": stats.connect.stats(),
+        })
+    return result
+
+
+def stats() -> dict:
+    """
+    Returns live pool numbers for every registered engine in this worker process.
+    """
+    return {
+        "pid": os.getpid(),
+        "engines": {name: pool_stats(engine) for name, engine in engines.items()},
+    }
@@ -0,0 +1,230 @@
+# app/querycount.py
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+load_dotenv()
+
+# --- Query Counting Settings ---
+# Adds X-DB-Query-Count and X-DB-Query-Time-Ms to every response
+QUERY_DEBUG_HEADERS = os.getenv("QUERY_DEBUG_HEADERS", "false").lower() in ("1", "true", "yes")
+# Requests running more statements than this are logged, unless their endpoint
+# declares its own budget with @query_budget
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", 10))
+# The same statement running this many times in one request is logged as a likely N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_N_PLUS_ONE_THRESHOLD", 5))
+# For tests: a request over its budget fails with a 500 instead of only being logged
+QUERY_BUDGET_STRICT = os.getenv("QUERY_BUDGET_STRICT", "false").lower() in ("1", "true", "yes")
+
+# Statements are counted for whatever QueryStats is current in the running context.
+# The engine event hooks below see it from any engine (sync, async, replicas): the
+# context follows AsyncSession.run_sync into its greenlet and run_in_threadpool
+# into its worker thread.
+_current = contextvars.ContextVar("query_stats", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised by assert_max_queries when the block ran more statements than allowed.
+    """
+
+
+class QueryStats:
+    """
+    Number of statements, time spent in the database and how often each statement
+    ran, for one request or one count_queries() block.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.seconds += seconds
+            self.statements[statement] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        """
+        Returns the statements that ran at least `threshold` times, most frequent first.
+        """
+        return [(statement, times) for statement, times in self.statements.most_common() if times >= threshold]
+
+
+# --- Engine Events ---
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get("query_started")
+    if stats is not None and started:
+        stats.record(statement, time.perf_counter() - started.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts the statements run inside the block:
+        with count_queries() as stats:
+            ...
+        print(stats.count, stats.seconds)
+    """
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def assert_max_queries(budget: int):
+    """
+    Like count_queries(), but raises QueryBudgetExceeded if the block ran more than `budget` statements.
+    """
+    with count_queries() as stats:
+        yield stats
+    if stats.count > budget:
+        raise QueryBudgetExceeded(describe(stats, budget))
+
+
+def query_budget(queries: int):
+    """
+    Declares how many statements an endpoint may run per request:
+        @app.get("/users/me")
+        @querycount.query_budget(2)
+        async def read_users_me(...):
+    """
+    def declare(endpoint):
+        endpoint.query_budget = queries
+        return endpoint
+    return declare
+
+
+def describe(stats: QueryStats, budget: int) -> str:
+    lines = [f"{stats.count} statements (budget {budget}) taking {stats.seconds * 1000:.1f} ms"]
+    for statement, times in stats.repeated():
+        lines.append(f"  possible N+1, ran {times}x: {' '.join(statement.split())[:300]}")
+    return "\n".join(lines)
+
+
+# --- Per-Route Totals ---
+
+route_stats = {}  # route path -> {"requests", "queries", "max_queries", "db_ms"}
+_route_lock = threading.Lock()
+
+
+def _record_route(route: str, stats: QueryStats):
+    with _route_lock:
+        totals = route_stats.setdefault(route, {"requests": 0, "queries": 0, "max_queries": 0, "db_ms": 0.0})
+        totals["requests"] += 1
+        totals["queries"] += stats.count
+        totals["max_queries"] = max(totals["max_queries"], stats.count)
+        totals["db_ms"] += stats.seconds * 1000
+
+
+def stats() -> dict:
+    with _route_lock:
+        return {
+            route: {
+                "requests": totals["requests"],
+                "avg_queries": round(totals["queries"] / totals["requests"], 2),
+                "max_queries": totals["max_queries"],
+                "avg_db_ms": round(totals["db_ms"] / totals["requests"], 2),
+            }
+            for route, totals in sorted(route_stats.items())
+        }
+
+
+# --- Middleware ---
+
+class QueryCountMiddleware:
+    """
+    Counts the statements each HTTP request runs and the time they take. Requests
+    over their endpoint's budget, or repeating a statement N_PLUS_ONE_THRESHOLD
+    times, are logged. With `headers` the numbers are added to the response, and
+    with `strict` a request over budget is answered with a 500 instead.
+
+    The numbers are taken when the response starts, so statements a streaming
+    response runs while sending its body are not included.
+    """
+
+    def __init__(self, app, headers: bool = QUERY_DEBUG_HEADERS, strict: bool = QUERY_BUDGET_STRICT,
+                 default_budget: int = QUERY_BUDGET):
+        self.app = app
+        self.headers = headers
+        self.strict = strict
+        self.default_budget = default_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+        replaced = False
+
+        async def send_with_counts(message):
+            nonlocal replaced
+            if message["type"] == "http.response.start":
+                # The router has stored the matched endpoint and route in the scope by now
+                budget = getattr(scope.get("endpoint"), "query_budget", self.default_budget)
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    _record_route(route, stats)
+                over_budget = stats.count > budget
+                if over_budget or stats.repeated():
+                    print(f"Queries in {scope['method']} {scope['path']}: {describe(stats, budget)}")
+                headers = [
+                    (b"x-db-query-count", str(stats.count).encode()),
+                    (b"x-db-query-time-ms", f"{stats.seconds * 1000:.2f}".encode()),
+                ] if self.headers else []
+                if over_budget and self.strict:
+                    replaced = True
+                    body = json.dumps({"detail": f"Query budget exceeded: {describe(stats, budget)}"}).encode()
+                    await send({
+                        "type": "http.response.start",
+                        "status": 500,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                        ] + headers,
+                    })
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                if headers:
+                    message["headers"] = list(message.get("headers", [])) + headers
+            elif replaced:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_counts)
+        finally:
+            _current.reset(token)
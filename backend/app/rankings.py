@@ -0,0 +1,160 @@
+# app/rankings.py
+import base64
+import bisect
+import heapq
+import json
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+# Books need at least this many ratings to be recommended
+MIN_RATINGS = 50
+
+# How old (in seconds) the rankings may get before the next read rebuilds them.
+# Ratings written through this process update them immediately.
+RANKINGS_MAX_AGE = int(os.getenv("RANKINGS_MAX_AGE", 600))
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """
+    Turns a cursor back into a ranking key. Raises ValueError if it is malformed.
+    """
+    try:
+        neg_rating, neg_count, book_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (float(neg_rating), int(neg_count), int(book_id))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class GoalRankings:
+    """
+    Keeps, for every goal, its books pre-sorted by average rating and then ratings count.
+
+    Each list holds ranking keys (-average_rating, -ratings_count, book_id), so plain
+    tuple ordering is the ranking order. Recommendations for a user with several goals
+    are a k-way merge of those lists, and the key of the last book on a page is the
+    cursor for the next page.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self._lists = {}  # goal_id -> sorted ranking keys
+        self._book_keys = {}  # book_id -> ranking key, for books with enough ratings
+        self._book_goals = {}  # book_id -> goal ids
+        self.built_at = None
+
+    @staticmethod
+    def _key(book_id, average_rating, ratings_count):
+        return (-(average_rating or 0.0), -(ratings_count or 0), book_id)
+
+    def build(self, rows):
+        """
+        Replaces all rankings with `rows` of (book_id, goal_id, average_rating, ratings_count).
+        """
+        lists, book_keys, book_goals = {}, {}, {}
+        for book_id, goal_id, average_rating, ratings_count in rows:
+            book_goals.setdefault(book_id, []).append(goal_id)
+            if (ratings_count or 0) >= MIN_RATINGS:
+                key = self._key(book_id, average_rating, ratings_count)
+                book_keys[book_id] = key
+                lists.setdefault(goal_id, []).append(key)
+        for keys in lists.values():
+            keys.sort()
+        with self._lock:
+            self._lists, self._book_keys, self._book_goals = lists, book_keys, book_goals
+            self.built_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        if self.built_at is None:
+            return True
+        return RANKINGS_MAX_AGE > 0 and time.monotonic() - self.built_at > RANKINGS_MAX_AGE
+
+    def ensure_built(self, db: Session):
+        """
+        Builds the rankings on first use and rebuilds them once older than RANKINGS_MAX_AGE.
+        While a rebuild is running, other requests keep reading the previous rankings.
+        """
+        if not self.is_stale():
+            return
+        if not self._rebuild_lock.acquire(blocking=self.built_at is None):
+            return
+        try:
+            if self.is_stale():
+                rows = (
+                    db.query(
+                        models.book_goals_table.c.book_id,
+                        models.book_goals_table.c.goal_id,
+                        models.Book.average_rating,
+                        models.Book.ratings_count,
+                    )
+                    .join(models.Book, models.Book.id == models.book_goals_table.c.book_id)
+                    .all()
+                )
+                self.build(rows)
+        finally:
+            self._rebuild_lock.release()
+
+    def refresh_book(self, book_id: int, average_rating: float | None, ratings_count: int | None):
+        """
+        Moves a book to its new position in each of its goals' lists, e.g. after a rating.
+        """
+        with self._lock:
+            if self.built_at is None:
+                return
+            old_key = self._book_keys.pop(book_id, None)
+            new_key = None
+            if (ratings_count or 0) >= MIN_RATINGS:
+                new_key = self._key(book_id, average_rating, ratings_count)
+                self._book_keys[book_id] = new_key
+            for goal_id in self._book_goals.get(book_id, ()):
+                keys = self._lists.setdefault(goal_id, [])
+                if old_key is not None:
+                    i = bisect.bisect_left(keys, old_key)
+                    if i < len(keys) and keys[i] == old_key:
+                        del keys[i]
+                if new_key is not None:
+                    bisect.insort(keys, new_key)
+
+    def page(self, goal_ids, limit: int, after: tuple | None = None) -> tuple[list[int], tuple | None]:
+        """
+        Returns (book ids, key of the last book) for the `limit` best-ranked books
+        in any of the goals, starting after the ranking key `after`.
+        The returned key is None when there are no more books.
+        """
+        with self._lock:
+            # Each list can contribute at most `limit` books to this page, so only
+            # those slices need merging.
+            slices = []
+            for goal_id in set(goal_ids):
+                keys = self._lists.get(goal_id)
+                if not keys:
+                    continue
+                start = bisect.bisect_right(keys, after) if after is not None else 0
+                slices.append(keys[start:start + limit + 1])
+
+        page_keys = []
+        for key in heapq.merge(*slices):
+            # A book in several goals shows up once per goal, always with the same key
+            if page_keys and page_keys[-1] == key:
+                continue
+            page_keys.append(key)
+            if len(page_keys) > limit:
+                break
+
+        has_more = len(page_keys) > limit
+        page_keys = page_keys[:limit]
+        last_key = page_keys[-1] if has_more else None
+        return [key[2] for key in page_keys], last_key
+
+
+# The process-wide rankings used by crud.get_recommendations_for_user
+goal_rankings = GoalRankings()
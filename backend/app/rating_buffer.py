@@ -0,0 +1,209 @@
+# app/rating_buffer.py
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from . import crud, models, rankings, search
+from .database import SessionLocal
+
+load_dotenv()
+
+# --- Write-Behind Settings ---
+# Off by default. When on, POST /books/{book_id}/rate stores the rating row right away
+# but folds it into the book's average_rating / ratings_count later, in batches, so a
+# book everyone is rating at once isn't updated (and row-locked) once per rating.
+RATING_WRITE_BEHIND = os.getenv("RATING_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+# Buffered ratings are flushed at least this often, which bounds how far the stored
+# aggregates can lag behind the ratings table while the database is healthy...
+RATING_FLUSH_INTERVAL_MS = int(os.getenv("RATING_FLUSH_INTERVAL_MS", 200))
+# ...and sooner once this many ratings are waiting
+RATING_FLUSH_MAX_RATINGS = int(os.getenv("RATING_FLUSH_MAX_RATINGS", 1000))
+# If flushes fail or fall behind and this many ratings pile up, new ratings go back to
+# updating the book directly until the backlog is written
+RATING_BUFFER_MAX_PENDING = int(os.getenv("RATING_BUFFER_MAX_PENDING", 50000))
+
+# Flush attempts on shutdown before giving up on what is left in the buffer
+DRAIN_ATTEMPTS = 3
+
+
+class RatingBuffer:
+    """
+    Collects per-book rating deltas (number of ratings, sum of ratings) in memory and
+    applies them to the books table in one batched UPDATE, from a background thread.
+
+    Only the aggregates are buffered: the rating rows themselves are committed before
+    add() is called, so nothing a user submitted is lost if the process dies. What a
+    crash can lose is the part of the aggregates not yet flushed.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RATING_WRITE_BEHIND,
+        flush_interval_ms: int = RATING_FLUSH_INTERVAL_MS,
+        max_ratings: int = RATING_FLUSH_MAX_RATINGS,
+        max_pending: int = RATING_BUFFER_MAX_PENDING,
+        session_factory=SessionLocal,
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_ratings = max_ratings
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+
+        self._deltas = {}  # book_id -> [ratings, sum of ratings]
+        self._pending = 0
+        self._oldest = None  # monotonic time of the oldest rating not yet flushed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+        self.flushes = 0
+        self.flushed_ratings = 0
+        self.failures = 0
+        self.last_flush_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def accepting(self) -> bool:
+        """
+        True when a new rating should go through the buffer.
+        """
+        return self.enabled and self._pending < self.max_pending
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="rating-buffer", daemon=True)
+            self._thread.start()
+
+    def add(self, book_id: int, rating: float):
+        """
+        Queues a committed rating for the book's aggregates.
+        """
+        self.start()
+        with self._lock:
+            delta = self._deltas.setdefault(book_id, [0, 0.0])
+            delta[0] += 1
+            delta[1] += rating
+            self._pending += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = self._pending >= self.max_ratings
+        if full:
+            self._wake.set()
+
+    def apply_pending(self, book: models.Book):
+        """
+        Adds the book's buffered ratings to its (detached) aggregates, so a response
+        can show them as they will be after the next flush.
+        """
+        with self._lock:
+            delta = self._deltas.get(book.id)
+            if delta is None:
+                return
+            count, total = delta
+        previous_count = book.ratings_count or 0
+        book.ratings_count = previous_count + count
+        book.average_rating = ((book.average_rating or 0) * previous_count + total) / book.ratings_count
+
+    def _take(self):
+        with self._lock:
+            deltas, oldest = self._deltas, self._oldest
+            self._deltas, self._pending, self._oldest = {}, 0, None
+        return deltas, oldest
+
+    def _restore(self, deltas: dict, oldest: float):
+        # Put a failed batch back, merged with whatever arrived in the meantime
+        with self._lock:
+            for book_id, (count, total) in deltas.items():
+                delta = self._deltas.setdefault(book_id, [0, 0.0])
+                delta[0] += count
+                delta[1] += total
+                self._pending += count
+            self._oldest = oldest if self._oldest is None else min(oldest, self._oldest)
+
+    def flush(self) -> int:
+        """
+        Writes every buffered delta in one transaction and returns the number of
+        ratings flushed. On failure the deltas stay buffered and the error is raised.
+        """
+        with self._flush_lock:
+            deltas, oldest = self._take()
+            if not deltas:
+                return 0
+
+            started = time.monotonic()
+            db = self.session_factory()
+            try:
+                updated = crud.apply_rating_deltas(db, deltas)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                self._restore(deltas, oldest)
+                self.failures += 1
+                print(f"Rating buffer flush failed, keeping {len(deltas)} books buffered: {type(e).__name__}: {e}")
+                raise
+            finally:
+                db.close()
+
+            # The new aggregates can change which books are popular, recommended or suggested first
+            for book_id, average_rating, ratings_count in updated:
+                rankings.goal_rankings.refresh_book(book_id, average_rating, ratings_count)
+                search.refresh_book(book_id, ratings_count)
+            crud.invalidate_popular_books()
+
+            flushed = sum(delta[0] for delta in deltas.values())
+            finished = time.monotonic()
+            self.flushes += 1
+            self.flushed_ratings += flushed
+            self.last_flush_ms = (finished - started) * 1000
+            self.max_lag_ms = max(self.max_lag_ms, (finished - oldest) * 1000)
+            return flushed
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass  # already printed; the deltas are retried on the next round
+
+    def stop(self, timeout: float = 10):
+        """
+        Stops the flusher thread and writes out whatever is still buffered.
+        """
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        for attempt in range(1, DRAIN_ATTEMPTS + 1):
+            try:
+                self.flush()
+                return
+            except Exception:
+                time.sleep(0.5 * attempt)
+        deltas, _ = self._take()
+        print(f"Rating buffer could not be drained; unflushed (book_id: [ratings, sum]): {deltas}")
+
+    def stats(self) -> dict:
+        oldest = self._oldest
+        return {
+            "enabled": self.enabled,
+            "pending_ratings": self._pending,
+            "pending_books": len(self._deltas),
+            "oldest_pending_ms": round((time.monotonic() - oldest) * 1000, 1) if oldest is not None else 0,
+            "flushes": self.flushes,
+            "flushed_ratings": self.flushed_ratings,
+            "failures": self.failures,
+            "last_flush_ms": round(self.last_flush_ms, 1),
+            "max_lag_ms": round(self.max_lag_ms, 1),
+        }
+
+
+buffer = RatingBuffer()
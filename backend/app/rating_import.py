@@ -0,0 +1,265 @@
+# app/rating_import.py
+import csv
+import json
+import os
+import time
+
+from sqlalchemy import bindparam, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import crud, models, rankings, search
+from .database import SessionLocal
+
+# Ratings written per transaction
+IMPORT_BATCH_SIZE = int(os.getenv("RATING_IMPORT_BATCH_SIZE", 5000))
+# How many bad lines are described in the report (all of them are counted)
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = ("ndjson", "csv")
+COLUMNS = ("user_id", "book_id", "rating")
+
+
+class RowParser:
+    """
+    Turns lines of NDJSON ({"user_id": 1, "book_id": 2, "rating": 4}) or CSV (with a
+    user_id,book_id,rating header, columns in any order) into (user_id, book_id, rating).
+    """
+
+    def __init__(self, fmt: str):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}, expected one of {', '.join(FORMATS)}")
+        self.fmt = fmt
+        self.header = None
+
+    def parse(self, line: str):
+        """
+        Returns the parsed row, or None for blank lines and the CSV header.
+        Raises ValueError for lines that can't be imported.
+        """
+        line = line.strip()
+        if not line:
+            return None
+        if self.fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"invalid JSON ({e.msg})")
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+        else:
+            values = next(csv.reader([line]))
+            if self.header is None:
+                self.header = [value.strip().lower() for value in values]
+                missing = [column for column in COLUMNS if column not in self.header]
+                if missing:
+                    raise ValueError(f"CSV header is missing {', '.join(missing)}")
+                return None
+            record = dict(zip(self.header, values))
+
+        try:
+            user_id, book_id, rating = int(record["user_id"]), int(record["book_id"]), float(record["rating"])
+        except KeyError as e:
+            raise ValueError(f"missing {e.args[0]}")
+        except (TypeError, ValueError):
+            raise ValueError("user_id and book_id must be integers and rating a number")
+        if not 1 <= rating <= 5:
+            raise ValueError("rating must be between 1 and 5")
+        return user_id, book_id, rating
+
+
+def _insert_statement(dialect_name: str):
+    # INSERT ... ON CONFLICT (book_id, user_id) DO NOTHING RETURNING book_id, user_id:
+    # a rating another transaction inserted first is left out of the returned rows
+    dialects = {"postgresql": postgresql, "sqlite": sqlite}
+    if dialect_name not in dialects:
+        raise NotImplementedError(f"Rating import does not support {dialect_name}")
+    table = models.Rating.__table__
+    return (
+        dialects[dialect_name].insert(table)
+        .on_conflict_do_nothing(index_elements=["book_id", "user_id"])
+        .returning(table.c.book_id, table.c.user_id)
+    )
+
+
+def _update_statement():
+    table = models.Rating.__table__
+    return (
+        update(table)
+        .where(table.c.book_id == bindparam("b_book_id"), table.c.user_id == bindparam("b_user_id"))
+        .values(rating=bindparam("b_rating"))
+    )
+
+
+def write_ratings(db, ratings: dict) -> dict:
+    """
+    Writes {(book_id, user_id): rating}, replacing a user's earlier rating of a book,
+    and returns {(book_id, user_id): old rating} for the ratings that were replaced.
+    The old values are read and replaced in the same transaction, with their rows
+    locked (FOR UPDATE) on Postgres, so a concurrent rating of the same book and
+    user can't change them in between. Does not commit.
+    """
+    previous = {}
+    pending = ratings
+    while pending:
+        existing = {
+            (book_id, user_id): rating
+            for book_id, user_id, rating in db.query(
+                models.Rating.book_id, models.Rating.user_id, models.Rating.rating
+            ).filter(tuple_(models.Rating.book_id, models.Rating.user_id).in_(list(pending))).with_for_update()
+        }
+        if existing:
+            db.execute(_update_statement(), [
+                {"b_book_id": book_id, "b_user_id": user_id, "b_rating": pending[(book_id, user_id)]}
+                for book_id, user_id in existing
+            ])
+            previous.update(existing)
+
+        new = [key for key in pending if key not in existing]
+        inserted = set()
+        if new:
+            inserted = set(db.execute(_insert_statement(db.get_bind().dialect.name), [
+                {"book_id": book_id, "user_id": user_id, "rating": pending[(book_id, user_id)]}
+                for book_id, user_id in new
+            ]).tuples())
+        # Rows someone else inserted after the SELECT: go round again to replace them
+        pending = {key: pending[key] for key in new if key not in inserted}
+    return previous
+
+
+class RatingImporter:
+    """
+    Imports ratings in batches of IMPORT_BATCH_SIZE, one transaction per batch.
+
+    Book aggregates are not touched per rating. Instead, each committed batch adds
+    to a per-book (new ratings, change in sum) delta, and finish() applies all of
+    them with one UPDATE per affected book. Re-ratings replace the old value, and
+    the delta accounts for the difference. Rows for unknown books or users, and
+    lines that can't be parsed, are skipped and reported.
+    """
+
+    def __init__(self, fmt: str, batch_size: int = IMPORT_BATCH_SIZE, session_factory=SessionLocal):
+        self.parser = RowParser(fmt)
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self._batch = []
+        self._deltas = {}  # book_id -> [ratings added, change in sum]
+        self.line_number = 0
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.superseded = 0
+        self.skipped = 0
+        self.errors = []
+        self.error_count = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def _error(self, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {self.line_number}: {message}")
+
+    def feed_lines(self, lines):
+        """
+        Parses lines and writes every full batch. Can be called repeatedly, e.g.
+        once per chunk of a request body.
+        """
+        for line in lines:
+            self.line_number += 1
+            try:
+                row = self.parser.parse(line)
+            except ValueError as e:
+                self._error(str(e))
+                continue
+            if row is None:
+                continue
+            self._batch.append(row)
+            if len(self._batch) >= self.batch_size:
+                self.write_batch()
+
+    def write_batch(self):
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        # Within a batch the last rating of a (book, user) pair wins
+        ratings = {(book_id, user_id): rating for user_id, book_id, rating in batch}
+        deduplicated = len(ratings)
+
+        db = self.session_factory()
+        try:
+            book_ids = {book_id for book_id, _ in ratings}
+            user_ids = {user_id for _, user_id in ratings}
+            known_books = {book_id for (book_id,) in db.query(models.Book.id).filter(models.Book.id.in_(book_ids))}
+            known_users = {user_id for (user_id,) in db.query(models.User.id).filter(models.User.id.in_(user_ids))}
+            ratings = {
+                key: rating for key, rating in ratings.items()
+                if key[0] in known_books and key[1] in known_users
+            }
+            # The earlier values of replaced ratings, so the aggregates can be corrected
+            previous = write_ratings(db, ratings)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        # Only count what was committed
+        self.rows += len(batch)
+        self.superseded += len(batch) - deduplicated
+        self.skipped += deduplicated - len(ratings)
+        for (book_id, user_id), rating in ratings.items():
+            delta = self._deltas.setdefault(book_id, [0, 0.0])
+            old = previous.get((book_id, user_id))
+            if old is None:
+                delta[0] += 1
+                delta[1] += rating
+                self.inserted += 1
+            else:
+                delta[1] += rating - old
+                self.updated += 1
+
+    def finish(self) -> dict:
+        """
+        Writes the last batch, applies the aggregate changes and returns the report.
+        The aggregates are applied even if the last batch fails, so they always
+        match the batches that were committed.
+        """
+        try:
+            self.write_batch()
+        finally:
+            self.apply_aggregates()
+            self.finished = time.perf_counter()
+        return self.report()
+
+    def apply_aggregates(self):
+        deltas, self._deltas = self._deltas, {}
+        if not deltas:
+            return
+        db = self.session_factory()
+        try:
+            updated = crud.apply_rating_deltas(db, deltas)
+            db.commit()
+        finally:
+            db.close()
+        for book_id, average_rating, ratings_count in updated:
+            rankings.goal_rankings.refresh_book(book_id, average_rating, ratings_count)
+            search.refresh_book(book_id, ratings_count)
+        crud.invalidate_popular_books()
+
+    def report(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            # Rows replaced by a later row for the same book and user in the same batch
+            "superseded": self.superseded,
+            # Rows for books or users that don't exist
+            "skipped": self.skipped,
+            "invalid_lines": self.error_count,
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else 0,
+        }
@@ -0,0 +1,178 @@
+# app/replicas.py
+import asyncio
+import itertools
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from fastapi import Depends
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from . import auth, pool
+from .cache import MISSING, TTLCache
+from .database import AsyncSessionLocal, to_async_url
+
+load_dotenv()
+
+# Comma-separated URLs of read replicas. Without any, reads go to the primary database.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# How often every replica is checked, and how long a check may take before it counts as failed
+REPLICA_HEALTH_CHECK_SECONDS = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", 10))
+REPLICA_HEALTH_CHECK_TIMEOUT = float(os.getenv("REPLICA_HEALTH_CHECK_TIMEOUT", 2))
+# After a user writes, their reads go to the primary for this many seconds, so they
+# see their own changes even while the replicas are catching up
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 10))
+
+# Errors that mean the replica can't be reached, when raised while connecting to it
+# or pinging it. Only caught there: from a query, an OperationalError can just as
+# well be about the query (a recovery conflict, a missing table).
+CONNECTION_ERRORS = (exc.OperationalError, exc.InterfaceError, OSError)
+
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine = create_async_engine(url, **pool.engine_options(url, is_async=True))
+        self.sessionmaker = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        self.healthy = True
+        self.failures = 0
+        self.last_error = None
+        self.last_checked = None
+        pool.register(name, self.engine)
+
+
+class ReplicaSet:
+    """
+    Hands out healthy read replicas in round-robin order.
+
+    A replica is taken out of rotation when a health check, or a request connecting
+    to it, fails to reach it, and put back once a health check passes again. When no
+    replica is healthy, pick() returns None and callers fall back to the primary.
+    """
+
+    def __init__(self, urls: list[str]):
+        self.replicas = [Replica(f"replica_{i}", to_async_url(url)) for i, url in enumerate(urls, start=1)]
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.picks = 0
+        self.primary_fallbacks = 0
+
+    def pick(self) -> Replica | None:
+        with self._lock:
+            healthy = [replica for replica in self.replicas if replica.healthy]
+            if not healthy:
+                if self.replicas:
+                    self.primary_fallbacks += 1
+                return None
+            self.picks += 1
+            return healthy[next(self._counter) % len(healthy)]
+
+    def mark_failed(self, replica: Replica, error: BaseException):
+        if replica.healthy:
+            print(f"Read replica {replica.name} taken out of rotation: {type(error).__name__}: {error}")
+        with self._lock:
+            replica.healthy = False
+            replica.failures += 1
+            replica.last_error = f"{type(error).__name__}: {error}"
+
+    def record_fallback(self):
+        """
+        Counts a read that was meant for a replica but went to the primary.
+        """
+        with self._lock:
+            self.primary_fallbacks += 1
+
+    async def check(self, replica: Replica):
+        try:
+            async with replica.engine.connect() as connection:
+                await asyncio.wait_for(connection.execute(text("SELECT 1")), REPLICA_HEALTH_CHECK_TIMEOUT)
+        except (asyncio.TimeoutError, *CONNECTION_ERRORS) as e:
+            self.mark_failed(replica, e)
+        else:
+            if not replica.healthy:
+                print(f"Read replica {replica.name} is healthy again.")
+            replica.healthy = True
+        replica.last_checked = time.time()
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def run_health_checks(self):
+        """
+        Checks every replica every REPLICA_HEALTH_CHECK_SECONDS until cancelled.
+        """
+        while True:
+            await self.check_all()
+            await asyncio.sleep(REPLICA_HEALTH_CHECK_SECONDS)
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> dict:
+        return {
+            "picks": self.picks,
+            "primary_fallbacks": self.primary_fallbacks,
+            "replicas": {
+                replica.name: {
+                    "healthy": replica.healthy,
+                    "failures": replica.failures,
+                    "last_error": replica.last_error,
+                    "last_checked": replica.last_checked,
+                }
+                for replica in self.replicas
+            },
+        }
+
+
+replica_set = ReplicaSet(DATABASE_REPLICA_URLS)
+
+
+# --- Read-Your-Writes ---
+
+# email -> True for users who wrote within the last READ_YOUR_WRITES_SECONDS
+recent_writers = TTLCache("recent_writers", ttl=READ_YOUR_WRITES_SECONDS, maxsize=100000)
+
+
+def record_write(email: str):
+    """
+    Sends the user's reads to the primary for the next READ_YOUR_WRITES_SECONDS.
+    Call this after committing a change the user will expect to see right away.
+    """
+    if replica_set.replicas:
+        recent_writers.set(email, True)
+
+
+def wrote_recently(email: str | None) -> bool:
+    return email is not None and recent_writers.get(email) is not MISSING
+
+
+# --- Dependencies ---
+
+async def get_read_db(token: str | None = Depends(auth.optional_oauth2_scheme)):
+    """
+    A database session for endpoints that only read. It is bound to a healthy read
+    replica, or to the primary when there is none or the logged-in user wrote
+    something recently. Writes belong on database.get_db.
+    """
+    replica = None
+    if replica_set.replicas and not (token and wrote_recently(auth.token_subject(token))):
+        replica = replica_set.pick()
+
+    if replica is not None:
+        async with replica.sessionmaker() as db:
+            try:
+                # Connect before handing the session out, so a replica that went down
+                # since its last health check sends this request to the primary
+                await db.connection()
+            except CONNECTION_ERRORS as e:
+                replica_set.mark_failed(replica, e)
+                replica_set.record_fallback()
+            else:
+                yield db
+                return
+
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -13,6 +13,16 @@ class Book(BaseModel):
     average_rating: float | None = None
     ratings_count: int | None = None
     user_rating: float | None = None
+    # True while an AI summary for this book is being generated in the background
+    summary_pending: bool = False
+
+
+# --- Autocomplete Schema ---
+class BookSuggestion(BaseModel):
+    id: int
+    title: str
+    author: str | None = None
+    ratings_count: int | None = None
 
 
 # --- Goal Schema ---
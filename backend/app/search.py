@@ -0,0 +1,483 @@
+# app/search.py
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import models
+
+# How old (in seconds) the index may get before the next search rebuilds it from the
+# database. Writes made through this process update the index immediately; the periodic
+# rebuild picks up changes made elsewhere, e.g. by running seed.py against the same DB.
+SEARCH_INDEX_MAX_AGE = int(os.getenv("SEARCH_INDEX_MAX_AGE", 600))
+
+# Relevance weights. A query word hitting a whole word in the title counts the most,
+# a prefix of an author word the least.
+TITLE_EXACT = 3.0
+TITLE_PREFIX = 2.0
+AUTHOR_EXACT = 1.5
+AUTHOR_PREFIX = 1.0
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str | None) -> list[str]:
+    """
+    Splits text into lowercase, accent-free words, e.g. "GrandPré" -> ["grandpre"].
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text.lower())
+
+
+class CatalogIndex:
+    """
+    Base class for the in-memory indexes over the books catalog.
+
+    Subclasses implement _reset(), _add(), _remove() and optionally _finish_build();
+    this class takes care of locking, (re)building from the database and
+    incremental updates.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self.built_at = None
+        self._missed = None  # changes made during a build, while one is running
+        self._reset()
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _add(self, book_id, title, author, ratings_count):
+        raise NotImplementedError
+
+    def _remove(self, book_id):
+        raise NotImplementedError
+
+    def _finish_build(self):
+        pass
+
+    def _rerank(self, book_id, ratings_count):
+        raise NotImplementedError
+
+    # --- Building & maintenance ---
+
+    def build(self, rows):
+        """
+        Replaces the whole index with `rows` of (id, title, author, ratings_count).
+        The new index is filled in separate structures without holding the lock and
+        swapped in at the end, so searches keep using the old one until then.
+        """
+        with self._lock:
+            # Changes made while the new index is filled are replayed onto it
+            if self._missed is None:
+                self._missed = []
+        fresh = object.__new__(type(self))
+        fresh._reset()
+        try:
+            fresh._fill(rows)
+        except BaseException:
+            self._stop_recording()
+            raise
+        with self._lock:
+            # Every structure _reset() creates is replaced at once
+            self.__dict__.update(fresh.__dict__)
+            missed, self._missed = self._missed, None
+            for change, args in missed:
+                change(*args)
+            self.built_at = time.monotonic()
+
+    def _stop_recording(self):
+        with self._lock:
+            self._missed = None
+
+    def _fill(self, rows):
+        for book_id, title, author, ratings_count in rows:
+            self._add(book_id, title, author, ratings_count)
+        self._finish_build()
+
+    def upsert(self, book_id: int, title: str, author: str | None, ratings_count: int | None):
+        """
+        Adds a book to the index, or re-indexes it if it is already there.
+        """
+        with self._lock:
+            self._remove(book_id)
+            self._add(book_id, title, author, ratings_count)
+            if self._missed is not None:
+                self._missed.append((self.upsert, (book_id, title, author, ratings_count)))
+
+    def remove(self, book_id: int):
+        with self._lock:
+            self._remove(book_id)
+            if self._missed is not None:
+                self._missed.append((self.remove, (book_id,)))
+
+    def rerank(self, book_id: int, ratings_count: int | None):
+        """
+        Moves a book to its place for a new ratings_count. Books not in the index are ignored.
+        """
+        with self._lock:
+            self._rerank(book_id, ratings_count)
+            if self._missed is not None:
+                self._missed.append((self.rerank, (book_id, ratings_count)))
+
+    def is_stale(self) -> bool:
+        if self.built_at is None:
+            return True
+        return SEARCH_INDEX_MAX_AGE > 0 and time.monotonic() - self.built_at > SEARCH_INDEX_MAX_AGE
+
+    def ensure_built(self, db: Session):
+        """
+        Builds the index from the database on first use, and rebuilds it once it is
+        older than SEARCH_INDEX_MAX_AGE. While a rebuild is running, other requests
+        keep using the previous index instead of waiting for it (see build()).
+        """
+        if not self.is_stale():
+            return
+        if not self._rebuild_lock.acquire(blocking=self.built_at is None):
+            return
+        try:
+            if self.is_stale():
+                with self._lock:
+                    # From before the query, so a change committed after it isn't lost
+                    self._missed = []
+                try:
+                    rows = db.query(
+                        models.Book.id, models.Book.title, models.Book.author, models.Book.ratings_count
+                    ).all()
+                except BaseException:
+                    self._stop_recording()
+                    raise
+                self.build(rows)
+        finally:
+            self._rebuild_lock.release()
+
+
+class SearchIndex(CatalogIndex):
+    """
+    An in-memory inverted index over book titles and authors.
+
+    Every word maps to the set of book IDs containing it, kept separately for titles
+    and authors so matches can be weighted by field. All query words must match
+    (AND); the last word is also matched as a prefix so results appear while the user
+    is still typing. Results are ranked by relevance, then by ratings_count.
+    """
+
+    def _reset(self):
+        self._docs = {}  # book_id -> (title words, author words)
+        self._order = {}  # book_id -> tie-break sort key, most rated first
+        self._title = {}  # word -> set of book ids
+        self._author = {}  # word -> set of book ids
+        self._terms = []  # sorted vocabulary, used for prefix lookups
+        self._terms_dirty = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _add(self, book_id, title, author, ratings_count):
+        title_words = tuple(set(tokenize(title)))
+        author_words = tuple(set(tokenize(author)))
+        self._docs[book_id] = (title_words, author_words)
+        self._order[book_id] = (-(ratings_count or 0), book_id)
+        for postings, words in ((self._title, title_words), (self._author, author_words)):
+            for word in words:
+                postings.setdefault(word, set()).add(book_id)
+                if not self._terms_dirty and not self._has_term(word):
+                    self._terms_dirty = True
+
+    def _remove(self, book_id):
+        doc = self._docs.pop(book_id, None)
+        if doc is None:
+            return
+        del self._order[book_id]
+        title_words, author_words = doc
+        for postings, words in ((self._title, title_words), (self._author, author_words)):
+            for word in words:
+                ids = postings.get(word)
+                if ids is not None:
+                    ids.discard(book_id)
+                    if not ids:
+                        del postings[word]
+        # Words with no postings left are harmless in the vocabulary; they are
+        # dropped on the next full build.
+
+    def _rerank(self, book_id, ratings_count):
+        if book_id in self._order:
+            self._order[book_id] = (-(ratings_count or 0), book_id)
+
+    def _finish_build(self):
+        self._terms = sorted(set(self._title) | set(self._author))
+        self._terms_dirty = False
+
+    # --- Querying ---
+
+    def _has_term(self, word: str) -> bool:
+        i = bisect.bisect_left(self._terms, word)
+        return i < len(self._terms) and self._terms[i] == word
+
+    def _expand(self, prefix: str) -> list[str]:
+        if self._terms_dirty:
+            self._terms = sorted(set(self._title) | set(self._author))
+            self._terms_dirty = False
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\U0010ffff")
+        return self._terms[start:end]
+
+    def _matches(self, word: str, as_prefix: bool) -> list[tuple[set, float]]:
+        """
+        Returns (book IDs, weight) groups for one query word, heaviest first.
+        """
+        title_exact = self._title.get(word, set())
+        author_exact = self._author.get(word, set())
+        groups = [(title_exact, TITLE_EXACT), (author_exact, AUTHOR_EXACT)]
+        if as_prefix:
+            longer = [term for term in self._expand(word) if term != word]
+            title_prefix = set().union(*(self._title.get(term, ()) for term in longer))
+            author_prefix = set().union(*(self._author.get(term, ()) for term in longer))
+            groups.insert(1, (title_prefix, TITLE_PREFIX))
+            groups.append((author_prefix, AUTHOR_PREFIX))
+        return groups
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> list[int]:
+        """
+        Returns one page of matching book IDs, best match first.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        with self._lock:
+            per_word = [
+                self._matches(word, as_prefix=(i == len(words) - 1))
+                for i, word in enumerate(words)
+            ]
+
+            # Narrow down to the books matching every word using set intersection,
+            # then score only those.
+            matching = [set().union(*(ids for ids, _ in groups)) for groups in per_word]
+            matching.sort(key=len)
+            candidates = matching[0].intersection(*matching[1:])
+            if not candidates:
+                return []
+
+            # Group the candidates into score tiers with set operations. Scores take
+            # only a handful of distinct values, so there are only a few tiers.
+            tiers = {0.0: candidates}
+            for groups in per_word:
+                next_tiers = {}
+                for total, ids in tiers.items():
+                    for hits, weight in groups:
+                        scored = ids & hits
+                        if scored:
+                            next_tiers.setdefault(total + weight, set()).update(scored)
+                        ids = ids - scored
+                tiers = next_tiers
+
+            # Rank tier by tier and stop as soon as the requested page is filled
+            wanted = offset + limit
+            ranked = []
+            for total in sorted(tiers, reverse=True):
+                ranked += heapq.nsmallest(wanted - len(ranked), tiers[total], key=self._order.__getitem__)
+                if len(ranked) >= wanted:
+                    break
+        return ranked[offset:wanted]
+
+
+class SuggestIndex(CatalogIndex):
+    """
+    A sorted array of normalized titles and author names for prefix autocomplete.
+
+    A prefix maps to a contiguous slice of the array, found with bisect, and the
+    most rated books in the slice are returned. Prefixes matching a large slice
+    (the first few keystrokes) keep a precomputed top list instead, which is
+    updated in place as books are added, re-rated or removed.
+    """
+
+    # Prefixes matching more entries than this get a precomputed top list
+    TOP_THRESHOLD = 500
+    # Length of each precomputed top list; requests may ask for up to half of it
+    TOP_SIZE = 40
+
+    _building = False
+
+    def _reset(self):
+        self._keys = []  # sorted (normalized key, book_id) pairs
+        self._books = {}  # book_id -> (title, author, ratings_count, keys)
+        self._rank = {}  # book_id -> sort key, most rated first
+        self._top = {}  # prefix -> book ids, most rated first
+
+    def __len__(self):
+        return len(self._books)
+
+    @staticmethod
+    def _keys_for(title, author):
+        keys = {" ".join(tokenize(title))}
+        for name in (author or "").split("/"):
+            words = tokenize(name)
+            if words:
+                keys.add(" ".join(words))
+                # Let people find an author by surname too, e.g. "row" -> "J.K. Rowling"
+                keys.add(words[-1])
+        keys.discard("")
+        return tuple(keys)
+
+    def _add(self, book_id, title, author, ratings_count):
+        keys = self._keys_for(title, author)
+        self._books[book_id] = (title, author, ratings_count or 0, keys)
+        self._rank[book_id] = (-(ratings_count or 0), book_id)
+        if self._building:
+            self._keys.extend((key, book_id) for key in keys)
+            return
+        for key in keys:
+            bisect.insort(self._keys, (key, book_id))
+        # Slot the book into every precomputed top list it now qualifies for
+        rank = self._rank
+        for prefix in self._prefixes_of(keys):
+            top = self._top.get(prefix)
+            if top is not None and book_id not in top:
+                bisect.insort(top, book_id, key=rank.__getitem__)
+                del top[self.TOP_SIZE:]
+
+    def _remove(self, book_id):
+        book = self._books.pop(book_id, None)
+        if book is None:
+            return
+        keys = book[3]
+        for key in keys:
+            i = bisect.bisect_left(self._keys, (key, book_id))
+            if i < len(self._keys) and self._keys[i] == (key, book_id):
+                del self._keys[i]
+        for prefix in self._prefixes_of(keys):
+            top = self._top.get(prefix)
+            if top is not None and book_id in top:
+                top.remove(book_id)
+                # A list that got too short may be missing books; recompute it lazily
+                if len(top) < self.TOP_SIZE // 2:
+                    del self._top[prefix]
+        del self._rank[book_id]
+
+    def _rerank(self, book_id, ratings_count):
+        book = self._books.get(book_id)
+        if book is not None and book[2] != (ratings_count or 0):
+            # Re-adding also moves the book within the precomputed top lists
+            self._remove(book_id)
+            self._add(book_id, book[0], book[1], ratings_count)
+
+    def _prefixes_of(self, keys):
+        prefixes = set()
+        for key in keys:
+            prefixes.update(key[:i] for i in range(1, len(key) + 1))
+        return prefixes & self._top.keys()
+
+    def _fill(self, rows):
+        # Appending everything and sorting once is much faster than sorted inserts
+        self._building = True
+        try:
+            super()._fill(rows)
+        finally:
+            self._building = False
+
+    def _finish_build(self):
+        self._keys.sort()
+        self._precompute("", 0, len(self._keys))
+
+    def _precompute(self, prefix, start, end):
+        """
+        Stores top lists for every prefix longer than `prefix` that matches more than
+        TOP_THRESHOLD entries of keys[start:end], which all start with `prefix`.
+        """
+        keys = self._keys
+        depth = len(prefix)
+        while start < end:
+            key = keys[start][0]
+            if len(key) <= depth:
+                start += 1
+                continue
+            child = key[: depth + 1]
+            child_end = bisect.bisect_left(keys, (child + "\U0010ffff",), start, end)
+            if child_end - start > self.TOP_THRESHOLD:
+                self._top[child] = self._top_of(start, child_end)
+                self._precompute(child, start, child_end)
+            start = child_end
+
+    def _top_of(self, start, end):
+        book_ids = {book_id for _, book_id in self._keys[start:end]}
+        return heapq.nsmallest(self.TOP_SIZE, book_ids, key=self._rank.__getitem__)
+
+    def suggest(self, prefix: str, limit: int = 8) -> list[tuple[int, str, str | None, int]]:
+        """
+        Returns up to `limit` (id, title, author, ratings_count) tuples for books whose
+        title or author starts with `prefix`, most rated first.
+        """
+        prefix = " ".join(tokenize(prefix))
+        if not prefix:
+            return []
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None or limit > len(top):
+                start = bisect.bisect_left(self._keys, (prefix,))
+                end = bisect.bisect_left(self._keys, (prefix + "\U0010ffff",))
+                top = self._top_of(start, end)
+                if end - start > self.TOP_THRESHOLD:
+                    self._top[prefix] = top
+            books = self._books
+            return [(book_id, *books[book_id][:3]) for book_id in top[:limit]]
+
+
+# The process-wide indexes used by crud.search_books and crud.suggest_books
+book_index = SearchIndex()
+suggest_index = SuggestIndex()
+
+
+# --- Keeping the indexes current ---
+# Books inserted, updated or deleted through an ORM session are collected at flush time
+# and applied to the indexes only once the transaction commits.
+
+@event.listens_for(Session, "after_flush")
+def _collect_book_changes(session, flush_context):
+    pending = session.info.setdefault("search_index_pending", {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, models.Book) and obj.id is not None:
+            pending[obj.id] = (obj.title, obj.author, obj.ratings_count)
+    for obj in session.deleted:
+        if isinstance(obj, models.Book) and obj.id is not None:
+            pending[obj.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_book_changes(session):
+    pending = session.info.pop("search_index_pending", None)
+    if not pending:
+        return
+    for index in (book_index, suggest_index):
+        if index.built_at is None:
+            continue
+        for book_id, values in pending.items():
+            if values is None:
+                index.remove(book_id)
+            else:
+                index.upsert(book_id, *values)
+
+
+def refresh_book(book_id: int, ratings_count: int | None):
+    """
+    Re-ranks a book in both indexes after its ratings_count changed. Call this
+    wherever the count is updated with a bulk UPDATE, which the ORM events above
+    don't see.
+    """
+    for index in (book_index, suggest_index):
+        if index.built_at is not None:
+            index.rerank(book_id, ratings_count)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_book_changes(session):
+    session.info.pop("search_index_pending", None)
@@ -0,0 +1,86 @@
+# app/singleflight.py
+import threading
+from concurrent.futures import Executor, Future
+
+# Every group registers itself here by name, so its counters can be reported
+groups = {}
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one.
+
+    The first caller for a key starts the work; callers arriving while it is still
+    running get the same Future instead of starting the work again. Once the work
+    finishes, the key is forgotten and the next call starts fresh.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> Future
+        self.calls = 0
+        self.executions = 0
+        groups[name] = self
+
+    def submit(self, key, executor: Executor, fn, *args, **kwargs) -> Future:
+        """
+        Runs fn(*args, **kwargs) on `executor` unless a call for `key` is already
+        in flight, and returns the Future of whichever call does the work.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            future = executor.submit(fn, *args, **kwargs)
+            self.executions += 1
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def claim(self, key) -> tuple[Future, bool]:
+        """
+        For work the caller does itself rather than on an executor, e.g. while
+        streaming its result. Returns (future, True) with a new Future registered
+        for `key`, which the caller must resolve with set_result() or
+        set_exception() when done, or (future, False) if a call for `key` is
+        already in flight.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self.executions += 1
+            self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future, True
+
+    def get(self, key) -> Future | None:
+        """
+        Returns the Future of the call in flight for `key`, if there is one.
+        """
+        with self._lock:
+            return self._in_flight.get(key)
+
+    def _forget(self, key, future: Future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "deduplicated": self.calls - self.executions,
+            "in_flight": len(self._in_flight),
+        }
+
+
+def stats() -> dict:
+    """
+    Returns the counters of every registered group, keyed by group name.
+    """
+    return {name: group.stats() for name, group in groups.items()}
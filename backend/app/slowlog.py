@@ -0,0 +1,322 @@
+# app/slowlog.py
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging import INFO, Formatter, getLogger
+from logging.handlers import RotatingFileHandler
+
+from dotenv import load_dotenv
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from .cache import MISSING, TTLCache
+
+load_dotenv()
+
+# --- Slow Query Log Settings ---
+# Off by default; with it on, every statement is timed by the engine event hooks below
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "false").lower() in ("1", "true", "yes")
+# Statements taking at least this long are recorded
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_QUERY_LOG_PATH = os.getenv("SLOW_QUERY_LOG_PATH", "logs/slow_queries.jsonl")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", 5 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", 3))
+# Capture the plan of slow statements with EXPLAIN (EXPLAIN ANALYZE for SELECTs on Postgres)
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() in ("1", "true", "yes")
+# The same statement is explained again at most this often; records in between reuse the plan
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", 300))
+# Plans waiting to be captured; slow statements beyond this are recorded without one
+SLOW_QUERY_EXPLAIN_QUEUE = int(os.getenv("SLOW_QUERY_EXPLAIN_QUEUE", 20))
+# Postgres cancels an EXPLAIN ANALYZE running longer than this
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", 10_000))
+
+# Bound parameters with these words in their name are written as "***"
+REDACTED_PARAMETERS = ("password", "token", "secret")
+# Longer parameter values are cut short in the log
+MAX_PARAMETER_LENGTH = 200
+
+# Modules skipped when looking for the code that ran a statement
+_OWN_MODULES = {"app.slowlog", "app.querycount", "app.database", "app.pool"}
+
+# statement text -> plan (or the error that prevented one) from a recent EXPLAIN
+recent_plans = TTLCache("slow_query_plans", ttl=SLOW_QUERY_EXPLAIN_INTERVAL, maxsize=500)
+
+_executor: ThreadPoolExecutor | None = None
+_pending_plans = 0
+_lock = threading.Lock()
+_logger = None
+_enabled = False
+
+counters = {"recorded": 0, "explained": 0, "explain_failures": 0, "explain_skipped": 0}
+
+
+# --- EXPLAIN ---
+
+# How each database is asked for a plan; SELECTs on Postgres are also run (ANALYZE)
+EXPLAIN_PREFIXES = {"postgresql": "EXPLAIN ", "sqlite": "EXPLAIN QUERY PLAN "}
+EXPLAIN_ANALYZE_PREFIXES = {"postgresql": "EXPLAIN (ANALYZE, BUFFERS) "}
+
+
+def _format_plan(dialect: str, rows) -> str:
+    if dialect != "sqlite":
+        return "\n".join(str(row[0]) for row in rows)
+    # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail); indent by depth
+    depth = {0: -1}
+    lines = []
+    for row_id, parent, _, detail in rows:
+        depth[row_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[row_id] + detail)
+    return "\n".join(lines)
+
+
+def explain(statement, parameters: dict | None = None, engine=None) -> str:
+    """
+    Returns the plan of `statement` (a SQLAlchemy statement) on `engine`, by
+    default the primary database, with `parameters` (by bind name) filling in
+    values the statement doesn't carry itself. SELECTs are run with EXPLAIN ANALYZE
+    on Postgres; everything runs in a transaction that is rolled back, so nothing
+    is changed.
+    """
+    if engine is None:
+        from .database import engine  # not at the top: database.py isn't needed to time statements
+
+    dialect = engine.dialect
+    parameters = parameters or {}
+    # Compiled for the primary's driver, whichever driver ran it (asyncpg, a replica, ...)
+    compiled = statement.compile(
+        dialect=dialect,
+        # An INSERT or UPDATE from the ORM only sets the columns it was given values for
+        column_keys=list(parameters) if statement.is_dml else None,
+    )
+    # Renders IN (...) lists out, with their values from the statement itself
+    expanded = compiled.construct_expanded_state(parameters)
+    values = expanded.positional_parameters if compiled.positional else expanded.parameters
+    analyze = getattr(statement, "is_select", False) and dialect.name in EXPLAIN_ANALYZE_PREFIXES
+    prefix = (EXPLAIN_ANALYZE_PREFIXES if analyze else EXPLAIN_PREFIXES).get(dialect.name, "EXPLAIN ")
+
+    # Statements run here are not timed themselves (see _after_cursor_execute)
+    with engine.connect().execution_options(slowlog=False) as conn:
+        with conn.begin() as transaction:
+            if dialect.name == "postgresql":
+                conn.execute(text(f"SET LOCAL statement_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}"))
+            rows = conn.exec_driver_sql(prefix + expanded.statement, values).all()
+            transaction.rollback()
+    return _format_plan(dialect.name, rows)
+
+
+def _capture_plan(statement, parameters: dict, record: dict):
+    global _pending_plans
+    try:
+        record["plan"] = explain(statement, parameters)
+    except Exception as e:
+        record["plan_error"] = f"{type(e).__name__}: {e}"[:500]
+    with _lock:
+        _pending_plans -= 1
+        counters["explain_failures" if "plan_error" in record else "explained"] += 1
+    recent_plans.set(record["statement"], {key: record[key] for key in ("plan", "plan_error") if key in record})
+    _write(record)
+
+
+def _schedule_plan(statement, parameters: dict, record: dict) -> bool:
+    global _executor, _pending_plans
+    with _lock:
+        if _pending_plans >= SLOW_QUERY_EXPLAIN_QUEUE:
+            counters["explain_skipped"] += 1
+            return False
+        _pending_plans += 1
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slowlog")
+        executor = _executor
+    executor.submit(_capture_plan, statement, parameters, record)
+    return True
+
+
+# --- Records ---
+
+def _caller() -> str | None:
+    """
+    The crud function that ran the current statement, or failing that the
+    innermost function of the app, as "module.function".
+    """
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        # Comprehensions (<listcomp>, ...) count as the function they are in
+        if module == "app.crud" and not frame.f_code.co_name.startswith("<"):
+            return f"crud.{frame.f_code.co_name}"
+        if fallback is None and module.startswith("app.") and module not in _OWN_MODULES:
+            fallback = f"{module[len('app.'):]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return fallback
+
+
+def _parameter(name, value):
+    if isinstance(name, str) and any(word in name.lower() for word in REDACTED_PARAMETERS):
+        return "***"
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, (list, tuple)):
+        return [_parameter(name, item) for item in value]
+    if isinstance(value, str) and len(value) > MAX_PARAMETER_LENGTH:
+        return value[:MAX_PARAMETER_LENGTH] + "..."
+    if value is None or isinstance(value, (int, float, bool, str)):
+        return value
+    return str(value)[:MAX_PARAMETER_LENGTH]
+
+
+def _parameters(context, parameters, executemany: bool):
+    if executemany:
+        return f"<{len(parameters)} parameter sets>"
+    # The compiled parameters carry the bind names, which the driver's may not (e.g. asyncpg's $1)
+    named = getattr(context, "compiled_parameters", None)
+    if named:
+        return {name: _parameter(name, value) for name, value in named[0].items()}
+    if isinstance(parameters, dict):
+        return {name: _parameter(name, value) for name, value in parameters.items()}
+    return [_parameter(None, value) for value in parameters or ()]
+
+
+def _write(record: dict):
+    line = json.dumps(record, default=str)
+    if _logger is not None:
+        _logger.info(line)
+    print(f"Slow query ({record['duration_ms']} ms) in {record['function'] or 'unknown code'}: "
+          f"{' '.join(record['statement'].split())[:200]}")
+
+
+# --- Engine Events ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slowlog_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("slowlog_started")
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    if seconds * 1000 < SLOW_QUERY_MS or not conn.get_execution_options().get("slowlog", True):
+        return
+
+    record = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "duration_ms": round(seconds * 1000, 2),
+        "function": _caller(),
+        "database": conn.engine.url.render_as_string(hide_password=True),
+        "statement": statement,
+        "parameters": _parameters(context, parameters, executemany),
+    }
+    with _lock:
+        counters["recorded"] += 1
+
+    statement_object = getattr(context, "invoked_statement", None)
+    if not SLOW_QUERY_EXPLAIN or executemany or statement_object is None or not context.compiled_parameters:
+        _write(record)
+        return
+    plan = recent_plans.get(statement)
+    if plan is not MISSING:
+        record.update(plan, plan_reused=True)
+        _write(record)
+    elif not _schedule_plan(statement_object, dict(context.compiled_parameters[0]), record):
+        _write(record)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("slowlog_started"):
+        connection.info["slowlog_started"].pop()
+
+
+def enable():
+    """
+    Starts timing every statement on every engine and recording the slow ones
+    in SLOW_QUERY_LOG_PATH. Called on import when SLOW_QUERY_LOG is set.
+    """
+    global _enabled, _logger
+    if _enabled:
+        return
+    directory = os.path.dirname(SLOW_QUERY_LOG_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    _logger = getLogger("nextread.slowlog")
+    _logger.setLevel(INFO)
+    _logger.propagate = False
+    handler = RotatingFileHandler(SLOW_QUERY_LOG_PATH, maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+                                  backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+    handler.setFormatter(Formatter("%(message)s"))
+    _logger.addHandler(handler)
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _enabled = True
+    print(f"Slow query log on: statements over {SLOW_QUERY_MS:g} ms go to {SLOW_QUERY_LOG_PATH}")
+
+
+def shutdown():
+    """
+    Drops the plans still waiting to be captured and stops the EXPLAIN worker.
+    """
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# --- Reading the Log ---
+
+def _log_files() -> list[str]:
+    # Newest first: the live file, then .1, .2, ...
+    paths = [SLOW_QUERY_LOG_PATH] + [f"{SLOW_QUERY_LOG_PATH}.{n}" for n in range(1, SLOW_QUERY_LOG_BACKUPS + 1)]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def read_records(limit: int = 50, function: str | None = None, min_ms: float = 0, search: str | None = None) -> list[dict]:
+    """
+    Returns the newest records in the log files, newest first, optionally only
+    those from `function` (e.g. "crud.get_popular_books"), taking at least
+    `min_ms`, or whose statement contains `search`.
+    """
+    records = []
+    for path in _log_files():
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+        for line in reversed(lines):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short while being written
+            if function and record.get("function") != function:
+                continue
+            if record.get("duration_ms", 0) < min_ms:
+                continue
+            if search and search.lower() not in record.get("statement", "").lower():
+                continue
+            records.append(record)
+            if len(records) >= limit:
+                return records
+    return records
+
+
+def stats() -> dict:
+    with _lock:
+        pending = _pending_plans
+        totals = dict(counters)
+    return {
+        "enabled": _enabled,
+        "threshold_ms": SLOW_QUERY_MS,
+        "explain": SLOW_QUERY_EXPLAIN,
+        "path": SLOW_QUERY_LOG_PATH,
+        "pending_plans": pending,
+        **totals,
+    }
+
+
+if SLOW_QUERY_LOG:
+    enable()
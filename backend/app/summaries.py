@@ -0,0 +1,226 @@
+# app/summaries.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from . import ai, crud
+from .cache import MISSING, TTLCache
+from .database import SessionLocal
+from .singleflight import SingleFlight
+
+# The description seed.py stores for books that still need an AI summary
+NO_DESCRIPTION = "No description available."
+
+# Shown in place of the description while the summary is being generated
+SUMMARY_PENDING = "A summary for this book is being written. Check back in a moment."
+
+# Number of summaries generated at the same time by the default worker pool
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 4))
+
+# How long GET /books/{book_id} waits for a summary before answering with the
+# pending placeholder. 0 means never wait.
+SUMMARY_WAIT_SECONDS = float(os.getenv("SUMMARY_WAIT_SECONDS", 0))
+
+_executor: Executor | None = None
+
+# Concurrent requests for the same book share one generation
+summary_flights = SingleFlight("book_summaries")
+
+# After a failed generation a book is not retried for a while, doubling the wait
+# after each further failure (FAILURE_BACKOFF_SECONDS, 2x, 4x, ... up to the max).
+FAILURE_BACKOFF_SECONDS = float(os.getenv("SUMMARY_FAILURE_BACKOFF_SECONDS", 60))
+FAILURE_BACKOFF_MAX_SECONDS = float(os.getenv("SUMMARY_FAILURE_BACKOFF_MAX_SECONDS", 3600))
+
+# book_id -> (failures so far, monotonic time of the next allowed attempt).
+# Entries outlive their backoff so the failure count keeps growing on repeat failures.
+failed_summaries = TTLCache("failed_summaries", ttl=2 * FAILURE_BACKOFF_MAX_SECONDS, maxsize=10000)
+_failures_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    """
+    Returns the worker pool summaries run on, creating the default thread pool on first use.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+    return _executor
+
+
+def set_executor(executor: Executor):
+    """
+    Replaces the worker pool, e.g. with a process pool or a single-threaded one in tests.
+    The previous pool is shut down without waiting.
+    """
+    global _executor
+    if _executor is not None and _executor is not executor:
+        _executor.shutdown(wait=False)
+    _executor = executor
+
+
+def shutdown(wait: bool = True):
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+
+
+def needs_summary(description: str | None) -> bool:
+    return description == NO_DESCRIPTION
+
+
+def record_failure(book_id: int):
+    """
+    Counts a failed generation for the book and starts its backoff. Only for errors
+    from the model itself: a call the circuit breaker refused says nothing about the book.
+    """
+    # Under a lock, so two workers failing at once both count
+    with _failures_lock:
+        entry = failed_summaries.get(book_id)
+        failures = 1 if entry is MISSING else entry[0] + 1
+        backoff = min(FAILURE_BACKOFF_SECONDS * 2 ** (failures - 1), FAILURE_BACKOFF_MAX_SECONDS)
+        failed_summaries.set(book_id, (failures, time.monotonic() + backoff), ttl=2 * backoff)
+
+
+def can_generate(book_id: int) -> bool:
+    """
+    False when generating a summary for this book now would be wasted: the AI is
+    unavailable or its circuit breaker is open, or this book failed recently and
+    is still backing off.
+    """
+    if not ai.is_available():
+        return False
+    entry = failed_summaries.get(book_id)
+    return entry is MISSING or time.monotonic() >= entry[1]
+
+
+def generate_and_store(book_id: int, title: str, author: str) -> str | None:
+    """
+    Generates a summary for a book and saves it as the book's description.
+    Returns the saved description, or None if generation failed.
+    Runs on the worker pool with its own database session.
+    """
+    db = SessionLocal()
+    try:
+        # Another worker may have finished this book since it was scheduled
+        book = crud.get_book_by_id(db, book_id=book_id)
+        if book is None:
+            return None
+        if not needs_summary(book.description):
+            return book.description
+
+        print(f"Generating new summary for '{title}'...")
+        summary = ai.generate_book_summary(title=title, author=author)
+        if not summary or summary in ai.ERROR_MESSAGES:
+            if summary in ("", ai.GENERATION_FAILED):
+                record_failure(book_id)
+            return None
+
+        crud.update_book_description(db, book_id=book_id, description=summary)
+        failed_summaries.invalidate(book_id)
+        return summary
+    finally:
+        db.close()
+
+
+def _generate_logged(book_id: int, title: str, author: str) -> str | None:
+    # Exceptions on the worker pool are only stored on the Future, so print them here
+    try:
+        return generate_and_store(book_id, title, author)
+    except Exception as e:
+        print(f"Summary generation for book {book_id} failed: {type(e).__name__}: {e}")
+        raise
+
+
+def schedule_summary(book_id: int, title: str, author: str) -> Future:
+    """
+    Queues summary generation for a book on the worker pool and returns right away.
+    If the book's summary is already being generated, returns that generation's
+    Future instead of starting another one.
+    """
+    return summary_flights.submit(book_id, get_executor(), _generate_logged, book_id, title, author)
+
+
+def wait_for_summary(future: Future, timeout: float) -> str | None:
+    """
+    Waits up to `timeout` seconds for a scheduled summary.
+    Returns it, or None if it is not ready yet or generation failed.
+    """
+    if timeout <= 0 and not future.done():
+        return None
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        return None
+    except Exception:
+        # Already printed by _generate_logged
+        return None
+
+
+async def wait_for_summary_async(future: Future, timeout: float) -> str | None:
+    """
+    Same as wait_for_summary(), but waits without blocking the event loop.
+    """
+    if timeout <= 0 or future.done():
+        return wait_for_summary(future, timeout=0)
+    try:
+        # shield() keeps the generation running when the wait times out
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout=timeout)
+    except asyncio.TimeoutError:
+        return None
+    except Exception:
+        # Already printed by _generate_logged
+        return None
+
+
+def stream_summary(book_id: int, title: str, author: str):
+    """
+    Yields a book's summary in pieces as the model writes it, then saves the
+    assembled text as the book's description.
+    The stream is registered in summary_flights while it runs, so other streams,
+    page views and background generations for the book wait for it instead of
+    starting their own. If the summary is already being generated, waits for that
+    instead and yields it in one piece. Raises ai.SummaryUnavailable on failure.
+    """
+    flight, owner = summary_flights.claim(book_id)
+    if not owner:
+        summary = wait_for_summary(flight, timeout=ai.AI_TIMEOUT_SECONDS)
+        if not summary:
+            raise ai.SummaryUnavailable(ai.GENERATION_FAILED)
+        yield summary
+        return
+
+    # Resolved in the finally below with the saved summary, or None like a failed
+    # background generation; also when the client disconnects part-way
+    summary = None
+    try:
+        pieces = []
+        try:
+            for piece in ai.stream_book_summary(title=title, author=author):
+                pieces.append(piece)
+                yield piece
+        except ai.SummaryUnavailable as e:
+            if str(e) == ai.GENERATION_FAILED:
+                record_failure(book_id)
+            raise
+
+        assembled = ai.clean_summary("".join(pieces))
+        if not assembled:
+            record_failure(book_id)
+            raise ai.SummaryUnavailable(ai.GENERATION_FAILED)
+
+        db = SessionLocal()
+        try:
+            # The description may have been set since the stream started, e.g. by the backfill
+            book = crud.get_book_by_id(db, book_id=book_id)
+            if book is not None and needs_summary(book.description):
+                crud.update_book_description(db, book_id=book_id, description=assembled)
+            failed_summaries.invalidate(book_id)
+        finally:
+            db.close()
+        summary = assembled
+    finally:
+        flight.set_result(summary)
@@ -0,0 +1,257 @@
+"""
+Generates AI summaries for every book that still has no description, so the
+catalog can be warmed up before a launch instead of on first page view.
+
+Usage (from the backend folder):
+    python backfill_summaries.py
+    python backfill_summaries.py --concurrency 8 --rpm 120 --batch-size 50
+    python backfill_summaries.py --fake          # use the local stub model
+
+The script can be stopped and started again at any time: it only picks up books
+whose description is still "No description available.", and saved summaries are
+committed every --batch-size books. Books that still fail after --retries attempts
+are written to the checkpoint file and skipped on later runs unless --retry-failed
+is given. While the AI circuit breaker is open (the API keeps failing) the
+backfill pauses instead of using up the books' attempts. If the breaker opens
+--max-outages times in a row without a single summary working in between (e.g.
+a revoked API key), the backfill gives up: books in flight are written to the
+checkpoint as failed and the rest are left for the next run.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, update
+
+from app import ai, models
+from app.database import SessionLocal
+from app.ratelimit import TokenBucket
+from app.summaries import NO_DESCRIPTION
+
+load_dotenv()
+
+CHECKPOINT_PATH = 'data/backfill_failed.json'
+
+# How often a paused worker checks whether the circuit breaker lets calls through again
+BREAKER_POLL_SECONDS = 1.0
+
+
+def load_failed_ids(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f))
+
+
+def save_failed_ids(path, failed_ids):
+    # Write to a temporary file first so a crash never leaves a half-written checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(sorted(failed_ids), f)
+    os.replace(tmp_path, path)
+
+
+def books_to_summarize(page_size=500, skip_ids=frozenset()):
+    """
+    Yields (id, title, author) for books that still need a summary, in id order.
+    Reads one page at a time so huge catalogs don't have to fit in memory.
+    """
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(models.Book.id, models.Book.title, models.Book.author)
+                .filter(models.Book.description == NO_DESCRIPTION, models.Book.id > last_id)
+                .order_by(models.Book.id)
+                .limit(page_size)
+                .all()
+            )
+        finally:
+            db.close()
+        if not rows:
+            return
+        for row in rows:
+            if row.id not in skip_ids:
+                yield row
+        last_id = rows[-1].id
+
+
+def wait_for_breaker():
+    """
+    Blocks while the AI circuit breaker is refusing calls.
+    """
+    if not ai.breaker.is_open():
+        return
+    print("AI service is failing (circuit breaker open); pausing until it recovers...")
+    while ai.breaker.is_open():
+        time.sleep(BREAKER_POLL_SECONDS)
+
+
+class OutageLimit:
+    """
+    Counts how often the circuit breaker has opened since the last summary that
+    worked, across all workers. An API that never recovers would otherwise keep
+    the backfill pausing and probing forever.
+    """
+
+    def __init__(self, max_outages):
+        self.max_outages = max_outages
+        self._opened_before = ai.breaker.opened
+
+    def record_success(self):
+        self._opened_before = ai.breaker.opened
+
+    def reached(self):
+        return ai.breaker.opened - self._opened_before >= self.max_outages
+
+
+def summarize_with_retries(book, limiter, retries, outages):
+    """
+    Returns the summary for one book, or None once every attempt has failed.
+    Waits for the circuit breaker and then the rate limiter before each attempt,
+    and backs off between failures. Calls the breaker refuses, and failures that
+    open it, are part of an outage rather than a problem with the book, so they
+    don't count as attempts; once `outages` has reached its limit, the book is
+    given up on like one whose attempts ran out.
+    """
+    attempt = 0
+    while attempt < retries and not outages.reached():
+        wait_for_breaker()
+        if outages.reached():
+            break
+        limiter.acquire()
+        summary = ai.generate_book_summary(title=book.title, author=book.author)
+        if summary and summary not in ai.ERROR_MESSAGES:
+            outages.record_success()
+            return summary
+        if summary == ai.MODEL_UNAVAILABLE:
+            return None  # retrying can't help
+        if summary == ai.BREAKER_OPEN:
+            # Refused without calling the API, e.g. while another worker's probe is in flight
+            limiter.refund()
+            continue
+        if ai.breaker.is_open():
+            continue
+        attempt += 1
+        if attempt < retries:
+            time.sleep(min(2 ** attempt, 60) + random.random())
+    return None
+
+
+def save_batch(batch):
+    """
+    Stores a batch of (book_id, summary) pairs in one transaction. Books that got a
+    description in the meantime (e.g. from a page view) are left alone.
+    """
+    if not batch:
+        return
+    statement = (
+        update(models.Book.__table__)
+        .where(models.Book.id == bindparam('b_id'))
+        .where(models.Book.description == NO_DESCRIPTION)
+        .values(description=bindparam('b_description'))
+    )
+    db = SessionLocal()
+    try:
+        db.execute(statement, [{'b_id': book_id, 'b_description': summary} for book_id, summary in batch])
+        db.commit()
+    finally:
+        db.close()
+
+
+def backfill(concurrency, rpm, batch_size, retries, checkpoint_path, retry_failed, limit=None, max_outages=5):
+    failed_ids = load_failed_ids(checkpoint_path)
+    skip_ids = frozenset() if retry_failed else frozenset(failed_ids)
+    limiter = TokenBucket.per_minute(rpm, burst=concurrency)
+    outages = OutageLimit(max_outages)
+
+    books = books_to_summarize(skip_ids=skip_ids)
+    if limit is not None:
+        books = (book for _, book in zip(range(limit), books))
+
+    done = saved = 0
+    batch = []
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = {}
+        exhausted = False
+        while in_flight or not exhausted:
+            # Keep a bounded number of books in flight instead of queueing the whole catalog
+            while not exhausted and len(in_flight) < concurrency * 2:
+                book = next(books, None)
+                if book is None:
+                    exhausted = True
+                    break
+                in_flight[executor.submit(summarize_with_retries, book, limiter, retries, outages)] = book
+
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                book = in_flight.pop(future)
+                summary = future.result()
+                done += 1
+                if summary:
+                    batch.append((book.id, summary))
+                    failed_ids.discard(book.id)
+                else:
+                    failed_ids.add(book.id)
+                    print(f"FAILURE: Could not summarize '{book.title}' (id {book.id}).")
+
+            if outages.reached() and not exhausted:
+                # Books not started yet keep their placeholder and are picked up by the next run
+                print(f"AI service failed to recover after {max_outages} outages in a row; stopping.")
+                exhausted = True
+
+            if len(batch) >= batch_size:
+                save_batch(batch)
+                saved += len(batch)
+                batch = []
+                save_failed_ids(checkpoint_path, failed_ids)
+                elapsed = time.perf_counter() - started
+                print(f"Saved {saved} summaries ({done} books processed, {done / elapsed:.1f}/s)")
+
+    save_batch(batch)
+    saved += len(batch)
+    save_failed_ids(checkpoint_path, failed_ids)
+    print(f"\nBackfill complete: {saved} summaries saved, {len(failed_ids)} books failed "
+          f"(listed in {checkpoint_path}).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=4, help='summaries generated at the same time')
+    parser.add_argument('--rpm', type=float, default=60, help='maximum AI requests per minute')
+    parser.add_argument('--batch-size', type=int, default=20, help='summaries saved per database transaction')
+    parser.add_argument('--retries', type=int, default=3, help='attempts per book before giving up')
+    parser.add_argument('--max-outages', type=int, default=5,
+                        help='give up after the circuit breaker opens this many times in a row')
+    parser.add_argument('--limit', type=int, default=None, help='stop after this many books')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help='file listing books that failed')
+    parser.add_argument('--retry-failed', action='store_true', help='also retry books listed in the checkpoint')
+    parser.add_argument('--fake', action='store_true', help='use the local stub model instead of Gemini')
+    args = parser.parse_args()
+
+    if args.fake:
+        ai.model = ai.FakeModel(delay=float(os.getenv("AI_FAKE_DELAY", 0.05)))
+
+    backfill(
+        concurrency=args.concurrency,
+        rpm=args.rpm,
+        batch_size=args.batch_size,
+        retries=args.retries,
+        checkpoint_path=args.checkpoint,
+        retry_failed=args.retry_failed,
+        limit=args.limit,
+        max_outages=args.max_outages,
+    )
+
+
+if __name__ == "__main__":
+    main()
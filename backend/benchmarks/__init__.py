@@ -0,0 +1,2 @@
+# Benchmark scripts for the NextRead backend.
+# Run them from the backend folder, e.g.:  python -m benchmarks.search_bench
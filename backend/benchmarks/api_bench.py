@@ -0,0 +1,232 @@
+"""
+Load-tests the API with a mix of what users do (search, popular books,
+recommendations, book details, login and rating) and reports throughput and
+latency percentiles per scenario.
+
+Usage (from the backend folder):
+    python -m benchmarks.datagen --url sqlite:////tmp/nextread_bench.db
+    python -m benchmarks.api_bench --db-url sqlite:////tmp/nextread_bench.db --books 10000 --users 1000
+    python -m benchmarks.api_bench --url http://127.0.0.1:8000 --books 10000 --users 1000
+
+With --db-url a uvicorn server is started on a free port against that database
+(filled by benchmarks.datagen) and stopped afterwards; with --url the running
+server is used as is. --books and --users must match the generated data.
+
+Each virtual user registers its own account and picks goals before the clock
+starts, then sends requests back to back, picking each scenario by its weight
+in SCENARIOS. Logins use the generated users' accounts; ratings come from the
+virtual users, who never rate the same book twice.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from benchmarks.datagen import BENCH_PASSWORD, user_email
+from benchmarks.report import print_table, summarize
+from benchmarks.search_bench import sample_queries
+
+# Scenario -> share of requests
+SCENARIOS = {
+    "search": 25,
+    "popular": 15,
+    "recommendations": 15,
+    "book_details": 25,
+    "login": 10,
+    "rate": 10,
+}
+
+SERVER_START_TIMEOUT = 60
+
+
+class VirtualUser:
+    def __init__(self, http: httpx.AsyncClient, number: int, args, rng: random.Random, queries):
+        self.http = http
+        self.number = number
+        self.args = args
+        self.rng = rng
+        self.queries = queries
+        self.headers = {}
+        self.unrated = None
+
+    async def sign_up(self, run_id: str, goal_ids):
+        response = await self.http.post("/register", json={
+            "email": f"vu{self.number}-{run_id}@bench.example.com", "password": BENCH_PASSWORD,
+        })
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        goals = self.rng.sample(goal_ids, min(len(goal_ids), self.rng.randint(1, 3)))
+        response = await self.http.put("/users/me/goals", json={"goal_ids": goals}, headers=self.headers)
+        response.raise_for_status()
+        self.unrated = self.rng.sample(range(1, self.args.books + 1), self.args.books)
+
+    # --- Scenarios ---
+
+    def search(self):
+        return self.http.get("/books/search", params={"q": self.rng.choice(self.queries)})
+
+    def popular(self):
+        return self.http.get("/books/popular")
+
+    def recommendations(self):
+        return self.http.get("/users/me/recommendations", headers=self.headers)
+
+    def book_details(self):
+        # Signed in half the time, which adds the user's own rating to the response
+        headers = self.headers if self.rng.random() < 0.5 else {}
+        return self.http.get(f"/books/{self.rng.randint(1, self.args.books)}", headers=headers)
+
+    def login(self):
+        email = user_email(self.rng.randint(1, self.args.users))
+        return self.http.post("/login", data={"username": email, "password": BENCH_PASSWORD})
+
+    def rate(self):
+        book_id = self.unrated.pop() if self.unrated else self.rng.randint(1, self.args.books)
+        return self.http.post(f"/books/{book_id}/rate", json={"rating": self.rng.randint(1, 5)}, headers=self.headers)
+
+    async def run(self, measure_from: float, deadline: float, results: dict):
+        names = list(SCENARIOS)
+        weights = list(SCENARIOS.values())
+        while True:
+            name = self.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            if started >= deadline:
+                return
+            try:
+                response = await getattr(self, name)()
+                outcome = response.status_code
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            if started < measure_from:
+                continue  # still warming up
+            latencies, outcomes = results[name]
+            outcomes[outcome] += 1
+            if outcome == 200:
+                latencies.append(time.perf_counter() - started)
+
+
+async def run_load(args) -> dict:
+    rng = random.Random(args.seed)
+    queries = sample_queries(500, args.seed)
+    run_id = uuid.uuid4().hex[:8]  # fresh accounts on every run against the same database
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {name: ([], Counter()) for name in SCENARIOS}
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as http:
+        goal_ids = [goal["id"] for goal in (await http.get("/goals")).json()]
+        users = [VirtualUser(http, n, args, random.Random(rng.random()), queries) for n in range(args.concurrency)]
+        # One at a time: a burst of registrations would overflow the password hashing queue
+        for user in users:
+            await user.sign_up(run_id, goal_ids)
+
+        measure_from = time.perf_counter() + args.warmup
+        deadline = measure_from + args.seconds
+        await asyncio.gather(*(user.run(measure_from, deadline, results) for user in users))
+
+    scenarios = {}
+    for name, (latencies, outcomes) in results.items():
+        summary = summarize(latencies, args.seconds, errors=sum(n for outcome, n in outcomes.items() if outcome != 200))
+        summary["statuses"] = {str(outcome): n for outcome, n in sorted(outcomes.items(), key=str)}
+        scenarios[name] = summary
+    all_latencies = [latency for latencies, _ in results.values() for latency in latencies]
+    total = summarize(all_latencies, args.seconds, errors=sum(summary["errors"] for summary in scenarios.values()))
+    return {"concurrency": args.concurrency, "seconds": args.seconds, "total": total, "scenarios": scenarios}
+
+
+# --- Server ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_url: str, port: int, workers: int = 1) -> subprocess.Popen:
+    """
+    Starts uvicorn serving app.main:app against `db_url` and waits until it answers.
+    """
+    env = dict(os.environ, DATABASE_URL=db_url, SUMMARY_WAIT_SECONDS="0")
+    # Only the given database: no separate async URL or read replicas from .env
+    env["ASYNC_DATABASE_URL"] = ""
+    env["DATABASE_REPLICA_URLS"] = ""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        env=env,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"The server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/goals", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"The server didn't answer within {SERVER_START_TIMEOUT}s")
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def run(args) -> dict:
+    """
+    Runs the load test against args.url, or against a server started for
+    args.db_url when that is given.
+    """
+    server = None
+    if args.db_url:
+        port = free_port()
+        server = start_server(args.db_url, port, args.workers)
+        args.url = f"http://127.0.0.1:{port}"
+    try:
+        return asyncio.run(run_load(args))
+    finally:
+        if server is not None:
+            stop_server(server)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    parser.add_argument("--seconds", type=float, default=15.0, help="measured duration")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds of load before measuring starts")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (with --db-url)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running server")
+    target.add_argument("--db-url", help="database to start a server against")
+    parser.add_argument("--books", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(f"scenario ({args.concurrency} users)", {**results["scenarios"], "all": results["total"]}, "req/s")
+
+
+if __name__ == "__main__":
+    main()
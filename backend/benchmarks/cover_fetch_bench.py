@@ -0,0 +1,144 @@
+"""
+Runs fetch_covers.py against a local stub of the Google Books API to measure
+throughput and check the rate limit, the retries and resuming from the checkpoint.
+
+Usage (from the backend folder):
+    python -m benchmarks.cover_fetch_bench
+    python -m benchmarks.cover_fetch_bench --books 2000 --workers 16 --rate 200 --latency-ms 100
+
+The stub answers after --latency-ms, and fails --error-rate of the requests with a
+429 or 503 so the retries get exercised. It runs the fetcher three times: a cold
+run, a rerun that should be served entirely from the checkpoint, and a run after
+dropping the second half of the checkpoint, as if the first run had been killed.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+import fetch_covers
+
+
+class StubStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.first = None
+        self.last = None
+
+
+def stub_handler(stats: StubStats, latency: float, error_rate: float):
+    rng = random.Random(11)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse shows
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+            time.sleep(latency)
+            with stats.lock:
+                now = time.monotonic()
+                stats.requests += 1
+                stats.first = stats.first or now
+                stats.last = now
+                fail = rng.random() < error_rate
+                stats.errors += fail
+            if fail:
+                self.send_response(rng.choice((429, 503)))
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            # Books whose ISBN ends in 7 have no cover
+            if query.endswith("7"):
+                body = b'{"totalItems": 0}'
+            else:
+                body = ('{"items": [{"volumeInfo": {"imageLinks": {"thumbnail": "http://covers.test/%s"}}}]}'
+                        % query).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def write_books(path: str, count: int):
+    pd.DataFrame({
+        "book_id": range(1, count + 1),
+        "title": [f"Book {i}" for i in range(1, count + 1)],
+        "authors": "Stub Author",
+        "isbn": [f"{i:010d}" for i in range(1, count + 1)],
+    }).to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=fetch_covers.WORKERS)
+    parser.add_argument("--rate", type=float, default=100, help="requests per second allowed by the fetcher")
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub response time")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of stub responses that are 429/503")
+    args = parser.parse_args()
+
+    fetch_covers.BACKOFF_SECONDS = 0.05  # keep the benchmark short; the stub asks for no wait anyway
+    stats = StubStats()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_handler(stats, args.latency_ms / 1000, args.error_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_port}/books/v1/volumes"
+
+    tmp_dir = tempfile.TemporaryDirectory()
+    input_path = os.path.join(tmp_dir.name, "books.csv")
+    output_path = os.path.join(tmp_dir.name, "books_with_covers.csv")
+    cache_path = os.path.join(tmp_dir.name, "cover_cache.jsonl")
+    write_books(input_path, args.books)
+
+    def run(name):
+        stats.requests = stats.errors = 0
+        stats.first = stats.last = None
+        result = fetch_covers.fetch_cover_images(
+            input_path, output_path, cache_path, api_url, args.workers, args.rate, chunk_size=250,
+        )
+        span = (stats.last - stats.first) if stats.requests > 1 else 0
+        observed = (stats.requests - 1) / span if span else 0
+        print(f"== {name}: {result['fetched']} lookups, {result['cached']} from the checkpoint, "
+              f"{result['failed']} failed in {result['seconds']}s; stub saw {stats.requests} requests "
+              f"({stats.errors} answered with errors), {observed:.0f} req/s (limit {args.rate:.0f})\n")
+        return result
+
+    cold = run("cold run")
+    warm = run("rerun")
+    with open(cache_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(cache_path, "w", encoding="utf-8") as f:
+        f.writelines(lines[:len(lines) // 2])
+    resumed = run("resumed run")
+
+    output = pd.read_csv(output_path, dtype={"isbn": str})
+    expected = [
+        fetch_covers.PLACEHOLDER_URL if isbn.endswith("7") else f"http://covers.test/isbn:{isbn}"
+        for isbn in output["isbn"]
+    ]
+    correct = len(output) == args.books and list(output["image_url"]) == expected
+    print(f"Sequential with time.sleep(1): ~{args.books * (1 + args.latency_ms / 1000):.0f}s for {args.books} books")
+    print("OK: output matches the stub" if correct else "MISMATCH: output differs from the stub")
+
+    server.shutdown()
+    tmp_dir.cleanup()
+    if not correct or warm["fetched"] or cold["failed"] or resumed["fetched"] > len(lines) - len(lines) // 2:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
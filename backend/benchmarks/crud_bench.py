@@ -0,0 +1,180 @@
+"""
+Times every function in app/crud.py against a database filled by
+benchmarks.datagen, and reports calls per second and latency percentiles.
+
+Usage (from the backend folder):
+    python -m benchmarks.datagen --url sqlite:////tmp/nextread_bench.db
+    python -m benchmarks.crud_bench --url sqlite:////tmp/nextread_bench.db
+    python -m benchmarks.crud_bench --url ... --iterations 1000 --only search_books suggest_books
+
+Every call gets a fresh session, like a request does. The read functions run
+first; the write functions then create --iterations new users and give them
+goals and ratings, so the database keeps growing with every run.
+"""
+import argparse
+import json
+import random
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app import auth, crud, models, schemas
+from benchmarks.datagen import BENCH_PASSWORD
+from benchmarks.report import print_table, summarize
+from benchmarks.search_bench import sample_queries
+
+WARMUP_CALLS = 3
+
+
+class BenchData:
+    """
+    Arguments for the benchmarked calls, drawn from what is in the database.
+    """
+
+    def __init__(self, Session, seed: int):
+        self.rng = random.Random(seed)
+        with Session() as db:
+            self.goal_ids = list(db.scalars(select(models.Goal.id).order_by(models.Goal.id)))
+            self.book_ids = list(db.scalars(select(models.Book.id).order_by(models.Book.id)))
+            self.users = db.execute(select(models.User.id, models.User.email).order_by(models.User.id).limit(1000)).all()
+            self.rated = db.execute(
+                select(models.Rating.user_id, models.Rating.book_id).order_by(models.Rating.id).limit(1000)
+            ).all() or [(self.users[0][0], self.book_ids[0])]
+            self.first_new_user = (db.scalar(select(func.max(models.User.id))) or 0) + 1
+        if not self.book_ids or not self.users:
+            raise RuntimeError("The database has no books or users; fill it with benchmarks.datagen first")
+        self.queries = sample_queries(500, seed)
+        self.hashed_password = auth.get_password_hash(BENCH_PASSWORD)
+        self.new_user_ids = []  # users made by the create_user case, for the write cases
+
+    def book_id(self) -> int:
+        return self.rng.choice(self.book_ids)
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    def query(self) -> str:
+        return self.rng.choice(self.queries)
+
+
+# --- Cases ---
+# Each case is (name, call, prepare): call(db, data, i, prepared) is timed, and
+# prepare(db, data, i), if given, runs untimed before it to supply `prepared`.
+
+def _new_user(db, data, i):
+    return crud.get_user(db, user_id=data.new_user_ids[i % len(data.new_user_ids)])
+
+
+def _create_user(db, data, i, _):
+    user = crud.create_user(
+        db, schemas.UserCreate(email=f"crud{data.first_new_user + i}@bench.example.com", password=BENCH_PASSWORD),
+        hashed_password=data.hashed_password,
+    )
+    data.new_user_ids.append(user.id)
+
+
+def _rating_pair(data, i, offset=0):
+    # New user i rates a different book in each write case, so no pair is rated twice
+    return data.new_user_ids[i % len(data.new_user_ids)], data.book_ids[(i + offset) % len(data.book_ids)]
+
+
+def _apply_rating_deltas(db, data, i, _):
+    crud.apply_rating_deltas(db, {data.book_id(): (1, 4.0)})
+    db.commit()
+
+
+READ_CASES = [
+    ("get_goals", lambda db, data, i, _: crud.get_goals(db), None),
+    ("get_goal_by_id", lambda db, data, i, _: crud.get_goal_by_id(db, goal_id=data.rng.choice(data.goal_ids)), None),
+    ("get_goals_by_ids",
+     lambda db, data, i, _: crud.get_goals_by_ids(db, goal_ids=data.rng.sample(data.goal_ids, 3)), None),
+    ("get_user", lambda db, data, i, _: crud.get_user(db, user_id=data.user()[0]), None),
+    ("get_user_by_email", lambda db, data, i, _: crud.get_user_by_email(db, email=data.user()[1]), None),
+    ("get_book_by_id", lambda db, data, i, _: crud.get_book_by_id(db, book_id=data.book_id()), None),
+    ("get_user_rating", lambda db, data, i, _: crud.get_user_rating(db, *data.rng.choice(data.rated)), None),
+    ("get_popular_books (cached)", lambda db, data, i, _: crud.get_popular_books(db), None),
+    ("get_popular_books (uncached)", lambda db, data, i, _: crud.get_popular_books(db),
+     lambda db, data, i: crud.invalidate_popular_books()),
+    ("search_books", lambda db, data, i, _: crud.search_books(db, query=data.query()), None),
+    ("suggest_books", lambda db, data, i, _: crud.suggest_books(db, prefix=data.query()[:3]), None),
+    ("get_recommendations_for_user",
+     lambda db, data, i, _: crud.get_recommendations_for_user(db, user_id=data.user()[0]), None),
+]
+
+# These run in order: create_user makes the users the others write for
+WRITE_CASES = [
+    ("create_user", _create_user, None),
+    ("set_user_goals",
+     lambda db, data, i, user: crud.set_user_goals(db, user=user, goal_ids=data.goal_ids[:2]), _new_user),
+    ("add_goal_to_user",
+     lambda db, data, i, user: crud.add_goal_to_user(db, user=user, goal_id=data.goal_ids[2]), _new_user),
+    ("remove_goal_from_user",
+     lambda db, data, i, user: crud.remove_goal_from_user(db, user=user, goal_id=data.goal_ids[2]), _new_user),
+    ("update_book_description",
+     lambda db, data, i, _: crud.update_book_description(db, book_id=data.book_id(), description=f"Updated {i}."),
+     None),
+    ("add_rating", lambda db, data, i, _: crud.add_rating(db, *_rating_pair(data, i), rating=4), None),
+    ("insert_rating", lambda db, data, i, _: crud.insert_rating(db, *_rating_pair(data, i, 1), rating=3), None),
+    ("rate_book", lambda db, data, i, _: crud.rate_book(db, *_rating_pair(data, i, 2), rating=5), None),
+    ("apply_rating_deltas", _apply_rating_deltas, None),
+]
+
+
+def run_case(Session, data, call, prepare, iterations: int) -> dict:
+    latencies = []
+    # The warm-up calls get the indexes after the timed ones, so writes never repeat
+    for i in [*range(iterations, iterations + WARMUP_CALLS), *range(iterations)]:
+        with Session() as db:
+            prepared = prepare(db, data, i) if prepare else None
+            started = time.perf_counter()
+            call(db, data, i, prepared)
+            elapsed = time.perf_counter() - started
+        if i < iterations:
+            latencies.append(elapsed)
+    # Throughput counts only the time spent in the calls, not the untimed setup
+    return summarize(latencies, sum(latencies))
+
+
+def run(url: str, iterations: int = 200, seed: int = 42, only=None) -> dict:
+    """
+    Benchmarks the crud functions (all of them, or the ones named in `only`)
+    and returns {"iterations": ..., "functions": {name: summary}}.
+    """
+    engine = create_engine(url)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    data = BenchData(Session, seed)
+    cases = READ_CASES + WRITE_CASES
+    if only:
+        unknown = set(only) - {name for name, _, _ in cases}
+        if unknown:
+            raise ValueError(f"Unknown functions: {', '.join(sorted(unknown))}")
+        writes = [name for name, _, _ in WRITE_CASES if name in only]
+        # The other write cases need the users create_user makes
+        cases = [case for case in cases if case[0] in only or (writes and case[0] == "create_user")]
+
+    results = {}
+    for name, call, prepare in cases:
+        results[name] = run_case(Session, data, call, prepare, iterations)
+    engine.dispose()
+    return {"iterations": iterations, "functions": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="database URL (SQLAlchemy sync driver)")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per function")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", help="names of the functions to run")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.url, args.iterations, args.seed, args.only)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table("crud function", results["functions"], "calls/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Measures how many password checks (i.e. logins) per second Argon2 sustains,
+with the cost parameters from the environment (ARGON2_TIME_COST,
+ARGON2_MEMORY_COST, ARGON2_PARALLELISM) or the ones given on the command line.
+
+Usage (from the backend folder):
+    python -m benchmarks.hash_bench
+    python -m benchmarks.hash_bench --time-cost 2 --memory-cost 19456 --parallelism 1 --threads 1 2 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from app import auth
+
+
+def run(context: CryptContext, threads: int, seconds: float) -> float:
+    hashed = context.hash("correct horse battery staple")
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        checks = 0
+        while time.perf_counter() < deadline:
+            context.verify("correct horse battery staple", hashed)
+            checks += 1
+        return checks
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        total = sum(executor.map(lambda _: worker(), range(threads)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--time-cost", type=int, default=auth.ARGON2_TIME_COST)
+    parser.add_argument("--memory-cost", type=int, default=auth.ARGON2_MEMORY_COST, help="in KiB")
+    parser.add_argument("--parallelism", type=int, default=auth.ARGON2_PARALLELISM)
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--seconds", type=float, default=5.0, help="duration of each run")
+    args = parser.parse_args()
+
+    context = CryptContext(
+        schemes=["argon2"],
+        argon2__time_cost=args.time_cost,
+        argon2__memory_cost=args.memory_cost,
+        argon2__parallelism=args.parallelism,
+    )
+    print(f"argon2id t={args.time_cost} m={args.memory_cost}KiB p={args.parallelism}, {os.cpu_count()} CPUs")
+    for threads in args.threads:
+        rate = run(context, threads, args.seconds)
+        print(f"{threads:>3} threads | {rate:8.1f} logins/s | {rate / min(threads, os.cpu_count() or 1):8.1f} logins/s per core")
+
+
+if __name__ == "__main__":
+    main()
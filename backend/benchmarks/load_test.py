@@ -0,0 +1,95 @@
+"""
+Load-tests a running API server with many concurrent clients and reports
+throughput and latency, e.g. to compare the sync and async endpoint stacks.
+
+Usage (from the backend folder, with the server started separately):
+    uvicorn app.main:app --port 8000
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --concurrency 200 --seconds 20
+    python -m benchmarks.load_test --token <jwt> --paths /users/me/recommendations /books/1
+
+Each client sends requests back to back, cycling through --paths, until the time
+is up. Run it once against the old version and once against the new one with the
+same settings and database.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+DEFAULT_PATHS = [
+    "/goals",
+    "/books/popular",
+    "/books/search?q=love",
+    "/books/suggest?prefix=har",
+    "/books/1",
+    "/books/2",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def client(http, paths, deadline, latencies, statuses):
+    for path in itertools.cycle(paths):
+        if time.perf_counter() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            response = await http.get(path)
+            statuses[response.status_code] += 1
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(url, paths, concurrency, seconds, token=None):
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, statuses = [], Counter()
+    async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits, timeout=60) as http:
+        # Warm up caches and indexes so the first requests don't skew the numbers
+        for path in paths:
+            await http.get(path)
+        started = time.perf_counter()
+        deadline = started + seconds
+        # Rotate the starting path so clients don't all hit the same endpoint at once
+        await asyncio.gather(*(
+            client(http, paths[i % len(paths):] + paths[:i % len(paths)], deadline, latencies, statuses)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of each run")
+    parser.add_argument("--token", help="bearer token for endpoints that need a login")
+    args = parser.parse_args()
+
+    print(f"{args.url}, {len(args.paths)} paths, {args.seconds:g}s per run")
+    for concurrency in args.concurrency:
+        latencies, statuses, elapsed = asyncio.run(run(args.url, args.paths, concurrency, args.seconds, args.token))
+        if not latencies:
+            print(f"{concurrency:>5} clients | no successful requests ({dict(statuses)})")
+            continue
+        ms = [latency * 1000 for latency in latencies]
+        print(
+            f"{concurrency:>5} clients | {len(latencies) / elapsed:8.1f} req/s | "
+            f"p50 {statistics.median(ms):7.1f} ms | p95 {percentile(ms, 95):7.1f} ms | "
+            f"p99 {percentile(ms, 99):7.1f} ms | statuses {dict(statuses)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Calls every API endpoint once and reports how many SQL statements each request
+ran, failing if one goes over the budget its endpoint declares with
+@querycount.query_budget (or QUERY_BUDGET). Also fails if a request errors or
+comes back empty when it should have found something, since a request that
+never reaches the database says nothing about its budget.
+
+Usage (from the backend folder):
+    python -m benchmarks.query_audit
+
+Runs in-process against a throwaway SQLite database seeded with the catalog,
+with QUERY_BUDGET_STRICT on, so a request over budget comes back as a 500 that
+lists what it ran. Set QUERY_N_PLUS_ONE_THRESHOLD=1 to have every request's
+statements logged.
+"""
+import os
+import sys
+import tempfile
+
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP_DIR.name, 'audit.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+os.environ["QUERY_DEBUG_HEADERS"] = "true"
+os.environ["QUERY_BUDGET_STRICT"] = "true"
+os.environ["SUMMARY_WAIT_SECONDS"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import seed  # noqa: E402
+from app.main import app  # noqa: E402
+
+EMAIL = "audit@example.com"
+PASSWORD = "audit-password-1"
+
+
+def requests_to_audit(goal_ids):
+    # (method, path, request kwargs, needs auth, expects a non-empty body)
+    return [
+        ("GET", "/goals", {}, False, True),
+        ("GET", "/books/popular", {}, False, True),
+        ("GET", "/books/search", {"params": {"q": "harry"}}, False, True),
+        ("GET", "/books/suggest", {"params": {"prefix": "har"}}, False, True),
+        ("GET", "/books/1", {}, False, True),
+        ("GET", "/users/me", {}, True, True),
+        ("PUT", "/users/me/goals", {"json": {"goal_ids": goal_ids[:3]}}, True, True),
+        ("POST", "/users/me/goals", {"json": {"goal_id": goal_ids[3]}}, True, True),
+        ("DELETE", f"/users/me/goals/{goal_ids[3]}", {}, True, True),
+        ("GET", "/users/me/recommendations", {}, True, True),
+        ("GET", "/books/1", {}, True, True),
+        ("POST", "/books/1/rate", {"json": {"rating": 4}}, True, True),
+    ]
+
+
+def problem_with(response, expects_results: bool) -> str | None:
+    """
+    Describes what is wrong with an audited response, or returns None if it is fine.
+    """
+    if response.status_code >= 500:
+        return response.json()["detail"]
+    if response.status_code >= 400:
+        return f"unexpected status {response.status_code}: {response.text[:200]}"
+    if expects_results and not response.json():
+        return "empty response, so the request never did its real work"
+    return None
+
+
+def main():
+    seed.seed_data()
+    failures = 0
+    with TestClient(app) as client:
+        response = client.post("/register", json={"email": EMAIL, "password": PASSWORD})
+        token = response.json()["access_token"]
+        goal_ids = [goal["id"] for goal in client.get("/goals").json()]
+        auth = {"Authorization": f"Bearer {token}"}
+
+        print(f"\n{'request':<42} {'status':>6} {'queries':>8} {'db ms':>8}")
+        for method, path, kwargs, needs_auth, expects_results in requests_to_audit(goal_ids):
+            response = client.request(method, path, headers=auth if needs_auth else {}, **kwargs)
+            name = f"{method} {path}" + (" (signed in)" if needs_auth and path == "/books/1" else "")
+            print(f"{name:<42} {response.status_code:>6} {response.headers.get('x-db-query-count', '-'):>8} "
+                  f"{response.headers.get('x-db-query-time-ms', '-'):>8}")
+            problem = problem_with(response, expects_results)
+            if problem:
+                failures += 1
+                print(f"    {problem}")
+
+    TMP_DIR.cleanup()
+    if failures:
+        print(f"\n{failures} request(s) went over their query budget or failed")
+        sys.exit(1)
+    print("\nOK: every request stayed within its query budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Latency summaries and the JSON reports written by benchmarks.suite, plus a
+side-by-side comparison of two reports.
+
+Usage (from the backend folder):
+    python -m benchmarks.report old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+REPORT_VERSION = 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies, elapsed: float, errors: int = 0) -> dict:
+    """
+    Throughput and latency percentiles (in milliseconds) of `latencies` (in
+    seconds), collected over `elapsed` seconds.
+    """
+    summary = {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    if latencies:
+        ms = [latency * 1000 for latency in latencies]
+        summary.update({
+            "mean_ms": round(sum(ms) / len(ms), 3),
+            "p50_ms": round(percentile(ms, 50), 3),
+            "p95_ms": round(percentile(ms, 95), 3),
+            "p99_ms": round(percentile(ms, 99), 3),
+            "max_ms": round(max(ms), 3),
+        })
+    return summary
+
+
+def print_table(title: str, summaries: dict, unit: str = "ops/s"):
+    print(f"\n{title:<34} {unit:>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, summary in summaries.items():
+        if not summary["count"]:
+            print(f"{name:<34} {'-':>10} {'-':>9} {'-':>9} {'-':>9} {summary['errors']:>7}")
+            continue
+        print(f"{name:<34} {summary['throughput']:>10.1f} {summary['p50_ms']:>9.2f} "
+              f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary['errors']:>7}")
+
+
+# --- Reports ---
+
+def _git(*args) -> str | None:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    """
+    What a result depends on besides the code: the commit, the machine and the Python version.
+    """
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_report(path: str, report: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": REPORT_VERSION, **report}, f, indent=2)
+        f.write("\n")
+
+
+def load_report(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _change(old, new) -> str:
+    if old is None or new is None or not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(old: dict, new: dict):
+    """
+    Prints throughput and p95 of every crud function and API scenario found in
+    both reports. Lower p95 and higher throughput are better.
+    """
+    print(f"old: {old.get('commit') or '?'}  {old.get('created_at', '')}")
+    print(f"new: {new.get('commit') or '?'}  {new.get('created_at', '')}")
+    if old.get("settings") != new.get("settings"):
+        print("WARNING: the reports were made with different settings, so they don't compare directly")
+
+    for section, entries in (("crud", "functions"), ("api", "scenarios")):
+        old_entries = old.get(section, {}).get(entries, {})
+        new_entries = new.get(section, {}).get(entries, {})
+        names = [name for name in new_entries if name in old_entries]
+        if not names:
+            continue
+        print(f"\n{section + ' ' + entries:<34} {'throughput':>22} {'change':>8} {'p95 ms':>20} {'change':>8}")
+        for name in names:
+            before, after = old_entries[name], new_entries[name]
+            print(
+                f"{name:<34} {before['throughput']:>10.1f} -> {after['throughput']:>8.1f} "
+                f"{_change(before['throughput'], after['throughput']):>8} "
+                f"{before.get('p95_ms', 0):>8.2f} -> {after.get('p95_ms', 0):>8.2f} "
+                f"{_change(before.get('p95_ms'), after.get('p95_ms')):>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", help="report of the baseline commit")
+    parser.add_argument("new", help="report of the commit to compare")
+    args = parser.parse_args()
+    compare(load_report(args.old), load_report(args.new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measures book search latency on synthetic catalogs of 10k, 100k and 1M books.
+
+Usage (from the backend folder):
+    python -m benchmarks.search_bench
+    python -m benchmarks.search_bench --sizes 10000 100000 --queries 500
+
+The index is filled directly with synthetic rows, so no database is needed.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.search import SearchIndex
+
+WORDS = (
+    "shadow night river king queen war peace house garden stone fire water empire "
+    "secret history world city star ocean dream game time lost last first dark light "
+    "silent winter summer storm iron glass golden little great wild broken hidden "
+    "journey mountain forest island kingdom letter road song story tale machine mind"
+).split()
+FIRST_NAMES = "john mary james anna george emma charles ruth agatha leo jane mark".split()
+LAST_NAMES = "smith brown orwell austen tolkien rowling king christie tolstoy twain woolf".split()
+
+
+def synthetic_rows(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    # Real titles draw on a large vocabulary with a few very common words, so mix
+    # the common word list with a long tail of rarer made-up words.
+    rare_words = [f"{rng.choice(WORDS)}{suffix}" for suffix in range(20_000)]
+    for book_id in range(1, count + 1):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 3))]
+        words += [rng.choice(rare_words) for _ in range(rng.randint(1, 3))]
+        rng.shuffle(words)
+        title = " ".join(words)
+        author = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{book_id % 997}"
+        yield book_id, title.title(), author.title(), rng.randint(0, 3_000_000)
+
+
+def sample_queries(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(rng.choice(WORDS))  # one full word
+        elif kind < 0.7:
+            queries.append(f"{rng.choice(WORDS)} {rng.choice(WORDS)[:3]}")  # typing a second word
+        elif kind < 0.9:
+            queries.append(f"{rng.choice(LAST_NAMES)}{rng.randint(0, 996)}")  # author lookup
+        else:
+            queries.append(rng.choice(WORDS)[:2])  # first keystrokes
+    return queries
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(size: int, query_count: int, limit: int):
+    index = SearchIndex()
+    start = time.perf_counter()
+    index.build(synthetic_rows(size))
+    build_seconds = time.perf_counter() - start
+
+    timings = []
+    for query in sample_queries(query_count):
+        start = time.perf_counter()
+        index.search(query, limit=limit)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(
+        f"{size:>9,} books | build {build_seconds:6.1f}s | "
+        f"p50 {statistics.median(timings):7.3f}ms | "
+        f"p95 {percentile(timings, 95):7.3f}ms | "
+        f"p99 {percentile(timings, 99):7.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.queries, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Measures /books/suggest prefix lookups on synthetic catalogs.
+
+Usage (from the backend folder):
+    python -m benchmarks.suggest_bench
+    python -m benchmarks.suggest_bench --sizes 10000 100000 --queries 2000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.search import SuggestIndex
+from benchmarks.search_bench import LAST_NAMES, WORDS, percentile, synthetic_rows
+
+
+def sample_prefixes(count: int, seed: int = 11):
+    rng = random.Random(seed)
+    sources = WORDS + LAST_NAMES
+    # Simulate keystrokes: prefixes of 1 to 6 characters, weighted towards short ones
+    return [rng.choice(sources)[: rng.choice((1, 2, 2, 3, 3, 4, 5, 6))] for _ in range(count)]
+
+
+def run(size: int, query_count: int, limit: int):
+    index = SuggestIndex()
+    start = time.perf_counter()
+    index.build(synthetic_rows(size))
+    build_seconds = time.perf_counter() - start
+
+    timings = []
+    for prefix in sample_prefixes(query_count):
+        start = time.perf_counter()
+        index.suggest(prefix, limit=limit)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(
+        f"{size:>9,} books | build {build_seconds:6.1f}s | "
+        f"p50 {statistics.median(timings):7.3f}ms | "
+        f"p95 {percentile(timings, 95):7.3f}ms | "
+        f"p99 {percentile(timings, 99):7.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=8)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.queries, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,207 @@
+"""
+Looks up a cover image for every book in data/curated_books.csv with the Google
+Books API and writes data/curated_books_with_covers.csv with an image_url column.
+
+Usage (from the backend folder):
+    python fetch_covers.py
+    python fetch_covers.py --workers 16 --rate 20
+    python fetch_covers.py --api-url http://localhost:8081/books/v1/volumes   # e.g. a local stub
+
+Lookups run on a pool of worker threads sharing one HTTP session, paced by a
+token bucket (--rate requests per second across all workers) and retried with
+exponential backoff on timeouts, 429s and 5xx responses. Every answer is appended
+to a checkpoint file (data/cover_cache.jsonl), so an interrupted run picks up where
+it stopped and a rerun only asks for books it hasn't looked up yet. Lookups that
+still fail after the retries get the placeholder and are tried again next run.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
 import requests
-import time
-import os
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from app.ratelimit import TokenBucket
+
+load_dotenv()
 
 # --- CONFIGURATION ---
 INPUT_CSV_PATH = 'data/curated_books.csv'
 OUTPUT_CSV_PATH = 'data/curated_books_with_covers.csv'
+CACHE_PATH = 'data/cover_cache.jsonl'
+API_URL = os.getenv("GOOGLE_BOOKS_API_URL", "https://www.googleapis.com/books/v1/volumes")
+# Optional; raises the API's daily quota
+API_KEY = os.getenv("GOOGLE_BOOKS_API_KEY")
+PLACEHOLDER_URL = "https://placehold.co/200x300?text=Not+Found"
 
-# --- SCRIPT ---
-def fetch_cover_images():
-    try:
-        df = pd.read_csv(INPUT_CSV_PATH)
-        print(f"Successfully loaded {INPUT_CSV_PATH}")
-    except FileNotFoundError:
-        print(f"ERROR: Input file not found at {INPUT_CSV_PATH}")
-        return
-
-    image_urls = []
-    print("Starting to fetch cover images from Google Books API...")
-
-    for index, row in df.iterrows():
-        # Use ISBN if available, otherwise use title and author
-        search_query = ""
-        if 'isbn' in row and pd.notna(row['isbn']):
-            search_query = f"isbn:{row['isbn']}"
-        else:
-            title = row.get('title', '')
-            author = row.get('authors', '')
-            search_query = f"intitle:{requests.utils.quote(title)}+inauthor:{requests.utils.quote(author)}"
-
-        url = f"https://www.googleapis.com/books/v1/volumes?q={search_query}"
+WORKERS = 8
+REQUESTS_PER_SECOND = 5.0
+REQUEST_TIMEOUT = 10
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.5  # doubled after every failed attempt, plus jitter
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Rows read, looked up and written at a time
+CHUNK_SIZE = 1000
+
+
+# --- CHECKPOINT ---
+class CoverCache:
+    """
+    Lookup query -> cover URL (None when the API has no cover), kept in memory and
+    appended to a JSON-lines file as results come in.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.covers = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short when an earlier run was killed
+                    self.covers[entry['query']] = entry['url']
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def __contains__(self, query: str) -> bool:
+        return query in self.covers
 
+    def get(self, query: str):
+        return self.covers.get(query)
+
+    def put(self, query: str, url: str | None):
+        self.covers[query] = url
+        self._file.write(json.dumps({'query': query, 'url': url}) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# --- LOOKUPS ---
+def lookup_query(row: dict) -> str:
+    # Use ISBN if available, otherwise use title and author
+    if pd.notna(row.get('isbn')):
+        return f"isbn:{row['isbn']}"
+    return f"intitle:{row.get('title', '')} inauthor:{row.get('authors', '')}"
+
+
+def make_session(workers: int) -> requests.Session:
+    session = requests.Session()
+    # Keep a connection per worker open instead of reconnecting for every request
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_cover(session: requests.Session, bucket: TokenBucket, api_url: str, query: str):
+    """
+    Returns the thumbnail URL of the first match, or None if the API has no cover.
+    Raises requests.RequestException once MAX_ATTEMPTS attempts have failed.
+    """
+    params = {'q': query}
+    if API_KEY:
+        params['key'] = API_KEY
+    for attempt in range(MAX_ATTEMPTS):
+        bucket.acquire()
+        delay = BACKOFF_SECONDS * 2 ** attempt * (1 + random.random())
         try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an exception for bad status codes
-            data = response.json()
+            response = session.get(api_url, params=params, timeout=REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(delay)
+            continue
+        if response.status_code in RETRY_STATUSES and attempt < MAX_ATTEMPTS - 1:
+            retry_after = response.headers.get('Retry-After', '')
+            time.sleep(float(retry_after) if retry_after.isdigit() else delay)
+            continue
+        response.raise_for_status()
+        try:
+            return response.json()['items'][0]['volumeInfo']['imageLinks']['thumbnail']
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+
 
-            thumbnail_url = data['items'][0]['volumeInfo']['imageLinks']['thumbnail']
-            image_urls.append(thumbnail_url)
-            print(f"SUCCESS: Found cover for '{row['title']}'")
+# --- SCRIPT ---
+def fetch_cover_images(
+    input_path=INPUT_CSV_PATH,
+    output_path=OUTPUT_CSV_PATH,
+    cache_path=CACHE_PATH,
+    api_url=API_URL,
+    workers=WORKERS,
+    rate=REQUESTS_PER_SECOND,
+    chunk_size=CHUNK_SIZE,
+) -> dict:
+    if not os.path.exists(input_path):
+        print(f"ERROR: Input file not found at {input_path}")
+        return {}
 
-        except (requests.exceptions.RequestException, KeyError, IndexError) as e:
-            image_urls.append("https://placehold.co/200x300?text=Not+Found")
-            print(f"FAILURE: Could not find cover for '{row['title']}'. Using placeholder.")
+    cache = CoverCache(cache_path)
+    print(f"Loaded {len(cache.covers)} earlier lookups from {cache_path}")
+    session = make_session(workers)
+    bucket = TokenBucket(rate)
+    stats = {'rows': 0, 'cached': 0, 'fetched': 0, 'found': 0, 'not_found': 0, 'failed': 0}
+    started = time.perf_counter()
 
-        time.sleep(1) # Wait 1 second to be polite to the API
+    # Written next to the output and moved into place at the end, so a failed run
+    # never leaves a half-written CSV behind
+    partial_path = output_path + '.part'
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor, \
+                open(partial_path, 'w', encoding='utf-8', newline='') as out:
+            # ISBNs as text, or ones starting with 0 lose it
+            for chunk_number, chunk in enumerate(pd.read_csv(input_path, chunksize=chunk_size, dtype={'isbn': str})):
+                queries = [lookup_query(row) for row in chunk.to_dict('records')]
+                todo = [query for query in dict.fromkeys(queries) if query not in cache]
+                stats['cached'] += len(queries) - len(todo)
+                futures = {query: executor.submit(fetch_cover, session, bucket, api_url, query) for query in todo}
+                failed = set()
+                for query, future in futures.items():
+                    try:
+                        url = future.result()
+                    except requests.RequestException as e:
+                        failed.add(query)
+                        print(f"FAILURE: Lookup '{query}' failed ({e}). Using placeholder.")
+                        continue
+                    cache.put(query, url)
+                    stats['found' if url else 'not_found'] += 1
+                stats['fetched'] += len(futures)
+                stats['failed'] += len(failed)
+
+                chunk['image_url'] = [cache.get(query) or PLACEHOLDER_URL for query in queries]
+                chunk.to_csv(out, header=chunk_number == 0, index=False)
+                stats['rows'] += len(chunk)
+                elapsed = time.perf_counter() - started
+                print(f"{stats['rows']} rows done ({stats['fetched']} looked up, {stats['cached']} from the "
+                      f"checkpoint, {stats['fetched'] / elapsed:.1f} lookups/s)")
+        os.replace(partial_path, output_path)
+    finally:
+        cache.close()
+        session.close()
+
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    print(f"\nProcess complete. New file saved to {output_path}")
+    print(json.dumps(stats))
+    return stats
 
-    df['image_url'] = image_urls
-    df.to_csv(OUTPUT_CSV_PATH, index=False)
-    print(f"\nProcess complete. New file saved to {OUTPUT_CSV_PATH}")
 
 if __name__ == "__main__":
-    fetch_cover_images()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', default=INPUT_CSV_PATH)
+    parser.add_argument('--output', default=OUTPUT_CSV_PATH)
+    parser.add_argument('--cache', default=CACHE_PATH, help='checkpoint file of earlier lookups')
+    parser.add_argument('--api-url', default=API_URL)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help='requests per second, all workers together')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fetch_cover_images(args.input, args.output, args.cache, args.api_url, args.workers, args.rate, args.chunk_size)
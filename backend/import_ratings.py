@@ -0,0 +1,75 @@
+"""
+Bulk-imports ratings from an NDJSON or CSV file, e.g. rating history migrated
+from another system.
+
+Usage (from the backend folder):
+    python import_ratings.py ratings.ndjson
+    python import_ratings.py ratings.csv --batch-size 10000
+    cat ratings.ndjson | python import_ratings.py - --format ndjson
+
+NDJSON lines look like {"user_id": 1, "book_id": 2, "rating": 4}; CSV files need a
+user_id,book_id,rating header. A rating for a (book, user) pair that already has one
+replaces it. Ratings are written in batches, one transaction each, and the books'
+average_rating / ratings_count are updated once per affected book at the end.
+The same import is available over HTTP as POST /admin/ratings/import.
+"""
+import argparse
+import json
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from app.rating_import import FORMATS, IMPORT_BATCH_SIZE, RatingImporter
+
+load_dotenv()
+
+PROGRESS_EVERY = 100_000
+
+
+def guess_format(path):
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def import_file(f, fmt, batch_size):
+    importer = RatingImporter(fmt, batch_size=batch_size)
+    next_progress = PROGRESS_EVERY
+    chunk = []
+    try:
+        for line in f:
+            chunk.append(line)
+            if len(chunk) >= batch_size:
+                importer.feed_lines(chunk)
+                chunk = []
+                if importer.rows >= next_progress:
+                    elapsed = time.perf_counter() - importer.started
+                    print(f"{importer.rows} rows imported ({importer.rows / elapsed:.0f} rows/s)")
+                    next_progress += PROGRESS_EVERY
+        importer.feed_lines(chunk)
+    except BaseException:
+        # Keep the aggregates in line with the batches already committed
+        importer.apply_aggregates()
+        raise
+    return importer.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='file to import, or - for standard input')
+    parser.add_argument('--format', choices=FORMATS, help='defaults to csv for *.csv files, ndjson otherwise')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='ratings written per transaction')
+    args = parser.parse_args()
+
+    fmt = args.format or ('ndjson' if args.path == '-' else guess_format(args.path))
+    if args.path == '-':
+        report = import_file(sys.stdin, fmt, args.batch_size)
+    else:
+        with open(args.path, encoding='utf-8', newline='') as f:
+            report = import_file(f, fmt, args.batch_size)
+
+    print(f"\nImport complete: {report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/s).")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
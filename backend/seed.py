@@ -1,7 +1,23 @@
+"""
+Fills the database with the goals and the book catalog from data/curated_books_with_covers.csv.
+
+Usage (from the backend folder):
+    python seed.py                 # wipe goals and books, then load everything
+    python seed.py --incremental   # only write books that are new or changed since the last run
+    python seed.py --incremental --csv big_catalog.csv --chunk-size 20000
+
+The full seed deletes every book, so it fails (or orphans ratings) once users
+have rated books. The incremental mode keeps book ids, ratings and users' goals,
+and only writes the rows whose contents changed (see app/catalog_import.py).
+"""
+import argparse
+import json
+
 import pandas as pd
 from dotenv import load_dotenv
-from app.database import SessionLocal
-from app import models
+from app.database import SessionLocal, engine
+from app import models, migrations
+from app.catalog_import import CATALOG_CHUNK_SIZE, CatalogImporter
 
 load_dotenv()
 
@@ -27,11 +43,14 @@ GOALS = [
 csv_file_path = 'data/curated_books_with_covers.csv'
 
 def seed_data():
+    # The tables cleared below (catalog_import_state included) may not exist yet
+    migrations.migrate(engine)
     session = SessionLocal()
     try:
         print("Clearing old data from tables...")
         # Clear association table first
         session.execute(models.book_goals_table.delete())
+        session.query(models.CatalogImportState).delete()
         session.query(models.Book).delete()
         session.query(models.Goal).delete()
         session.commit()
@@ -73,5 +92,24 @@ def seed_data():
     finally:
         session.close()
 
+def seed_incremental(csv_path, chunk_size):
+    migrations.migrate(engine)
+    importer = CatalogImporter(GOALS, chunk_size=chunk_size)
+    report = importer.run(csv_path, progress_every=100_000)
+    print(f"\nCatalog import complete: {report['new']} new, {report['changed']} changed, "
+          f"{report['unchanged']} unchanged books in {report['seconds']}s.")
+    print(json.dumps(report, indent=2))
+
+
 if __name__ == "__main__":
-    seed_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--incremental', action='store_true', help='update the catalog in place instead of wiping it')
+    parser.add_argument('--csv', default=csv_file_path, help='catalog CSV to load')
+    parser.add_argument('--chunk-size', type=int, default=CATALOG_CHUNK_SIZE, help='CSV rows per transaction (incremental mode)')
+    args = parser.parse_args()
+
+    if args.incremental:
+        seed_incremental(args.csv, args.chunk_size)
+    else:
+        csv_file_path = args.csv
+        seed_data()
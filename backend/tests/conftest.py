@@ -0,0 +1,53 @@
+# tests/conftest.py
+import os
+import tempfile
+
+import pytest
+
+# The app reads its settings when it is first imported, so point it at a throwaway
+# database and the fake AI model before any test module imports it
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TMP_DIR.name, 'tests.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.pop("DATABASE_REPLICA_URLS", None)
+os.environ["AI_MODEL"] = "fake"
+os.environ["COVER_CACHE_DIR"] = os.path.join(TMP_DIR.name, "covers")
+
+
+@pytest.fixture(scope="session")
+def db_engine():
+    """
+    The app's sync engine, with the schema migrated.
+    """
+    from app import migrations
+    from app.database import engine
+
+    migrations.migrate(engine)
+    return engine
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """
+    Sessions on a freshly migrated database of the test's own, for code that
+    takes a session_factory.
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app import migrations
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'own.db'}")
+    migrations.migrate(engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def client(db_engine):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,47 @@
+# tests/test_backfill.py
+import json
+import threading
+
+import pytest
+
+import backfill_summaries
+from app import ai, models
+from app.database import SessionLocal
+from app.summaries import NO_DESCRIPTION
+
+
+@pytest.fixture
+def book_ids(db_engine):
+    db = SessionLocal()
+    try:
+        books = [models.Book(title=f"Book {i}", author="Author", description=NO_DESCRIPTION) for i in range(3)]
+        db.add_all(books)
+        db.commit()
+        ids = [book.id for book in books]
+    finally:
+        db.close()
+    yield ids
+    db = SessionLocal()
+    try:
+        db.query(models.Book).filter(models.Book.id.in_(ids)).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_backfill_gives_up_when_the_api_never_recovers(book_ids, tmp_path, monkeypatch):
+    monkeypatch.setattr(ai, "model", ai.FakeModel(fail=True))
+    monkeypatch.setattr(ai, "breaker", ai.CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    monkeypatch.setattr(backfill_summaries, "BREAKER_POLL_SECONDS", 0.01)
+    checkpoint = tmp_path / "failed.json"
+
+    run = threading.Thread(target=backfill_summaries.backfill, kwargs=dict(
+        concurrency=2, rpm=60000, batch_size=10, retries=3,
+        checkpoint_path=str(checkpoint), retry_failed=False, max_outages=3,
+    ))
+    run.start()
+    run.join(10)
+    assert not run.is_alive(), "backfill kept waiting for the AI service"
+
+    assert ai.breaker.opened >= 3
+    assert sorted(json.loads(checkpoint.read_text())) == sorted(book_ids)
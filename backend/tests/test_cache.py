@@ -0,0 +1,13 @@
+# tests/test_cache.py
+from app.cache import MISSING, TTLCache
+
+
+def test_value_computed_before_an_invalidation_is_not_stored():
+    cache = TTLCache("test_generation", ttl=60)
+    generation = cache.generation
+    cache.invalidate()  # e.g. a rating committed while the value was being computed
+    cache.set("popular", ["stale"], generation=generation)
+    assert cache.get("popular") is MISSING
+
+    cache.set("popular", ["fresh"], generation=cache.generation)
+    assert cache.get("popular") == ["fresh"]
@@ -0,0 +1,61 @@
+# tests/test_catalog_import.py
+import pandas as pd
+
+from app import models
+from app.catalog_import import CatalogImporter
+
+CATALOG = pd.DataFrame({
+    "book_id": [1, 2, 3],
+    "title": ["Dune", "Emma", "Ulysses"],
+    "authors": ["Frank Herbert", "Jane Austen", "James Joyce"],
+    "average_rating": [4.2, 4.0, 3.7],
+    "ratings_count": [100, 50, 20],
+    "goal": ["Explore Fantasy Worlds", "Read Classic 20th-Century Novels", "Read Classic 20th-Century Novels"],
+})
+GOALS = ["Explore Fantasy Worlds", "Read Classic 20th-Century Novels"]
+
+
+def run_import(session_factory, catalog):
+    importer = CatalogImporter(GOALS, session_factory=session_factory)
+    importer.feed_chunk(catalog.copy())
+    return importer.finish()
+
+
+def books(session_factory):
+    db = session_factory()
+    try:
+        return {
+            book.id: (book.title, book.average_rating, book.ratings_count, [goal.name for goal in book.goals])
+            for book in db.query(models.Book)
+        }
+    finally:
+        db.close()
+
+
+def test_reimporting_the_same_catalog_changes_nothing(session_factory):
+    report = run_import(session_factory, CATALOG)
+    assert (report["new"], report["changed"], report["unchanged"]) == (3, 0, 0)
+    before = books(session_factory)
+
+    report = run_import(session_factory, CATALOG)
+    assert (report["new"], report["changed"], report["unchanged"], report["missing"]) == (0, 0, 3, 0)
+    assert books(session_factory) == before
+
+
+def test_changed_row_is_detected_and_updated_in_place(session_factory):
+    run_import(session_factory, CATALOG)
+    before = books(session_factory)
+
+    changed = CATALOG.copy()
+    changed.loc[1, "title"] = "Emma (Penguin Classics)"
+    changed.loc[1, "goal"] = "Explore Fantasy Worlds"
+    report = run_import(session_factory, changed)
+    assert (report["new"], report["changed"], report["unchanged"]) == (0, 1, 2)
+
+    after = books(session_factory)
+    # Same book ids; only the changed book differs
+    assert after.keys() == before.keys()
+    emma_id = next(book_id for book_id, book in before.items() if book[0] == "Emma")
+    assert after[emma_id][0] == "Emma (Penguin Classics)"
+    assert after[emma_id][3] == ["Explore Fantasy Worlds"]
+    assert {k: v for k, v in after.items() if k != emma_id} == {k: v for k, v in before.items() if k != emma_id}
@@ -0,0 +1,153 @@
+# tests/test_covers.py
+import io
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from app import covers, models
+from app.database import SessionLocal
+
+COLORS = {"red": (200, 30, 30), "green": (30, 200, 30), "blue": (30, 30, 200)}
+
+
+def image_bytes(color) -> bytes:
+    # BMP, so every cover is exactly the same size on disk
+    out = io.BytesIO()
+    Image.new("RGB", (600, 900), color).save(out, "BMP")
+    return out.getvalue()
+
+
+class ImageHost:
+    """
+    Serves /<color>.bmp for each of COLORS, and a 500 for anything else.
+    """
+
+    def __init__(self):
+        self.requests = Counter()  # path -> requests received
+        images = {f"/{name}.bmp": image_bytes(color) for name, color in COLORS.items()}
+        host = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                host.requests[self.path] += 1
+                body = images.get(self.path)
+                self.send_response(200 if body else 500)
+                self.send_header("Content-Type", "image/bmp")
+                self.send_header("Content-Length", str(len(body or b"")))
+                self.end_headers()
+                self.wfile.write(body or b"")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, name: str) -> str:
+        return f"{self.base_url}/{name}.bmp"
+
+
+@pytest.fixture
+def host():
+    host = ImageHost()
+    yield host
+    host.server.shutdown()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = covers.CoverStore(root=str(tmp_path / "covers"))
+    monkeypatch.setattr(covers, "cover_store", store)
+    return store
+
+
+def test_resized_variant_is_stored_and_reused(store, host):
+    first = store.get(host.url("red"), "thumb")
+    with Image.open(io.BytesIO(first.content)) as image:
+        assert image.format == "JPEG"
+        assert image.size == covers.COVER_SIZES["thumb"]
+
+    # From disk: no second download or resize, same ETag
+    assert store.get(host.url("red"), "thumb") == first
+    # Another size is resized from the stored original
+    store.get(host.url("red"), "detail")
+    assert host.requests["/red.bmp"] == 1
+    assert (store.fetches, store.resizes, store.hits) == (1, 2, 1)
+
+
+def test_least_recently_used_cover_is_evicted_by_size(tmp_path, host):
+    cover_size = len(image_bytes(COLORS["red"]))
+    store = covers.CoverStore(root=str(tmp_path / "covers"), max_bytes=2 * cover_size)
+
+    red = store.get(host.url("red"), "original")
+    store.get(host.url("green"), "original")
+    store.get(host.url("red"), "original")  # green is now the least recently used
+    store.get(host.url("blue"), "original")
+
+    assert store.evictions == 1
+    assert store.stats()["bytes"] == 2 * cover_size
+    content_hash = red.etag.strip('"').split("-")[0]
+    objects = [name for _, _, files in os.walk(os.path.join(store.root, "objects")) for name in files]
+    assert len(objects) == 2 and any(name.startswith(content_hash) for name in objects)
+
+    # The evicted cover is fetched again, the others still come from disk
+    store.get(host.url("green"), "original")
+    store.get(host.url("blue"), "original")
+    assert host.requests == Counter({"/red.bmp": 1, "/green.bmp": 2, "/blue.bmp": 1})
+
+
+@pytest.fixture
+def book_with_cover(db_engine):
+    created = []
+
+    def make(url: str) -> int:
+        db = SessionLocal()
+        try:
+            book = models.Book(title="Dune", author="Frank Herbert", cover_image_url=url)
+            db.add(book)
+            db.commit()
+            created.append(book.id)
+            return book.id
+        finally:
+            db.close()
+
+    yield make
+    db = SessionLocal()
+    try:
+        db.query(models.Book).filter(models.Book.id.in_(created)).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_cover_endpoint_answers_if_none_match_with_304(client, store, host, book_with_cover):
+    book_id = book_with_cover(host.url("blue"))
+
+    response = client.get(f"/books/{book_id}/cover?size=detail")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    etag = response.headers["etag"]
+
+    response = client.get(f"/books/{book_id}/cover?size=detail", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+    # Another size has its own ETag
+    assert client.get(f"/books/{book_id}/cover?size=thumb", headers={"If-None-Match": etag}).status_code == 200
+    assert host.requests["/blue.bmp"] == 1
+
+
+def test_cover_endpoint_redirects_when_the_image_host_fails(client, store, host, book_with_cover):
+    url = f"{host.base_url}/missing.bmp"
+    book_id = book_with_cover(url)
+
+    response = client.get(f"/books/{book_id}/cover", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == url
+    assert response.headers["cache-control"] == "no-store"
+    assert store.errors == 1
@@ -0,0 +1,145 @@
+# tests/test_fetch_covers.py
+import json
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+import fetch_covers
+from benchmarks.cover_fetch_bench import write_books
+
+BOOKS = 20
+# Every lookup is answered with these first, then with a cover
+FLAKY_STATUSES = (429, 503)
+# ... except this book's, which always fails
+BROKEN_ISBN = "0000000005"
+
+
+class StubApi:
+    """
+    A local stand-in for the Google Books API that fails every query's first
+    requests with FLAKY_STATUSES and never answers for BROKEN_ISBN.
+    """
+
+    def __init__(self):
+        self.requests = Counter()  # query -> requests received
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)["q"][0]
+                with stub.lock:
+                    stub.requests[query] += 1
+                    attempt = stub.requests[query]
+                if query.endswith(BROKEN_ISBN):
+                    self.reply(500)
+                elif attempt <= len(FLAKY_STATUSES):
+                    self.reply(FLAKY_STATUSES[attempt - 1], headers={"Retry-After": "0"})
+                else:
+                    self.reply(200, {"items": [{"volumeInfo": {"imageLinks": {"thumbnail": f"http://covers.test/{query}"}}}]})
+
+            def reply(self, status, payload=None, headers=None):
+                body = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/books/v1/volumes"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(fetch_covers, "BACKOFF_SECONDS", 0.001)
+    monkeypatch.setattr(fetch_covers, "MAX_ATTEMPTS", 4)
+    stub = StubApi()
+    yield stub
+    stub.server.shutdown()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    input_path = tmp_path / "books.csv"
+    write_books(str(input_path), BOOKS)
+    return str(input_path), str(tmp_path / "books_with_covers.csv"), str(tmp_path / "cover_cache.jsonl")
+
+
+def fetch(stub, paths):
+    input_path, output_path, cache_path = paths
+    return fetch_covers.fetch_cover_images(input_path, output_path, cache_path, stub.url, workers=4, rate=1000, chunk_size=8)
+
+
+def expected_covers(output_path):
+    output = pd.read_csv(output_path, dtype={"isbn": str})
+    expected = [
+        fetch_covers.PLACEHOLDER_URL if isbn == BROKEN_ISBN else f"http://covers.test/isbn:{isbn}"
+        for isbn in output["isbn"]
+    ]
+    return len(output) == BOOKS and list(output["image_url"]) == expected
+
+
+def test_lookups_are_retried_on_429_and_5xx(stub, paths):
+    stats = fetch(stub, paths)
+
+    assert (stats["fetched"], stats["found"], stats["failed"]) == (BOOKS, BOOKS - 1, 1)
+    assert stub.requests[f"isbn:{BROKEN_ISBN}"] == fetch_covers.MAX_ATTEMPTS
+    assert all(count == len(FLAKY_STATUSES) + 1 for query, count in stub.requests.items() if not query.endswith(BROKEN_ISBN))
+    assert expected_covers(paths[1])
+
+
+def test_rerun_resumes_from_the_checkpoint(stub, paths):
+    fetch(stub, paths)
+    # A rerun only asks again for the lookup that failed
+    stats = fetch(stub, paths)
+    assert (stats["fetched"], stats["cached"]) == (1, BOOKS - 1)
+
+    # As if the first run had been killed: half the checkpoint, the last line cut short
+    cache_path = paths[2]
+    with open(cache_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    kept = lines[:len(lines) // 2]
+    with open(cache_path, "w", encoding="utf-8") as f:
+        f.writelines(kept + [lines[len(kept)][:10]])
+
+    stats = fetch(stub, paths)
+    assert stats["cached"] == len(kept)
+    assert stats["fetched"] == BOOKS - len(kept)
+    assert expected_covers(paths[1])
+
+
+def test_output_is_only_replaced_by_a_finished_run(stub, paths, monkeypatch):
+    input_path, output_path, _ = paths
+    fetch(stub, paths)
+    assert expected_covers(output_path)
+    assert not os.path.exists(output_path + ".part")
+    with open(output_path, encoding="utf-8") as f:
+        finished = f.read()
+
+    # A run that dies part-way (after its first chunk) leaves the last output alone
+    real_fetch_cover = fetch_covers.fetch_cover
+
+    def fetch_cover(session, bucket, api_url, query):
+        if query.endswith("0000000012"):
+            raise RuntimeError("killed")
+        return real_fetch_cover(session, bucket, api_url, query)
+
+    monkeypatch.setattr(fetch_covers, "fetch_cover", fetch_cover)
+    with pytest.raises(RuntimeError):
+        fetch_covers.fetch_cover_images(input_path, output_path, str(paths[2]) + ".other", stub.url,
+                                        workers=4, rate=1000, chunk_size=8)
+    with open(output_path, encoding="utf-8") as f:
+        assert f.read() == finished
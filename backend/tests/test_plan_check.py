@@ -0,0 +1,64 @@
+# tests/test_plan_check.py
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app import migrations
+from benchmarks import datagen, plan_check
+
+
+@pytest.fixture
+def catalog_url(tmp_path):
+    """
+    A small synthetic catalog with the schema the migrations make.
+    """
+    url = f"sqlite:///{tmp_path / 'plans.db'}"
+    engine = create_engine(url)
+    migrations.migrate(engine)
+    engine.dispose()
+    datagen.generate(url, books=2000, users=200, ratings=8000, seed=42)
+    return url
+
+
+def test_scans_through_an_index_count_as_full_scans():
+    plan = "\n".join([
+        "CO-ROUTINE (subquery-3)",
+        "  SCAN book_goals USING COVERING INDEX ix_book_goals_goal_id",
+        "  SEARCH books USING INTEGER PRIMARY KEY (rowid=?)",
+        "SCAN (subquery-3)",
+        "SCAN goals",
+        "SCAN ratings USING INDEX ix_ratings_user_id",
+    ])
+    assert plan_check.full_scans("sqlite", plan) == ["book_goals", "ratings"]
+
+
+def test_every_crud_statement_uses_an_index(catalog_url):
+    assert plan_check.check(catalog_url) == []
+
+
+def test_the_popular_books_ranking_is_the_only_expected_full_scan(catalog_url, monkeypatch):
+    monkeypatch.setattr(plan_check, "ALLOWED_FULL_SCANS", {})
+    problems = plan_check.check(catalog_url)
+    assert [problem.split(" in: ")[0] for problem in problems] == ["get_popular_books (uncached): full scan of book_goals"]
+
+
+def test_a_missing_index_is_reported(catalog_url):
+    engine = create_engine(catalog_url)
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_users_email"))
+    engine.dispose()
+
+    problems = plan_check.check(catalog_url)
+    assert any(problem.startswith("get_user_by_email: full scan of users") for problem in problems)
+
+
+def test_migrations_drop_the_unused_rating_order_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    migrations.migrate(engine)
+    # As on a database that applied migration 2 while it still created the index
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX ix_books_rating_order ON books (average_rating DESC, ratings_count DESC)"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = 3"))
+
+    assert migrations.migrate(engine) == [3]
+    assert "ix_books_rating_order" not in {index["name"] for index in inspect(engine).get_indexes("books")}
+    engine.dispose()
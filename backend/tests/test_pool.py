@@ -0,0 +1,38 @@
+# tests/test_pool.py
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app import pool
+
+
+def make_engine(url, **overrides):
+    return create_engine(url, **{**pool.engine_options(url), **overrides})
+
+
+def test_pool_counts_checkouts_connects_and_timeouts(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=0, pool_timeout=0.1)
+    held = engine.connect()
+    held.execute(text("select 1"))
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    held.close()
+    for _ in range(3):
+        with engine.connect() as conn:
+            conn.execute(text("select 1"))
+    # A fresh pool keeps the counts and opens its own connection
+    engine.dispose()
+    with engine.connect() as conn:
+        conn.execute(text("select 1"))
+
+    stats = pool.pool_stats(engine)
+    assert stats["timeouts"] == 1
+    assert stats["checkouts"] == 5
+    assert stats["connects"] == 2
+    assert stats["connect_errors"] == 0
+
+
+def test_pool_counts_failed_connects(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'missing' / 'pool.db'}")
+    with pytest.raises(exc.OperationalError):
+        engine.connect()
+    assert pool.pool_stats(engine)["connect_errors"] == 1
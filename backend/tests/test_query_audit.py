@@ -0,0 +1,28 @@
+# tests/test_query_audit.py
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_every_request_stays_within_its_query_budget():
+    # In a subprocess: the audit points DATABASE_URL at its own database before
+    # importing the app, which only works if nothing imported the app first
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.query_audit"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=600,
+    )
+    assert result.returncode == 0, result.stdout[-3000:] + result.stderr[-3000:]
+
+    lines = result.stdout.splitlines()
+    table = lines[lines.index(next(line for line in lines if line.startswith("request"))) + 1:]
+    # A summary worker's print can land on the same line as a row, so match rows anywhere in a line
+    rows = [match.group().split() for line in table if (match := re.search(r"\b(GET|PUT|POST|DELETE) /.*", line))]
+    assert len(rows) == 12
+    for row in rows:
+        status, queries = row[-3], row[-2]
+        assert status == "200", row
+        assert int(queries) >= 1, row
+    assert "OK: every request stayed within its query budget" in result.stdout
@@ -0,0 +1,25 @@
+# tests/test_rating_concurrency.py
+import pytest
+from sqlalchemy import create_engine
+
+from benchmarks import rating_bench
+
+THREADS = 4
+RATINGS = 200
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ratings.db'}", pool_size=THREADS, connect_args={"timeout": 30})
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("mode", ["atomic", "write-behind"])
+def test_concurrent_ratings_keep_aggregates_exact(engine, mode):
+    book_id, user_ids = rating_bench.setup(engine, RATINGS)
+    rating_bench.run(engine, book_id, user_ids, THREADS, mode)
+
+    stored, expected = rating_bench.aggregates(engine, book_id)
+    assert expected[0] == RATINGS
+    assert rating_bench.is_exact(stored, expected), f"stored {stored}, expected {expected}"
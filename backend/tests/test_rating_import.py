@@ -0,0 +1,62 @@
+# tests/test_rating_import.py
+import pytest
+
+from app import models
+from app.rating_import import RatingImporter
+
+
+@pytest.fixture
+def book_id(session_factory):
+    db = session_factory()
+    try:
+        db.add_all([models.User(id=user_id, email=f"user{user_id}@example.com", hashed_password="x") for user_id in (1, 2)])
+        book = models.Book(title="Dune", author="Frank Herbert", average_rating=4.0, ratings_count=10)
+        db.add(book)
+        db.commit()
+        return book.id
+    finally:
+        db.close()
+
+
+def run_import(session_factory, lines):
+    importer = RatingImporter("ndjson", batch_size=2, session_factory=session_factory)
+    importer.feed_lines(lines)
+    return importer.finish()
+
+
+def aggregates(session_factory, book_id):
+    db = session_factory()
+    try:
+        book = db.get(models.Book, book_id)
+        return round(book.average_rating, 6), book.ratings_count
+    finally:
+        db.close()
+
+
+def test_reimporting_the_same_ratings_changes_nothing(session_factory, book_id):
+    lines = [f'{{"user_id": 1, "book_id": {book_id}, "rating": 5}}', f'{{"user_id": 2, "book_id": {book_id}, "rating": 2}}']
+    report = run_import(session_factory, lines)
+    assert (report["inserted"], report["updated"]) == (2, 0)
+    after_first = aggregates(session_factory, book_id)
+    assert after_first == (round((4.0 * 10 + 5 + 2) / 12, 6), 12)
+
+    report = run_import(session_factory, lines)
+    assert (report["inserted"], report["updated"]) == (0, 2)
+    assert aggregates(session_factory, book_id) == after_first
+
+
+def test_replaced_rating_adjusts_the_aggregates_once(session_factory, book_id):
+    run_import(session_factory, [f'{{"user_id": 1, "book_id": {book_id}, "rating": 2}}'])
+    # Replaced in a later import, and twice within one batch (the last one wins)
+    report = run_import(session_factory, [
+        f'{{"user_id": 1, "book_id": {book_id}, "rating": 3}}',
+        f'{{"user_id": 1, "book_id": {book_id}, "rating": 5}}',
+    ])
+    assert (report["inserted"], report["updated"], report["superseded"]) == (0, 1, 1)
+
+    db = session_factory()
+    try:
+        assert db.query(models.Rating).filter_by(book_id=book_id, user_id=1).one().rating == 5
+    finally:
+        db.close()
+    assert aggregates(session_factory, book_id) == (round((4.0 * 10 + 5) / 11, 6), 11)
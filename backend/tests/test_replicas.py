@@ -0,0 +1,54 @@
+# tests/test_replicas.py
+import asyncio
+
+import pytest
+from sqlalchemy import exc, text
+
+from app import replicas
+
+
+async def read(replica_set, sql):
+    """
+    Runs one query on the session get_read_db hands out, like a read endpoint would.
+    Returns the URL the session was bound to.
+    """
+    sessions = replicas.get_read_db(token=None)
+    db = await sessions.__anext__()
+    try:
+        await db.execute(text(sql))
+    except Exception as e:
+        # FastAPI raises an endpoint's error inside its dependencies
+        await sessions.athrow(e)
+    url = str(db.bind.url)
+    await sessions.aclose()
+    return url
+
+
+@pytest.fixture
+def replica_set(tmp_path, monkeypatch, db_engine):
+    replica_set = replicas.ReplicaSet([
+        f"sqlite:///{tmp_path / 'replica.db'}",
+        f"sqlite:///{tmp_path / 'missing' / 'replica.db'}",
+    ])
+    monkeypatch.setattr(replicas, "replica_set", replica_set)
+    yield replica_set
+    asyncio.run(replica_set.dispose())
+
+
+def test_unreachable_replica_is_skipped_and_a_failing_query_is_not(replica_set):
+    reachable, unreachable = replica_set.replicas
+
+    async def requests():
+        urls = [await read(replica_set, "SELECT 1") for _ in range(2)]
+        with pytest.raises(exc.OperationalError):
+            await read(replica_set, "SELECT * FROM no_such_table")
+        return urls
+
+    urls = asyncio.run(requests())
+
+    # The request that picked the unreachable replica was served by the primary
+    assert "missing" not in "".join(urls)
+    assert replica_set.primary_fallbacks == 1
+    assert not unreachable.healthy and unreachable.failures == 1
+    # An error in the query itself leaves the replica in rotation
+    assert reachable.healthy and reachable.failures == 0
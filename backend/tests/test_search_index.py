@@ -0,0 +1,52 @@
+# tests/test_search_index.py
+import threading
+
+import pytest
+
+from app import search
+
+BOOKS = [(book_id, f"Harry book {book_id}", "Author", book_id) for book_id in range(1, 2001)]
+
+
+class SlowQuery:
+    """
+    Stands in for the session in ensure_built(): sets `started` when the query runs
+    and only returns once `release` is set.
+    """
+
+    def __init__(self, started: threading.Event, release: threading.Event):
+        self.started = started
+        self.release = release
+
+    def query(self, *columns):
+        return self
+
+    def all(self):
+        self.started.set()
+        self.release.wait(5)
+        return BOOKS
+
+
+@pytest.mark.parametrize("index_class", [search.SearchIndex, search.SuggestIndex])
+def test_rebuild_keeps_serving_and_keeps_changes_made_meanwhile(index_class):
+    index = index_class()
+    index.build(BOOKS[:10])
+    started, release = threading.Event(), threading.Event()
+    rebuild = threading.Thread(target=index.ensure_built, args=(SlowQuery(started, release),))
+    index.built_at = None  # stale, so ensure_built rebuilds
+    rebuild.start()
+    assert started.wait(5)
+
+    # The old index answers, and takes changes, while the rebuild is running
+    index.upsert(9999, "Harry newest", "Author", 10**6)
+    index.remove(3)
+    assert len(index) == 10
+    release.set()
+    rebuild.join()
+
+    assert len(index) == len(BOOKS)  # 2000 + the new book - book 3
+    if index_class is search.SearchIndex:
+        assert index.search("harry", limit=1) == [9999]
+        assert index.search("book 3", limit=50).count(3) == 0
+    else:
+        assert index.suggest("harry", limit=1)[0][0] == 9999
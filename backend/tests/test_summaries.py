@@ -0,0 +1,147 @@
+# tests/test_summaries.py
+import json
+import threading
+import time
+
+import pytest
+
+from app import ai, models, summaries
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """
+    A fresh fake model and circuit breaker, so counts start at zero in every test.
+    """
+    model = ai.FakeModel()
+    monkeypatch.setattr(ai, "model", model)
+    monkeypatch.setattr(ai, "breaker", ai.CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+    summaries.failed_summaries.invalidate()
+    return model
+
+
+@pytest.fixture
+def book_id(db_engine):
+    """
+    A book that still needs its AI summary.
+    """
+    db = SessionLocal()
+    try:
+        book = models.Book(title="Dune", author="Frank Herbert", description=summaries.NO_DESCRIPTION)
+        db.add(book)
+        db.commit()
+        book_id = book.id
+    finally:
+        db.close()
+    yield book_id
+    db = SessionLocal()
+    try:
+        db.query(models.Book).filter(models.Book.id == book_id).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def stored_description(book_id: int) -> str:
+    db = SessionLocal()
+    try:
+        return db.get(models.Book, book_id).description
+    finally:
+        db.close()
+
+
+def test_concurrent_requests_share_one_generation(fake_model, book_id):
+    fake_model.delay = 0.3
+    results = []
+
+    def request():
+        future = summaries.schedule_summary(book_id=book_id, title="Dune", author="Frank Herbert")
+        results.append(summaries.wait_for_summary(future, timeout=5))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fake_model.calls == 1
+    assert len(results) == 8 and len(set(results)) == 1
+    assert results[0].startswith("Fake summary")
+    assert stored_description(book_id) == results[0]
+
+
+def test_book_page_does_not_wait_with_a_zero_wait(client, fake_model, book_id, monkeypatch):
+    monkeypatch.setattr(summaries, "SUMMARY_WAIT_SECONDS", 0)
+    fake_model.delay = 0.3
+
+    body = client.get(f"/books/{book_id}").json()
+    assert body["summary_pending"] is True
+    assert body["description"] == summaries.SUMMARY_PENDING
+    # The placeholder is never saved
+    assert stored_description(book_id) == summaries.NO_DESCRIPTION
+
+    summaries.summary_flights.get(book_id).result(timeout=5)
+    body = client.get(f"/books/{book_id}").json()
+    assert body["summary_pending"] is False
+    assert body["description"].startswith("Fake summary")
+    assert fake_model.calls == 1
+
+
+def test_breaker_opens_and_lets_one_probe_through_after_the_reset_timeout(fake_model):
+    fake_model.fail = True
+    assert ai.generate_book_summary("Dune", "Frank Herbert") == ai.GENERATION_FAILED
+    assert ai.generate_book_summary("Dune", "Frank Herbert") == ai.GENERATION_FAILED
+    assert ai.breaker.state == ai.CircuitBreaker.OPEN
+
+    # Open: refused without calling the model
+    assert ai.generate_book_summary("Dune", "Frank Herbert") == ai.BREAKER_OPEN
+    assert fake_model.calls == 2
+    assert not summaries.can_generate(1)
+
+    time.sleep(0.25)
+    assert ai.breaker.state == ai.CircuitBreaker.HALF_OPEN
+    # A failed probe opens it again
+    assert ai.generate_book_summary("Dune", "Frank Herbert") == ai.GENERATION_FAILED
+    assert ai.breaker.state == ai.CircuitBreaker.OPEN
+
+    time.sleep(0.25)
+    assert ai.breaker.allow_request()
+    # Only one probe at a time
+    assert not ai.breaker.allow_request()
+    ai.breaker.cancel_request()
+
+    fake_model.fail = False
+    assert ai.generate_book_summary("Dune", "Frank Herbert").startswith("Fake summary")
+    assert ai.breaker.state == ai.CircuitBreaker.CLOSED
+    assert fake_model.calls == 4
+
+
+def read_events(text: str) -> list[tuple[str | None, dict]]:
+    events = []
+    for block in text.strip().split("\n\n"):
+        event = None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+def test_stream_ends_with_the_saved_description(client, fake_model, book_id):
+    response = client.get(f"/books/{book_id}/summary/stream")
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = read_events(response.text)
+
+    pieces = [data["text"] for event, data in events if event is None]
+    assert len(pieces) > 1
+    event, done = events[-1]
+    assert event == "done"
+    assert done["description"] == ai.clean_summary("".join(pieces))
+    assert stored_description(book_id) == done["description"]
+
+    # Once saved, the description is sent as is without calling the model again
+    events = read_events(client.get(f"/books/{book_id}/summary/stream").text)
+    assert events == [(None, {"text": done["description"]}), ("done", {"description": done["description"]})]
+    assert fake_model.calls == 1
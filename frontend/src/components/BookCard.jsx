@@ -1,7 +1,7 @@
 import React, { useState } from 'react';
 import BookDetailModal from './BookDetailModal'; 
 import placeholderImg from '../assets/placeholder_img.jpg'; 
-import { booksAPI } from '../services/api';
+import { booksAPI, coverUrl } from '../services/api';
 import { toast } from 'react-toastify';
 
 const StarIcon = () => ( <svg className="w-4 h-4 text-golden mr-1" fill="currentColor" viewBox="0 0 20 20"><path d="M9.049 2.927c.3-.921 1.603-.921 1.902 0l1.286 3.955a1 1 0 00.95.69h4.162c.969 0 1.371 1.24.588 1.81l-3.366 2.446a1 1 0 00-.364 1.118l1.287 3.955c.3.921-.755 1.688-1.54 1.118l-3.366-2.446a1 1 0 00-1.175 0l-3.366 2.446c-.784.57-1.838-.197-1.54-1.118l1.287-3.955a1 1 0 00-.364-1.118L2.08 9.382c-.783-.57-.38-1.81.588-1.81h4.162a1 1 0 00.95-.69L9.049 2.927z" /></svg> );
@@ -58,7 +58,7 @@ const handleReadMore = async () => {
 
     const imageUrl = 
     book.cover_image_url && book.cover_image_url !== placeholderSeededUrl
-        ? book.cover_image_url
+        ? coverUrl(book.id, 'thumb')
         : placeholderImg;
     const tagline = book.description && book.description !== "No description available."
         ? `"${book.description.substring(0, 40)}..."` 
@@ -1,6 +1,6 @@
 import React, { useState } from 'react';
 import { toast } from 'react-toastify'; // CORRECTED: Using react-toastify to match your project
-import { booksAPI } from '../services/api';
+import { booksAPI, coverUrl } from '../services/api';
 import placeholderImg from '../assets/placeholder_img.jpg';
 
 // --- Helper Icons remain the same ---
@@ -105,7 +105,7 @@ const BookDetailModal = ({ book, isLoading, onClose ,user,onBookUpdate }) => {
         const placeholderSeededUrl = "https://placehold.co/200x300?text=Not+Found";
         const imageUrl = 
             book.cover_image_url && book.cover_image_url !== placeholderSeededUrl
-                ? book.cover_image_url
+                ? coverUrl(book.id, 'detail')
                 : placeholderImg;
                 
         return (
@@ -212,4 +212,7 @@ export const booksAPI = {
   },
 };
 
+// Covers are served through the backend's cover cache, resized for where they're shown
+export const coverUrl = (bookId, size = 'thumb') => `${API_BASE_URL}/books/${bookId}/cover?size=${size}`;
+
 export default api;
\ No newline at end of file